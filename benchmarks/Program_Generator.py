@@ -0,0 +1,168 @@
+'''
+Seeded generator of synthetic Jovial programs for the throughput benchmark.
+
+Generates valid programs of a given total number of lines and instruction mix. Every program fits in the 203 bytes of
+HP-16C memory, so a large workload is a stream of many programs (the same format as stream mode, with a
+'#program <name>' line before each program). The same seed always gives the same programs.
+
+Mixes:
+    mixed        Mostly instructions, with some literals, base switches, floats, and comments
+    literals     Mostly integer and float literals, many of them multi-digit or negative
+    base-switch  Mostly base prefixed literals and base changes, so nearly every literal switches the base
+
+Usage:
+    python benchmarks/Program_Generator.py --lines 10000 --mix literals --seed 1 > stream.jov
+    python src/Jovial_Assembler.py -i stream.jov -o out.16c
+'''
+
+import argparse
+import random
+import sys
+
+# Initial settings the programs are generated for (2's complement, 16-bit words, decimal)
+SIGN_MODE = 2
+WORD_SIZE = 16
+BASE = 10
+
+# Programs end before they reach this many bytes, which leaves room for the registers they use
+PROGRAM_BYTES = 150
+
+# Relative weight of each kind of line in each mix
+MIXES = {
+    'mixed': {'instruction': 10, 'argument': 4, 'integer': 3, 'prefixed': 1, 'base': 1, 'float': 1, 'comment': 2},
+    'literals': {'instruction': 2, 'argument': 1, 'integer': 8, 'prefixed': 2, 'base': 0, 'float': 3, 'comment': 1},
+    'base-switch': {'instruction': 2, 'argument': 1, 'integer': 2, 'prefixed': 8, 'base': 4, 'float': 0, 'comment': 1},
+}
+
+INSTRUCTIONS = ['+', '-', '*', '/', 'enter', 'chs', 'x<>y', 'rv', 'r^', 'lstx', 'clx', 'and', 'or', 'xor', 'not', 'sl', 'sr',
+    'asr', 'rl', 'rr', 'rlc', 'rrc', 'rmd', 'abs', '#b', 'lj', 'maskl', 'maskr', 'sb', 'cb', 'b?', 'x=y', 'x=0', 'x>y', 'x<0',
+    'x!=0', 'dsz', 'isz', 'rtn', 'dbl*', 'dbl/', 'x<>i', 'pse']
+
+# Instructions with an argument, and the arguments that are valid for them in every generated program
+ARGUMENTS = {
+    'sto': [str(register) for register in range(8)] + ['i', '(i)'],
+    'rcl': [str(register) for register in range(8)] + ['i', '(i)'],
+    'lbl': [str(label) for label in range(10)] + list('abcdef'),
+    'gto': [str(label) for label in range(10)] + list('abcdef') + ['i'],
+    'gsb': [str(label) for label in range(10)] + list('abcdef') + ['i'],
+    'sf': [str(flag) for flag in range(6)],
+    'cf': [str(flag) for flag in range(6)],
+    'f?': [str(flag) for flag in range(6)],
+}
+
+BASE_MNEMONICS = {2: 'bin', 8: 'oct', 10: 'dec', 16: 'hex'}
+BASE_PREFIXES = {2: '0b', 8: '0o', 10: '0d', 16: '0x'}
+DIGITS = '0123456789abcdef'
+
+COMMENTS = ['// setup', '; loop body', '// check the result', '; keep x']
+
+
+class ProgramGenerator:
+    def __init__(self, seed, mix):
+        self.random = random.Random(seed)
+        self.kinds = list(MIXES[mix])
+        self.weights = [MIXES[mix][kind] for kind in self.kinds]
+
+    def program(self, lines):
+        # Returns up to the given number of lines, stopping early when the program would not fit in memory
+        self.current_base = BASE
+        self.float_mode = False
+        program_lines = []
+        program_bytes = 0
+        while len(program_lines) < lines:
+            kind = self.random.choices(self.kinds, self.weights)[0]
+            line, steps, base, float_mode = getattr(self, f'{kind}_line')()
+            if program_bytes + steps > PROGRAM_BYTES:
+                break
+            program_lines.append(line)
+            program_bytes += steps
+            self.current_base, self.float_mode = base, float_mode
+        return program_lines
+
+    def digits(self, base):
+        # A number with a random bit length, so short numbers are as common as long ones
+        # (at most 12 bits, so a leading digit can be added without leaving the word size)
+        value = self.random.getrandbits(self.random.randint(1, 12))
+        text = ''
+        while True:
+            text = DIGITS[value % base] + text
+            value //= base
+            if value == 0:
+                return text
+
+    def instruction_line(self):
+        line = self.random.choice(INSTRUCTIONS)
+        if self.random.random() < 0.1:
+            line += f' {self.random.choice(COMMENTS)}'
+        return line, 1, self.current_base, self.float_mode
+
+    def argument_line(self):
+        instruction = self.random.choice(list(ARGUMENTS))
+        return f'{instruction} {self.random.choice(ARGUMENTS[instruction])}', 1, self.current_base, self.float_mode
+
+    def integer_line(self):
+        # An integer in the current base (entered as a float in floating point mode, so only decimal digits are used there)
+        negative = self.random.random() < 0.2
+        text = self.digits(10 if self.float_mode else self.current_base)
+        if not text[0].isdigit():
+            text = '1' + text # Numbers starting with a letter would read as an instruction (e.g. 'cb')
+        return f"{'-' if negative else ''}{text}", len(text) + negative, self.current_base, self.float_mode
+
+    def prefixed_line(self):
+        # An integer with a base prefix, which switches the calculator to that base (and out of floating point mode)
+        base = self.random.choice(list(BASE_PREFIXES))
+        negative = self.random.random() < 0.2
+        text = self.digits(base)
+        switch = 1 if base != self.current_base or self.float_mode else 0
+        return f"{'-' if negative else ''}{BASE_PREFIXES[base]}{text}", len(text) + negative + switch, base, False
+
+    def base_line(self):
+        base = self.random.choice([base for base in BASE_MNEMONICS if base != self.current_base])
+        return BASE_MNEMONICS[base], 1, base, self.float_mode
+
+    def float_line(self):
+        # A float, in scientific notation one time in four
+        negative = self.random.random() < 0.2
+        text = f'{self.random.randint(0, 999)}.{self.random.randint(0, 999)}'
+        if self.random.random() < 0.25:
+            text = f'{self.random.randint(1, 9)}.{self.random.randint(0, 99)}e{self.random.choice(["", "-"])}{self.random.randint(1, 20)}'
+        switch = 0 if self.float_mode else 2
+        return f"{'-' if negative else ''}{text}", len(text) + negative + switch, self.current_base, True
+
+    def comment_line(self):
+        return self.random.choice(COMMENTS + ['']), 0, self.current_base, self.float_mode
+
+
+def generate_programs(lines, mix='mixed', seed=0):
+    # Returns a list of programs (each a list of source lines) with the given number of lines in total
+    generator = ProgramGenerator(seed, mix)
+    programs = []
+    remaining = lines
+    while remaining > 0:
+        program = generator.program(remaining)
+        programs.append(program)
+        remaining -= len(program)
+    return programs
+
+
+def stream_lines(programs):
+    # The programs as one stream, with a '#program <name>' line before each program
+    for program_number, program in enumerate(programs):
+        yield f'#program p{program_number}'
+        yield from program
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a stream of synthetic Jovial programs')
+    parser.add_argument('-n', '--lines', type=int, default=1000, help='Number of source lines in total (default = 1000)')
+    parser.add_argument('-m', '--mix', choices=list(MIXES), default='mixed', help='Instruction mix (default = mixed)')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='Random seed (default = 0)')
+    args = parser.parse_args()
+
+    for line in stream_lines(generate_programs(args.lines, args.mix, args.seed)):
+        print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
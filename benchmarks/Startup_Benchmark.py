@@ -0,0 +1,130 @@
+'''
+Startup benchmark for the Jovial Assembler.
+
+Measures how long it takes to import the assembler and to assemble a small program into a .16c file from a cold
+start, compared to starting a bare Python interpreter. It also checks that the .16c path does not import any of the
+heavy modules that are only needed for PDFs, batch mode, or server mode.
+
+Usage:
+    python benchmarks/Startup_Benchmark.py            # Compare against the stored baseline
+    python benchmarks/Startup_Benchmark.py --update   # Store the current measurements as the new baseline
+
+The baseline is stored in benchmarks/startup_baseline.json. Timings depend on the machine, so update the baseline
+when moving to a new machine. The benchmark exits with an error if a measurement regresses past the tolerance.
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+SRC_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, '..', 'src')
+BASELINE_FILE = os.path.join(BENCHMARK_DIRECTORY, 'startup_baseline.json')
+SAMPLE_PROGRAM = os.path.join(BENCHMARK_DIRECTORY, '..', 'tests', 'Jovial Assembler (.jov)', 'factorial.jov')
+
+# Modules that must not be imported when assembling a .16c file
+HEAVY_MODULES = ['reportlab', 'PIL', 'multiprocessing', 'concurrent', 'socketserver']
+
+# Measure with cached bytecode, as installed copies and the PyInstaller executable always load precompiled modules
+BENCHMARK_ENVIRONMENT = {key: value for key, value in os.environ.items() if key != 'PYTHONDONTWRITEBYTECODE'}
+
+# A measurement regresses if it is slower than baseline * TOLERANCE + SLACK_MS
+TOLERANCE = 1.5
+SLACK_MS = 5
+
+
+def parse_import_times(stderr):
+    # Returns {module: cumulative import time in ms} from the output of python -X importtime
+    import_times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        import_times[module.strip()] = int(cumulative) / 1000
+    return import_times
+
+
+def time_command(command, runs):
+    # Returns the fastest wall time in ms over the runs (the fastest run has the least noise from the rest of the system)
+    fastest = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=SRC_DIRECTORY, env=BENCHMARK_ENVIRONMENT, check=True, capture_output=True)
+        elapsed = (time.perf_counter() - start) * 1000
+        fastest = elapsed if fastest is None else min(fastest, elapsed)
+    return fastest
+
+
+def measure(runs):
+    measurements = {}
+    with tempfile.TemporaryDirectory() as output_directory:
+        assemble_16c = ['-i', os.path.abspath(SAMPLE_PROGRAM), '-o', os.path.join(output_directory, 'factorial.16c'), '-d', 'WARNING']
+
+        # Warm up run, which writes the bytecode cache
+        subprocess.run([sys.executable, 'Jovial_Assembler.py'] + assemble_16c, cwd=SRC_DIRECTORY, env=BENCHMARK_ENVIRONMENT, check=True, capture_output=True)
+
+        # Import time of the assembler itself
+        import_time = None
+        for _ in range(runs):
+            result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import Jovial_Assembler'], cwd=SRC_DIRECTORY, env=BENCHMARK_ENVIRONMENT, check=True, capture_output=True, text=True)
+            run_time = parse_import_times(result.stderr)['Jovial_Assembler']
+            import_time = run_time if import_time is None else min(import_time, run_time)
+        measurements['import_ms'] = round(import_time, 2)
+
+        # Every module imported while assembling a .16c file
+        result = subprocess.run([sys.executable, '-X', 'importtime', 'Jovial_Assembler.py'] + assemble_16c, cwd=SRC_DIRECTORY, env=BENCHMARK_ENVIRONMENT, check=True, capture_output=True, text=True)
+        imported_modules = parse_import_times(result.stderr)
+        measurements['heavy_modules'] = sorted(module for module in imported_modules if module.split('.')[0] in HEAVY_MODULES)
+
+        # Cold start of a .16c assembly compared to a bare interpreter
+        interpreter_time = time_command([sys.executable, '-c', 'pass'], runs)
+        assembler_time = time_command([sys.executable, 'Jovial_Assembler.py'] + assemble_16c, runs)
+        measurements['interpreter_ms'] = round(interpreter_time, 2)
+        measurements['assemble_16c_ms'] = round(assembler_time, 2)
+        measurements['overhead_ms'] = round(assembler_time - interpreter_time, 2)
+
+    return measurements
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the startup time of the Jovial Assembler')
+    parser.add_argument('-r', '--runs', type=int, default=10, help='Number of runs for each measurement (default = 10)')
+    parser.add_argument('--update', action='store_true', help='Store the measurements as the new baseline')
+    args = parser.parse_args()
+
+    measurements = measure(args.runs)
+    print(f"Import time:            {measurements['import_ms']:8.2f} ms")
+    print(f"Interpreter start:      {measurements['interpreter_ms']:8.2f} ms")
+    print(f"Assemble .16c (cold):   {measurements['assemble_16c_ms']:8.2f} ms")
+    print(f"Assembler overhead:     {measurements['overhead_ms']:8.2f} ms ({measurements['overhead_ms'] / measurements['assemble_16c_ms']:.0%} of the cold start)")
+
+    failed = False
+    if measurements['heavy_modules']:
+        print(f"FAIL: The .16c path imports heavy modules: {', '.join(measurements['heavy_modules'])}")
+        failed = True
+
+    if args.update:
+        with open(BASELINE_FILE, 'w') as baseline_file:
+            json.dump(measurements, baseline_file, indent=4)
+            baseline_file.write('\n')
+        print(f"Baseline updated: {BASELINE_FILE}")
+    elif os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as baseline_file:
+            baseline = json.load(baseline_file)
+        for key in ['import_ms', 'overhead_ms']:
+            limit = baseline[key] * TOLERANCE + SLACK_MS
+            if measurements[key] > limit:
+                print(f"FAIL: {key} regressed to {measurements[key]:.2f} ms (baseline {baseline[key]:.2f} ms, limit {limit:.2f} ms)")
+                failed = True
+    else:
+        print("No baseline found. Run with --update to store one.")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
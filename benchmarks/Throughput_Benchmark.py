@@ -0,0 +1,186 @@
+'''
+Throughput benchmark for the Jovial Assembler.
+
+Measures how fast the assembler parses and encodes programs (parse_line -> instr), and how long each target takes to
+render, in process. The workloads are the sample programs in the tests folder and three synthetic streams from
+Program_Generator.py (mixed, literals, and base-switch), generated from a fixed seed so every run assembles the same code.
+For each workload it reports lines per second and the peak memory used while assembling it.
+
+Usage:
+    python benchmarks/Throughput_Benchmark.py                # Compare against the stored baseline
+    python benchmarks/Throughput_Benchmark.py --update       # Store the current measurements as the new baseline
+    python benchmarks/Throughput_Benchmark.py --lines 50000  # Larger synthetic workloads (not comparable to the baseline)
+
+The baseline is stored in benchmarks/throughput_baseline.json. Timings depend on the machine, so update the baseline
+when moving to a new machine. The benchmark exits with an error if a measurement regresses past the tolerance.
+'''
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+SRC_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, '..', 'src')
+BASELINE_FILE = os.path.join(BENCHMARK_DIRECTORY, 'throughput_baseline.json')
+SAMPLE_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, '..', 'tests', 'Jovial Assembler (.jov)')
+
+sys.path.insert(0, SRC_DIRECTORY)
+
+from Calculator_State import CalculatorState
+from Output import render
+from Parse_File import parse_lines
+from Program_Generator import BASE, MIXES, SIGN_MODE, WORD_SIZE, generate_programs
+
+TARGETS = ['16c', 'txt', 'pdf']
+
+# A time regresses if it is slower than baseline * TOLERANCE + SLACK_MS, and memory if it is above baseline * TOLERANCE + SLACK_KB
+TOLERANCE = 1.5
+SLACK_MS = 5
+SLACK_KB = 64
+
+
+def load_samples():
+    # Returns a list of (name, lines) for each sample program
+    samples = []
+    for path in sorted(glob.glob(os.path.join(SAMPLE_DIRECTORY, '*.jov'))):
+        with open(path) as sample_file:
+            samples.append((os.path.basename(path), sample_file.read().splitlines()))
+    return samples
+
+
+def assemble_workload(programs, settings):
+    # Parse every program of the workload and return their calculator states
+    states = []
+    for name, lines in programs:
+        calculator_state = CalculatorState(*settings)
+        calculator_state.input_file_name = name
+        calculator_state.check_initial_settings()
+        parse_lines(lines, calculator_state)
+        states.append(calculator_state)
+    return states
+
+
+def stream_workload(programs, settings):
+    # Parse every program of the workload one after the other without keeping them, as stream mode does
+    for name, lines in programs:
+        calculator_state = CalculatorState(*settings)
+        calculator_state.input_file_name = name
+        calculator_state.check_initial_settings()
+        parse_lines(lines, calculator_state)
+
+
+def fastest(function, runs):
+    # Returns the fastest wall time in ms over the runs (the fastest run has the least noise from the rest of the system)
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def peak_memory(function):
+    # Returns the peak memory allocated while running the function in KB
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024
+
+
+def measure(runs, lines, seed):
+    # Every workload is a list of (name, lines) with the initial settings to assemble it with
+    workloads = {'samples': (load_samples(), (None, None, None))}
+    for mix in MIXES:
+        programs = generate_programs(lines, mix, seed)
+        workloads[mix] = ([(f'{mix}-{number}.jov', program) for number, program in enumerate(programs)], (SIGN_MODE, WORD_SIZE, BASE))
+
+    measurements = {'lines': lines, 'seed': seed, 'workloads': {}, 'render_ms': {}}
+    for name, (programs, settings) in workloads.items():
+        line_count = sum(len(program_lines) for _, program_lines in programs)
+        assemble_workload(programs, settings) # Warm up run, which also fills the keystroke cache
+        parse_ms = fastest(lambda: stream_workload(programs, settings), runs)
+        measurements['workloads'][name] = {
+            'programs': len(programs),
+            'lines': line_count,
+            'parse_ms': round(parse_ms, 2),
+            'lines_per_second': round(line_count / parse_ms * 1000),
+            'peak_kb': round(peak_memory(lambda: stream_workload(programs, settings)), 1),
+        }
+
+    # Render each target for every sample program (the PDFs are the slowest by far)
+    sample_states = assemble_workload(*workloads['samples'])
+    for target in TARGETS:
+        measurements['render_ms'][target] = round(fastest(lambda: [render(state, target) for state in sample_states], runs), 2)
+    measurements['render_peak_kb'] = round(peak_memory(lambda: [render(state, 'pdf') for state in sample_states]), 1)
+
+    return measurements
+
+
+def compare(measurements, baseline):
+    # Returns a list of the measurements that regressed past the tolerance
+    regressions = []
+
+    def check(key, value, baseline_value, slack, unit):
+        limit = baseline_value * TOLERANCE + slack
+        if value > limit:
+            regressions.append(f"{key} regressed to {value:.2f} {unit} (baseline {baseline_value:.2f} {unit}, limit {limit:.2f} {unit})")
+
+    for name, workload in measurements['workloads'].items():
+        if name not in baseline['workloads']:
+            continue
+        check(f'{name} parse', workload['parse_ms'], baseline['workloads'][name]['parse_ms'], SLACK_MS, 'ms')
+        check(f'{name} peak memory', workload['peak_kb'], baseline['workloads'][name]['peak_kb'], SLACK_KB, 'KB')
+    for target, render_ms in measurements['render_ms'].items():
+        if target in baseline['render_ms']:
+            check(f'{target} render', render_ms, baseline['render_ms'][target], SLACK_MS, 'ms')
+    check('pdf render peak memory', measurements['render_peak_kb'], baseline['render_peak_kb'], SLACK_KB, 'KB')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the throughput of the Jovial Assembler')
+    parser.add_argument('-r', '--runs', type=int, default=5, help='Number of runs for each measurement (default = 5)')
+    parser.add_argument('-n', '--lines', type=int, default=20000, help='Number of source lines in each synthetic workload (default = 20000)')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='Random seed for the synthetic workloads (default = 0)')
+    parser.add_argument('--update', action='store_true', help='Store the measurements as the new baseline')
+    args = parser.parse_args()
+
+    measurements = measure(args.runs, args.lines, args.seed)
+    print(f"{'Workload':12} {'Programs':>8} {'Lines':>8} {'Parse (ms)':>11} {'Lines/s':>10} {'Peak (KB)':>10}")
+    for name, workload in measurements['workloads'].items():
+        print(f"{name:12} {workload['programs']:8} {workload['lines']:8} {workload['parse_ms']:11.2f} {workload['lines_per_second']:10} {workload['peak_kb']:10.1f}")
+    for target, render_ms in measurements['render_ms'].items():
+        print(f"Render {target} (samples): {render_ms:8.2f} ms")
+    print(f"Peak memory rendering the sample PDFs: {measurements['render_peak_kb']:.1f} KB")
+
+    failed = False
+    if args.update:
+        with open(BASELINE_FILE, 'w') as baseline_file:
+            json.dump(measurements, baseline_file, indent=4)
+            baseline_file.write('\n')
+        print(f"Baseline updated: {BASELINE_FILE}")
+    elif os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as baseline_file:
+            baseline = json.load(baseline_file)
+        if (baseline['lines'], baseline['seed']) != (args.lines, args.seed):
+            print(f"The baseline was measured with --lines {baseline['lines']} --seed {baseline['seed']}, so it is not compared.")
+        else:
+            for regression in compare(measurements, baseline):
+                print(f"FAIL: {regression}")
+                failed = True
+    else:
+        print("No baseline found. Run with --update to store one.")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
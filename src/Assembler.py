@@ -0,0 +1,77 @@
+from dataclasses import dataclass
+
+from Calculator_State import CalculatorState
+from Output import render
+from Parse_File import parse_lines
+
+# Library interface to the assembler
+# assemble() works entirely in memory: it does not read or write files, log critical errors, or exit the process
+# Errors are raised as subclasses of Assembler_Errors.AssemblerError
+#
+# Example:
+#   program = assemble("lbl a\n1\n+\nrtn", sign_mode=2, word_size=16, base=10)
+#   listing = program.render("16c") # The .16c file as bytes
+
+
+@dataclass(frozen=True)
+class AssembledProgram:
+    # Attribute names match CalculatorState, so the output functions accept either
+    program: tuple # Instruction objects, one per program step
+    program_length: int # Length of the program in bytes
+    registers_used: tuple # Registers used by STO and RCL, in ascending order
+    available_registers: int | None # Number of registers available (None if the word size is not known)
+    memory_partition: int # Partition between program and data memory in bytes
+    sign_mode: int | None # Calculator status at the end of the program
+    word_size: int | None
+    base: str | None
+    input_file_name: str # Name shown in the headers of the .txt and .pdf outputs
+    diagnostics: tuple # Warnings raised while assembling
+    timestamp: bool = True # Include the generation time in the .16c and .pdf headers
+    memory_trace: tuple | None = None # Calculator_State.MemoryTraceEntry for each source line, if traced
+    bytes_saved: dict | None = None # Bytes saved by each peephole rule, if optimized
+
+    @property
+    def keycodes(self):
+        # (modifier, instruction, argument) key codes for each program step, None for keys that are not pressed
+        keycodes = []
+        for line in self.program:
+            modifier = str(line.modifier_position) if line.has_modifier else None
+            argument = str(line.argument_position).strip() if line.has_argument else None
+            keycodes.append((modifier, str(line.instruction_position).strip(), argument))
+        return tuple(keycodes)
+
+    def render(self, output_mode, output_file=None):
+        # Render the program as a .16c, .txt, or .pdf file
+        # Writes to output_file (a file-like object) if given, otherwise returns the output as bytes
+        return render(self, output_mode, output_file)
+
+
+def assemble(text, sign_mode=None, word_size=None, base=None, name="program.jov", timestamp=True, trace_memory=False, profiler=None, optimize=False):
+    # Assemble Jovial source code (a string or a list of lines) into an AssembledProgram
+    # Pass a Profiler.Profiler to add the time spent in each phase to it (e.g. to profile many programs in one report)
+    calculator_state = CalculatorState(sign_mode, word_size, base)
+    calculator_state.input_file_name = name
+    calculator_state.profiler = profiler
+    diagnostics = calculator_state.check_initial_settings()
+    calculator_state.memory_trace = [] if trace_memory else None
+
+    if isinstance(text, str):
+        text = text.splitlines()
+    calculator_state.optimize = optimize
+    parse_lines(text, calculator_state) # Runs the optimizer at the end of the program
+
+    return AssembledProgram(
+        program=tuple(calculator_state.program),
+        program_length=calculator_state.program_length,
+        registers_used=tuple(sorted(calculator_state.registers_used)),
+        available_registers=calculator_state.available_registers,
+        memory_partition=calculator_state.memory_partition,
+        sign_mode=calculator_state.sign_mode,
+        word_size=calculator_state.word_size,
+        base=calculator_state.base,
+        input_file_name=name,
+        diagnostics=tuple(diagnostics),
+        timestamp=timestamp,
+        memory_trace=tuple(calculator_state.memory_trace) if trace_memory else None,
+        bytes_saved=calculator_state.bytes_saved,
+    )
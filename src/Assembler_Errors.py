@@ -0,0 +1,60 @@
+# Exceptions raised by the assembler
+# The command line reports them and exits, while library users can catch them by type
+# Every error carries the line number of the source line that caused it (if known), and the column of the token (if known)
+# Every error type also has a stable code, which is reported with the error in diagnostics (see Diagnostics.py)
+
+class AssemblerError(Exception):
+    code = "E000"
+
+    def __init__(self, message, line_number=None, column=None):
+        super().__init__(message)
+        self.message = message
+        self.line_number = line_number
+        self.column = column
+
+    def __str__(self):
+        if self.line_number is None:
+            return self.message
+        if self.column is None:
+            return f"{self.message} (line number {self.line_number})"
+        return f"{self.message} (line number {self.line_number}, column {self.column})"
+
+
+class InvalidSettingsError(AssemblerError):
+    # The initial sign mode, word size, or base is not valid
+    code = "E001"
+
+
+class InvalidInstructionError(AssemblerError):
+    # The line is not a valid instruction or number
+    code = "E002"
+
+
+class InvalidArgumentError(AssemblerError):
+    # The argument is not valid for the instruction
+    code = "E003"
+
+
+class MissingArgumentError(InvalidArgumentError):
+    # The instruction requires an argument
+    code = "E004"
+
+
+class InvalidNumberError(AssemblerError):
+    # The number is not a valid integer or float for the current mode
+    code = "E005"
+
+
+class AddressRangeError(AssemblerError):
+    # The register is outside of the direct addressing range or the memory partition
+    code = "E006"
+
+
+class OutOfMemoryError(AssemblerError):
+    # The program or its registers do not fit in the 203 bytes of memory
+    code = "E007"
+
+
+class SubroutineDepthError(AssemblerError):
+    # The subroutines are nested deeper than the 4 levels of the return stack
+    code = "E008"
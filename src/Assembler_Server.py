@@ -0,0 +1,118 @@
+import base64
+import json
+import logging
+import socketserver
+import sys
+
+from Assembler import assemble
+from Assembler_Errors import AssemblerError
+from Output import OUTPUT_MODES, register_pdf_font
+
+# Server mode keeps one warm process and assembles programs sent to it as JSON lines
+# Each request is one line of JSON, and each response is written back as one line of JSON as soon as it is ready
+#
+# Request:
+#   {"id": 1, "source": "lbl a\n1\n+\nrtn", "sign_mode": 2, "word_size": 16, "base": 10, "name": "add.jov", "targets": ["16c", "pdf"]}
+#   Only "source" is required. "targets" defaults to no outputs (just the assembly results)
+#   "timestamp": false leaves the generation time out of the .16c and .pdf headers
+#   "optimize": true runs the peephole optimizer, and the response holds the bytes saved by each rule in "bytes_saved"
+# Response:
+#   {"id": 1, "ok": true, "program_length": 4, "registers_used": [], "available_registers": 100, "memory_partition": 196,
+#    "keycodes": [["43", "22", "A"], ...], "diagnostics": [], "outputs": {"16c": "...", "pdf": "<base64>"}}
+#   {"id": 1, "ok": false, "error": {"type": "InvalidArgumentError", "message": "...", "line_number": 2, "column": 5}}
+
+
+def handle_request(request_line):
+    # Returns the response for one JSON request line
+    request_id = None
+    try:
+        request = json.loads(request_line)
+        if not isinstance(request, dict) or not isinstance(request.get("source"), str):
+            raise ValueError("Requests must be JSON objects with a 'source' string")
+        request_id = request.get("id")
+
+        targets = request.get("targets", [])
+        if isinstance(targets, str):
+            targets = [target.strip() for target in targets.split(",") if target.strip()]
+        for target in targets:
+            if target not in OUTPUT_MODES:
+                raise ValueError(f"Invalid target: {target}. Please use either '16c', 'pdf', or 'txt'.")
+
+        program = assemble(
+            request["source"],
+            sign_mode=request.get("sign_mode"),
+            word_size=request.get("word_size"),
+            base=request.get("base"),
+            name=request.get("name", "program.jov"),
+            timestamp=request.get("timestamp", True),
+            optimize=request.get("optimize", False),
+        )
+
+        outputs = {}
+        for target in targets:
+            output = program.render(target)
+            if target == "pdf": # PDFs are binary, so they are sent as base64
+                outputs[target] = base64.b64encode(output).decode("ascii")
+            else:
+                outputs[target] = output.decode("utf-8")
+
+        return {
+            "id": request_id,
+            "ok": True,
+            "program_length": program.program_length,
+            "registers_used": list(program.registers_used),
+            "available_registers": program.available_registers,
+            "memory_partition": program.memory_partition,
+            "keycodes": [list(keycode) for keycode in program.keycodes],
+            "diagnostics": list(program.diagnostics),
+            "bytes_saved": program.bytes_saved,
+            "outputs": outputs,
+        }
+    except AssemblerError as error:
+        return {"id": request_id, "ok": False, "error": {"type": type(error).__name__, "message": error.message, "line_number": error.line_number, "column": error.column}}
+    except (ValueError, TypeError) as error: # Includes invalid JSON
+        return {"id": request_id, "ok": False, "error": {"type": "InvalidRequest", "message": str(error), "line_number": None, "column": None}}
+
+
+def serve_stream(input_stream, output_stream):
+    # Answer requests from input_stream until it is closed
+    for request_line in input_stream:
+        if request_line.strip() == "":
+            continue
+        response = handle_request(request_line)
+        output_stream.write(json.dumps(response) + "\n")
+        output_stream.flush() # Stream each result back as soon as it is ready
+
+
+class AssemblerRequestHandler(socketserver.StreamRequestHandler):
+    # Each connection gets its own thread, and each assembly its own CalculatorState
+    def handle(self):
+        for request_line in self.rfile:
+            if request_line.strip() == b"":
+                continue
+            response = handle_request(request_line.decode("utf-8"))
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+class AssemblerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(port=None):
+    # Serve JSON lines over stdin/stdout, or over a TCP socket on localhost if a port is given
+    # Do the slow one-off work (PDF font registration) before the first request arrives
+    register_pdf_font()
+
+    if port is None:
+        logging.info("Serving assemble requests on stdin/stdout")
+        serve_stream(sys.stdin, sys.stdout)
+    else:
+        with AssemblerServer(("127.0.0.1", port), AssemblerRequestHandler) as server:
+            print(f"Serving assemble requests on 127.0.0.1:{server.server_address[1]}", file=sys.stderr, flush=True)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+    return 0
@@ -0,0 +1,214 @@
+import glob
+import io
+import logging
+import os
+import sys
+
+from Assembler_Errors import AssemblerError
+from Build_Cache import BuildCache, output_key, program_key
+from Calculator_State import CalculatorState
+from Diagnostics import diagnostic_from_error, has_errors, write_diagnostics
+from Instructions import keystroke
+from Output import output_all
+from Parse_File import parse_file, parse_lines
+from Utils import setup_logging
+
+# Batch mode assembles every .jov file found in the given directories, glob patterns and files
+# Each program is assembled in a pool of worker processes and written once per target into its own output tree
+# With a build cache, unchanged programs are copied from the cache instead of being assembled again
+
+# Output folder for each target (the same layout as the tests folder)
+TARGET_DIRECTORIES = {
+    '16c': 'JRPN Simulator (.16c)',
+    'txt': 'HP16C Emulator (.txt)',
+    'pdf': 'Keystroke Programming (.pdf)',
+}
+
+
+def is_glob_pattern(path):
+    return any(char in path for char in '*?[')
+
+
+def expand_input_files(input_patterns):
+    # Returns a list of (input file, output path relative to the output tree without extension)
+    input_files = []
+    for pattern in input_patterns:
+        if os.path.isdir(pattern):
+            # Keep the folder structure of the directory in the output trees
+            for path in sorted(glob.glob(os.path.join(glob.escape(pattern), '**', '*.jov'), recursive=True)):
+                input_files.append((path, os.path.splitext(os.path.relpath(path, pattern))[0]))
+        elif is_glob_pattern(pattern):
+            for path in sorted(glob.glob(pattern, recursive=True)):
+                if path.endswith('.jov') and os.path.isfile(path):
+                    input_files.append((path, os.path.splitext(os.path.basename(path))[0]))
+        else:
+            input_files.append((pattern, os.path.splitext(os.path.basename(pattern))[0]))
+
+    return input_files
+
+
+def assemble_batch_file(job):
+    # Runs in a worker process
+    # Returns (program length, True if the program was parsed, diagnostics, profile), the program length is None if the program failed to assemble
+    # diagnostics is the list of Diagnostic for the program if errors are reported as diagnostics, otherwise None (the error is logged here)
+    # profile is {phase: (calls, seconds)} if profiling, otherwise None
+    input_file_name, output_files, sign_mode, word_size, base, timestamp, cache_directory, cache_size, collect_diagnostics, all_errors, profile, optimize_program = job
+
+    calculator_state = CalculatorState(sign_mode, word_size, base)
+    calculator_state.input_file_name = input_file_name
+    calculator_state.timestamp = timestamp
+    calculator_state.optimize = optimize_program
+    diagnostics = [] if collect_diagnostics else None
+    if profile:
+        from Profiler import Profiler # Only needed when profiling
+        calculator_state.profiler = Profiler()
+
+    result = assemble_batch_program(calculator_state, output_files, cache_directory, cache_size, diagnostics, all_errors)
+    # The phase times are sent back to the main process, which adds up the times of every program
+    return result + (calculator_state.profiler.results() if profile else None,)
+
+
+def assemble_batch_program(calculator_state, output_files, cache_directory, cache_size, diagnostics, all_errors):
+    # Returns (program length, True if the program was parsed, diagnostics), as for assemble_batch_file
+    input_file_name = calculator_state.input_file_name
+
+    try:
+        if cache_directory is None:
+            parse_file(calculator_state, diagnostics if all_errors else None)
+            if has_errors(diagnostics):
+                return None, False, diagnostics
+            output_all(calculator_state, output_files)
+            return calculator_state.program_length, True, diagnostics
+        program_length, parsed = assemble_cached_file(calculator_state, output_files, BuildCache(cache_directory, cache_size), diagnostics if all_errors else None)
+        return program_length, parsed, diagnostics
+    except AssemblerError as error:
+        if diagnostics is None:
+            logging.critical(f"{input_file_name}: {error}")
+        else:
+            diagnostics.append(diagnostic_from_error(error, input_file_name))
+        return None, False, diagnostics
+
+
+def assemble_cached_file(calculator_state, output_files, cache, diagnostics=None):
+    # Reuse every output the cache already has, and only parse the program if a missing output needs it
+    # Returns (program length, True if the program was parsed), the program length is None if errors were added to diagnostics
+    with open(calculator_state.input_file_name, "r") as input_file:
+        source_text = input_file.read()
+    key = program_key(source_text, calculator_state.input_file_name, calculator_state.sign_mode, calculator_state.word_size, calculator_state.base_numeric, calculator_state.timestamp, calculator_state.optimize)
+
+    missing_output_files = []
+    for output_mode, output_file_name in output_files:
+        output = cache.get(output_key(key, output_mode), "out")
+        if output is None:
+            missing_output_files.append((output_mode, output_file_name))
+        else:
+            with open(f"{output_file_name}.{output_mode}", "wb") as output_file:
+                output_file.write(output)
+
+    cached_program = cache.get_program(key)
+    if len(missing_output_files) == 0 and cached_program is not None:
+        return cached_program["program_length"], False
+
+    parsed = cached_program is None
+    if parsed:
+        parse_lines(io.StringIO(source_text), calculator_state, diagnostics)
+        if has_errors(diagnostics):
+            return None, True
+        cache.put_program(key, calculator_state)
+    else:
+        # Rebuild the program from its keystrokes instead of parsing it again
+        calculator_state.program = [keystroke(instruction, argument) for instruction, argument in cached_program["program"]]
+        for attribute in ["program_length", "registers_used", "available_registers", "memory_partition", "sign_mode", "previous_sign_mode", "word_size", "base"]:
+            setattr(calculator_state, attribute, cached_program[attribute])
+        calculator_state.registers_used = set(calculator_state.registers_used)
+
+    output_all(calculator_state, missing_output_files)
+    for output_mode, output_file_name in missing_output_files:
+        with open(f"{output_file_name}.{output_mode}", "rb") as output_file:
+            cache.put(output_key(key, output_mode), "out", output_file.read())
+
+    return calculator_state.program_length, parsed
+
+
+def assemble_batch(calculator_state):
+    # Returns the exit code for the batch
+    input_files = expand_input_files(calculator_state.batch_input_files)
+    if len(input_files) == 0:
+        logging.critical("No .jov files found. Please provide a directory, glob pattern, or .jov files.")
+        return 1
+
+    # Build the job for each input file and make sure the output trees exist
+    jobs = []
+    output_stems = set()
+    for input_file_name, output_stem in input_files:
+        if not input_file_name.endswith(".jov"):
+            logging.critical(f"Invalid input file type: {input_file_name}. Please enter a .jov file.")
+            return 1
+        if output_stem in output_stems:
+            logging.critical(f"More than one input file would be written to {output_stem}. Please rename one of them.")
+            return 1
+        output_stems.add(output_stem)
+
+        output_files = []
+        for output_mode in calculator_state.output_targets:
+            output_file_name = os.path.join(calculator_state.output_directory, TARGET_DIRECTORIES[output_mode], output_stem)
+            os.makedirs(os.path.dirname(output_file_name), exist_ok=True)
+            output_files.append((output_mode, output_file_name))
+
+        jobs.append((input_file_name, output_files, calculator_state.sign_mode, calculator_state.word_size, calculator_state.base_numeric,
+            calculator_state.timestamp, calculator_state.cache_directory, calculator_state.cache_size, calculator_state.diagnostics is not None, calculator_state.all_errors,
+            calculator_state.profiler is not None, calculator_state.optimize))
+
+    # Fan the files out across the process pool (a single job is not worth starting a pool for)
+    jobs_count = calculator_state.batch_jobs or os.cpu_count() or 1
+    logging.info(f"Assembling {len(jobs)} files with {jobs_count} jobs")
+    if jobs_count == 1 or len(jobs) == 1:
+        results = map(assemble_batch_file, jobs)
+        failures, parsed, diagnostics = report_batch_results(jobs, results, calculator_state.profiler)
+    else:
+        from concurrent.futures import ProcessPoolExecutor # Only needed in batch mode
+
+        with ProcessPoolExecutor(max_workers=jobs_count, initializer=setup_logging, initargs=(calculator_state.logger_level,)) as executor:
+            results = executor.map(assemble_batch_file, jobs, chunksize=max(1, len(jobs) // (jobs_count * 4)))
+            failures, parsed, diagnostics = report_batch_results(jobs, results, calculator_state.profiler)
+
+    if calculator_state.cache_directory is not None:
+        BuildCache(calculator_state.cache_directory, calculator_state.cache_size).evict()
+
+    # Errors go to stderr, JSON goes to stdout for tools to read (and the stats move to stderr)
+    stats_file = sys.stdout
+    if calculator_state.diagnostics is not None:
+        diagnostics_file = sys.stdout if calculator_state.diagnostics_format == "json" else sys.stderr
+        stats_file = sys.stderr if diagnostics_file is sys.stdout else sys.stdout
+        write_diagnostics(calculator_state.diagnostics + diagnostics, calculator_state.diagnostics_format, diagnostics_file)
+
+    print("Stats:".ljust(80, '.'), file=stats_file)
+    print(f"Assembled {len(jobs) - failures} of {len(jobs)} programs into {calculator_state.output_directory} ({', '.join(calculator_state.output_targets)})", file=stats_file)
+    if calculator_state.cache_directory is not None:
+        print(f"Parsed {parsed} programs, reused {len(jobs) - failures - parsed} from the build cache at {calculator_state.cache_directory}", file=stats_file)
+    if failures:
+        print(f"Failed to assemble {failures} programs", file=stats_file)
+    if calculator_state.profiler is not None:
+        calculator_state.profiler.print_report(stats_file, "Profile (summed over every program):")
+    return 1 if failures else 0
+
+
+def report_batch_results(jobs, results, profiler=None):
+    # Returns the number of programs that failed to assemble, the number of programs that were parsed,
+    # and the diagnostics of every program (in the order of the jobs)
+    # The phase times of every program are added to the profiler, if profiling
+    failures = 0
+    parsed_count = 0
+    all_diagnostics = []
+    for job, (program_length, parsed, diagnostics, profile) in zip(jobs, results):
+        if diagnostics is not None:
+            all_diagnostics.extend(diagnostics)
+        if profile is not None:
+            profiler.merge(profile)
+        if program_length is None:
+            failures += 1
+            logging.error(f"Failed to assemble {job[0]}")
+        else:
+            parsed_count += parsed
+            logging.info(f"Assembled {job[0]} ({program_length} Bytes{'' if parsed else ', from the build cache'})")
+    return failures, parsed_count, all_diagnostics
@@ -0,0 +1,152 @@
+from Control_Flow import SKIP_INSTRUCTIONS, is_conditional, is_indirect, label_name, label_positions, label_target
+from Instructions import keystroke
+from Label_Allocator import is_label_reference
+
+# Branch optimizer rules for the peephole optimizer (jovial -O)
+# A conditional test runs the next step when it is true and skips it when it is false, so hand written programs jump
+# around with trampolines like:
+#   x==y GTO 1 GTO 2 LBL 1
+# These rules follow the skips through the jumps and labels, and rewrite the branches so fewer steps are stored and run:
+#   x!=y GTO 2 LBL 1 (the test is inverted so the jump it guards is the one that falls through)
+# Unlike the other peephole rules, they may change the step after a test, since they know exactly what the skip lands on
+#
+# Labels are only moved or removed when nothing else can depend on them: named labels are internal to the program (they
+# are not allocated yet), while numbered labels may be run from the keyboard or reached through I
+
+# Tests that have a complementary test on the HP-16C (x<0 and x>0 do not, since there is no x>=0 or x<=0)
+# The names are the test instructions in Instructions_Data
+COMPLEMENTARY_TESTS = {
+    "x==y": "x!=y",
+    "x!=y": "x==y",
+    "x==0": "x!=0",
+    "x!=0": "x==0",
+    "x<=y": "x>y",
+    "x>y": "x<=y",
+}
+
+
+def is_direct_jump(line, instructions=("GTO",)):
+    return line.instruction in instructions and not is_indirect(line)
+
+
+def jump_to(line, target_jump):
+    # A jump like line (GTO or GSB) that goes to the label target_jump goes to, or None if it cannot be written as one step
+    if is_label_reference(target_jump):
+        if not is_label_reference(line):
+            return None # The mode at line is not known to jump through I if the label runs out
+        return line._replace(argument=target_jump.argument)
+    return keystroke(line.instruction.lower(), target_jump.key[1])
+
+
+def invert_skipped_jumps(program):
+    # x==y GTO 1 <step> LBL 1 -> x!=y <step> LBL 1: the jump only skips the one step after it, which the inverted test can skip
+    # A test that can itself be skipped is left alone, since skipping it would then run the step instead of the jump
+    labels = label_positions(program)
+    optimized = []
+    index = 0
+    while index < len(program):
+        line = program[index]
+        if (line.instruction in COMPLEMENTARY_TESTS and not is_conditional(program, index)
+                and index + 3 < len(program) and is_direct_jump(program[index + 1])
+                and program[index + 2].instruction not in SKIP_INSTRUCTIONS and program[index + 2].instruction != "LBL"
+                and label_target(labels, label_name(program[index + 1].argument), index + 1) == index + 3):
+            optimized += [keystroke(COMPLEMENTARY_TESTS[line.instruction]), program[index + 2]]
+            index += 3
+            continue
+        optimized.append(line)
+        index += 1
+    return optimized
+
+
+def remove_jumps_to_next_step(program):
+    # GTO 1 LBL 1 -> LBL 1: the jump goes where the program would run anyway (only labels are in between)
+    # After a test, the test skips the label instead of the jump, which does nothing either way
+    labels = label_positions(program)
+    optimized = []
+    for index, line in enumerate(program):
+        if is_direct_jump(line):
+            target = label_target(labels, label_name(line.argument), index)
+            if target is not None and target > index and all(program[step].instruction == "LBL" for step in range(index + 1, target)):
+                continue
+        optimized.append(line)
+    return optimized
+
+
+def final_jump(program, labels, index):
+    # Follows a chain of jumps to jumps from the jump at index (GTO 1 ... LBL 1 GTO 2 ... LBL 2 GTO 3)
+    # Returns the index of the last GTO in the chain, or None if the label the jump goes to is not followed by a GTO
+    # (or the chain goes round in a loop)
+    last = None
+    visited = {index}
+    step = label_target(labels, label_name(program[index].argument), index)
+    while step is not None:
+        while step < len(program) and program[step].instruction == "LBL":
+            step += 1
+        if step >= len(program) or not is_direct_jump(program[step]) or step in visited:
+            return None if step in visited else last
+        visited.add(step)
+        last = step
+        step = label_target(labels, label_name(program[step].argument), step)
+    return last
+
+
+def thread_jumps(program):
+    # GTO 1 ... LBL 1 GTO 2 -> GTO 2 ... LBL 1 GTO 2: a jump to a jump goes straight to where the second jump goes
+    # (the same for GSB, since the GTO does not return). A label can be defined more than once, so the new jump must find
+    # the same label from where it is
+    labels = label_positions(program)
+    optimized = list(program)
+    for index, line in enumerate(program):
+        if not is_direct_jump(line, ("GTO", "GSB")):
+            continue
+        last = final_jump(program, labels, index)
+        if last is None:
+            continue
+        jump = jump_to(line, program[last])
+        destination = label_target(labels, label_name(program[last].argument), last)
+        if jump is not None and jump != line and label_target(labels, label_name(jump.argument), index) == destination:
+            optimized[index] = jump
+    return optimized
+
+
+def move_jumped_blocks(program):
+    # GTO @a ... RTN LBL @a <block> GTO 2 -> <block> GTO 2 ... RTN: a block that is only reached by one jump is put where
+    # the jump is, so the jump and the label are not stored or run
+    # The block starts at a named label that only the one GTO jumps to, cannot be fallen into, and ends with a GTO or RTN
+    # that is not after a test. Moving code changes where jumps search for their labels from, so the program must define
+    # each label once and not jump through I
+    labels = label_positions(program)
+    if any(len(positions) > 1 for positions in labels.values()):
+        return program
+    if any(line.instruction in ("GTO", "GSB") and is_indirect(line) for line in program):
+        return program
+
+    jumps = {}
+    for index, line in enumerate(program):
+        if line.instruction in ("GTO", "GSB") and is_label_reference(line):
+            jumps.setdefault(line.argument, []).append(index)
+
+    for name, indexes in jumps.items():
+        index = indexes[0]
+        if len(indexes) > 1 or program[index].instruction != "GTO" or is_conditional(program, index) or name not in labels:
+            continue
+        start = labels[name][0]
+        if start == 0 or program[start - 1].instruction not in ("GTO", "RTN") or is_conditional(program, start - 1) or start - 1 == index:
+            continue
+        end = next((step for step in range(start + 1, len(program))
+            if program[step].instruction in ("GTO", "RTN") and not is_conditional(program, step)), None)
+        if end is None or start <= index <= end:
+            continue
+        block = program[start + 1:end + 1]
+        if index < start:
+            return program[:index] + block + program[index + 1:start] + program[end + 1:]
+        return program[:start] + program[end + 1:index] + block + program[index + 1:]
+    return program
+
+
+def remove_unused_labels(program):
+    # LBL @a with no jump to it -> nothing: named labels are only there to be jumped to
+    # A label after a test is kept, so the test still skips the same step
+    jumped_to = {line.argument for line in program if line.instruction in ("GTO", "GSB") and is_label_reference(line)}
+    return [line for index, line in enumerate(program)
+        if not (line.instruction == "LBL" and is_label_reference(line) and line.argument not in jumped_to and not is_conditional(program, index))]
@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+
+from Utils import ASSEMBLER_VERSION
+
+# Content-addressed build cache for batch mode
+# Entries are keyed on a hash of everything that can change an output: the source text, the name shown in the headers,
+# the initial mode settings, the timestamp and optimizer settings, the assembler version, and the target
+# Two kinds of entries are stored:
+#   <key>.keys   The keystrokes and stats of an assembled program (JSON), so new targets can be rendered without parsing again
+#   <key>.out    The bytes of an output file exactly as it was written
+# Entries are written atomically, so several worker processes can share one cache
+# Reading an entry marks it as recently used, and the least recently used entries are evicted once the cache is over its size
+# hashlib and tempfile are only imported when the cache is used, as the command line imports this module for its defaults
+
+DEFAULT_CACHE_DIRECTORY = ".jovial-cache"
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024 # Bytes
+
+
+def program_key(source_text, input_file_name, sign_mode, word_size, base, timestamp, optimize=False):
+    # Hash of every input to the assembly of one program
+    # The version is included so that an upgraded assembler never reuses outputs from an older one
+    import hashlib
+    settings = json.dumps([ASSEMBLER_VERSION, os.path.basename(input_file_name), sign_mode, word_size, base, timestamp, optimize])
+    return hashlib.sha256(settings.encode("utf-8") + b"\0" + source_text.encode("utf-8")).hexdigest()
+
+
+def output_key(program_key, output_mode):
+    import hashlib
+    return hashlib.sha256(f"{program_key}:{output_mode}".encode("utf-8")).hexdigest()
+
+
+class BuildCache:
+    def __init__(self, directory, max_size=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key, kind):
+        # Entries are spread over 256 folders, so no folder gets too large
+        return os.path.join(self.directory, key[:2], f"{key}.{kind}")
+
+    def get(self, key, kind):
+        # Returns the bytes of the entry, or None if it is not in the cache
+        path = self.path(key, kind)
+        try:
+            with open(path, "rb") as entry_file:
+                data = entry_file.read()
+        except FileNotFoundError:
+            return None
+
+        try:
+            os.utime(path) # Mark the entry as recently used
+        except OSError:
+            pass # Another process evicted it, but we already have the data
+        return data
+
+    def put(self, key, kind, data):
+        path = self.path(key, kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file and move it into place, so other processes never read a partial entry
+        import tempfile
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "wb") as entry_file:
+                entry_file.write(data)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+    def get_program(self, key):
+        # Returns the keystrokes and stats of an assembled program, or None
+        data = self.get(key, "keys")
+        return json.loads(data) if data is not None else None
+
+    def put_program(self, key, calculator_state):
+        program = {
+            "program": [list(line.key) for line in calculator_state.program],
+            "program_length": calculator_state.program_length,
+            "registers_used": sorted(calculator_state.registers_used),
+            "available_registers": calculator_state.available_registers,
+            "memory_partition": calculator_state.memory_partition,
+            "sign_mode": calculator_state.sign_mode,
+            "previous_sign_mode": calculator_state.previous_sign_mode,
+            "word_size": calculator_state.word_size,
+            "base": calculator_state.base,
+        }
+        self.put(key, "keys", json.dumps(program).encode("utf-8"))
+
+    def evict(self):
+        # Remove the least recently used entries until the cache fits in max_size
+        # Returns the number of entries removed
+        entries = []
+        total_size = 0
+        for folder in os.scandir(self.directory):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                entry_stat = entry.stat()
+                entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+                total_size += entry_stat.st_size
+
+        removed = 0
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            removed += 1
+
+        if removed:
+            logging.info(f"Evicted {removed} entries from the build cache at {self.directory}")
+        return removed
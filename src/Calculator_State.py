@@ -1,38 +1,67 @@
-import math
-import sys
 import logging
+from collections import namedtuple
+
+from Assembler_Errors import InvalidSettingsError, OutOfMemoryError
 
 
 # Class to represent the state of the calculator
 
 PRGM_MEMORY_AVAILABLE = 203 # Number of bytes available in memory for the program
+MEMORY_BLOCK_SIZE = 7 # Program memory is taken from the registers 7 bytes at a time
+
+# Memory use after a source line: the memory partition moves down by 7 bytes every time the program grows past a multiple of 7 bytes
+MemoryTraceEntry = namedtuple("MemoryTraceEntry", ["line_number", "program_length", "memory_partition", "available_registers"])
 
 class CalculatorState:
-    # Attributes
-    # Calculator state
-    sign_mode = None # 0 = Unsigned, 1 = 1's complement, 2 = 2's complement, 3 = floating point
-    previous_sign_mode = None # Previous sign mode (necessary for floating point numbers because int sign mode is saved)
-    word_size = None # Number of bits in a word
-    base = None # Base of the number being entered (2 = binary, 8 = octal, 10 = decimal, 16 = hexadecimal)
-    base_numeric = None
-
-    # Program state
-    program_length = 0 # Length of the program in bytes
-    registers_used = [] # Number of registers used
-    available_registers = 406 # Number of registers available
-    memory_partition = PRGM_MEMORY_AVAILABLE # Partition between program and data memory in bytes
-    program = [] # Array of instruction objects representing the program
-
-
-    # Assembler state
-    input_file_name = None # Input file
-    output_file_name = None # Output file
-    output_mode = None # Output mode (16c or pdf)
-    logger_level = logging.DEBUG
-
-    # Methods
-    def __init__(self):
-        pass
+    # Every attribute is set per instance, so each assembly gets its own program and registers
+    # This lets a long-lived process assemble many programs back to back, or one per thread, without sharing state
+    def __init__(self, sign_mode=None, word_size=None, base=None):
+        # Calculator state
+        self.sign_mode = sign_mode # 0 = Unsigned, 1 = 1's complement, 2 = 2's complement, 3 = floating point
+        self.previous_sign_mode = None # Previous sign mode (necessary for floating point numbers because int sign mode is saved)
+        self.word_size = word_size # Number of bits in a word
+        self.base = None # Base of the number being entered (2 = binary, 8 = octal, 10 = decimal, 16 = hexadecimal)
+        self.base_numeric = None
+        self.update_base(base)
+
+        # Program state
+        self.program_length = 0 # Length of the program in bytes
+        self.registers_used = set() # Registers used by STO and RCL
+        self.register_allocation = {} # Named register (e.g. @limit) -> register it was given
+        self.label_allocation = {} # Named label (e.g. @loop) -> label it was given
+        self.indirect_label_steps = {} # Named label whose jumps go through I -> steps they add to the program
+        self.subroutine_depth = 0 # Deepest nesting of subroutine calls (GSB) in the program
+        self.linked_names = None # When linking: (mnemonic, argument) -> name it is renamed to in this module
+        self.link_input_files = None # Modules to link into one program (None = not linking)
+        self.entry_labels = None # Labels the linked program is started from (None = the first module and its labels)
+        self.linked_modules = None # (module file, Bytes kept, Bytes assembled) for each linked module
+        self.word_mode_known = True # False once the program may have changed the word size or sign mode (e.g. with WSIZE)
+        self.index_register = None # Register number the assembler last put in I to reach a register above R31 (None = unknown)
+        self.available_registers = 406 # Number of registers available
+        self.memory_partition = PRGM_MEMORY_AVAILABLE # Partition between program and data memory in bytes
+        self.program = [] # Array of instruction objects representing the program
+        self.memory_trace = None # List of MemoryTraceEntry, one per source line (None = not traced)
+        self.profiler = None # Profiler that times each phase of the assembly (None = not profiled)
+        self.optimize = False # True to run the peephole optimizer over the program after parsing it
+        self.bytes_saved = None # {peephole rule: bytes saved} after the program is optimized
+        self.literal_bytes_saved = 0 # Bytes saved by entering number literals with fewer keys (with optimize)
+
+        # Assembler state
+        self.input_file_name = None # Input file
+        self.output_files = None # List of (output mode, output file name without extension) to write
+        self.output_targets = None # Output modes to write (16c, txt, and/or pdf)
+        self.output_directory = None # Output directory for batch mode
+        self.timestamp = True # Include the generation time in the .16c and .pdf headers (False for byte-identical rebuilds)
+        self.cache_directory = None # Build cache for batch mode (None = no cache)
+        self.cache_size = None # Maximum size of the build cache in bytes
+        self.batch_mode = False # True if assembling a directory or several files at once
+        self.watch = False # True to reassemble the input file every time it is saved
+        self.all_errors = False # True to report every error in a program instead of stopping at the first one
+        self.diagnostics_format = None # Report errors as diagnostics in this format ("human" or "json"), None = log the first error
+        self.diagnostics = None # List of Diagnostic for the whole run, if errors are reported as diagnostics
+        self.batch_input_files = None # Input files, directories, and glob patterns for batch mode
+        self.batch_jobs = None # Number of worker processes for batch mode (None = number of CPUs)
+        self.logger_level = logging.DEBUG
 
     def __str__(self): # For debugging
         return f"Sign mode: {self.sign_mode}, Word size: {self.word_size}, Base: {self.base}, Program length: {self.program_length}, Registers used: {self.registers_used}, Memory partition: {self.memory_partition}"
@@ -55,20 +84,52 @@ class CalculatorState:
             self.base = "hex"
             self.base_numeric = 16
         else:
-            raise ValueError("Invalid base value")
+            raise InvalidSettingsError(f"Invalid base value: {new_base}")
+
+    def check_initial_settings(self):
+        # Check the initial mode settings and fill in the settings they imply
+        # Returns a list of warnings for every setting that was changed
+        warnings = []
+        if self.sign_mode is not None and self.sign_mode not in [0, 1, 2, 3]:
+            raise InvalidSettingsError(f"Invalid sign mode: {self.sign_mode}. Please use 0, 1, 2, or 3.")
+        if self.word_size is not None and not 4 <= self.word_size <= 64:
+            raise InvalidSettingsError(f"Invalid word size: {self.word_size}. Please use a word size between 4 and 64 bits.")
+
+        if self.sign_mode == 3 and self.word_size != 56:
+            warnings.append("Floating point mode selected. Word size automatically set to 56 bits.")
+            self.word_size = 56
+        if self.sign_mode == 3 and self.base_numeric is not None and self.base_numeric != 10:
+            warnings.append("Floating point mode selected. Base automatically set to 10.")
+            self.update_base(10)
+        if self.base is None: # Numbers are assumed to be in decimal if no base is given
+            self.update_base(10)
+
+        return warnings
 
     def update_memory(self):
+        # Constant time: integer arithmetic on the program length and the size of the register set
         if self.word_size is not None:
-            self.available_registers = math.ceil((PRGM_MEMORY_AVAILABLE - self.program_length) / math.ceil((self.word_size/8)))
+            register_size = -(-self.word_size // 8) # Bytes per register, rounded up
+            self.available_registers = -(-(PRGM_MEMORY_AVAILABLE - self.program_length) // register_size)
 
-            self.memory_partition = PRGM_MEMORY_AVAILABLE - math.ceil(self.program_length / 7) * 7 # Round up program length to nearest multiple of 7
+            self.memory_partition = PRGM_MEMORY_AVAILABLE - -(-self.program_length // MEMORY_BLOCK_SIZE) * MEMORY_BLOCK_SIZE # Round up program length to nearest multiple of 7
 
             if (len(self.registers_used) > self.available_registers):
-                logging.critical("Error: Attempting to use more registers than available")
-                sys.exit(1)
+                raise OutOfMemoryError("Error: Attempting to use more registers than available")
         else:
-            logging.debug("Word size not set")
             self.available_registers = None
 
     def update_program_length(self):
-        self.program_length = len(self.program)
\ No newline at end of file
+        self.program_length = len(self.program)
+
+    def use_register(self, register):
+        # Add a register to the register set, and check that there are enough registers for it
+        if register not in self.registers_used:
+            self.registers_used.add(register)
+            if self.available_registers is not None and len(self.registers_used) > self.available_registers:
+                raise OutOfMemoryError("Error: Attempting to use more registers than available")
+
+    def trace_memory(self, line_number):
+        # Record the memory use after a source line, if the memory is being traced
+        if self.memory_trace is not None:
+            self.memory_trace.append(MemoryTraceEntry(line_number, self.program_length, self.memory_partition, self.available_registers))
\ No newline at end of file
@@ -0,0 +1,146 @@
+import logging
+
+from Assembler_Errors import SubroutineDepthError
+from Control_Flow import SKIP_INSTRUCTIONS, is_indirect, label_name, label_target
+
+# Call graph of an assembled program, to check how deep its subroutines are nested
+# The HP-16C keeps the return address of each GSB on a return stack that only holds 4 of them, so a program whose
+# subroutines call subroutines more than 4 levels deep loses the way back to its caller
+#
+# Each routine is the code that runs from a label (or from the first step) without going into the subroutines it calls
+# The depth of a routine is one more than the depth of the deepest subroutine it calls, and the depth of the program is the
+# depth of the deepest routine it can be started from (the first step, or any label from the keyboard)
+#
+# GSB I and GTO I are not followed, since the assembler cannot tell which label I holds. A subroutine that calls itself
+# (directly or through other subroutines) can nest as deep as it runs, so it is reported as a warning rather than checked
+# (once for each subroutine of each file, so a program that is assembled again, e.g. in watch mode, does not repeat it)
+
+MAX_SUBROUTINE_DEPTH = 4
+
+# (input file, subroutine) pairs already reported as calling themselves
+reported_recursions = set()
+
+
+def routine_segments(program):
+    # Returns ({label name: indexes of its LBL steps}, {start: (the direct GSB steps the code from start can run before it
+    # reaches another label, the labels it reaches)}) for every routine start (the first step and every label)
+    # Between two labels the code only runs forward, one step at a time or two after a test, since every jump goes to a label
+    # and a GSB comes back to the step after it. So the labels and all of the pieces of code are found in one pass over the
+    # program, and the labels the GTO steps go to are looked up once every label is known
+    labels = {}
+    segments = {}
+    jumps = [] # (index of the GTO step, its label, the routine start it is in)
+    runs = False # True if the step at index can run from the start of its piece of code
+    skip_target = None # The step a test that can run skips to
+    for index, line in enumerate(program):
+        instruction = line.instruction
+        runs = runs or index == skip_target
+        if index == 0 or instruction == "LBL":
+            if instruction == "LBL":
+                labels.setdefault(label_name(line.argument), []).append(index)
+            if runs:
+                segments[start][1].append(index) # The code before the label falls into it
+            start = index
+            segments[start] = ([], [])
+            runs = True
+        if not runs:
+            continue
+        if instruction == "GSB":
+            if not is_indirect(line):
+                segments[start][0].append(index)
+        elif instruction == "GTO":
+            if not is_indirect(line): # GTO I ends the walk, as it can go to any label
+                jumps.append((index, label_name(line.argument), start))
+            runs = False
+        elif instruction == "RTN":
+            runs = False
+        elif instruction in SKIP_INSTRUCTIONS:
+            skip_target = index + 2
+    for index, name, start in jumps:
+        target = label_target(labels, name, index)
+        if target is not None and target != start:
+            segments[start][1].append(target)
+    return labels, segments
+
+
+def routine_calls(program, labels, segments, start):
+    # Returns (index of the GSB step, index of the label it calls) for the direct GSB steps the routine starting at start can
+    # run, in program order (calls to an undefined label are left out)
+    gsb_steps = set()
+    visited = {start}
+    pending = [start]
+    while pending:
+        segment_calls, next_labels = segments[pending.pop()]
+        gsb_steps.update(segment_calls)
+        for label in next_labels:
+            if label not in visited:
+                visited.add(label)
+                pending.append(label)
+    targets = ((index, label_target(labels, label_name(program[index].argument), index)) for index in sorted(gsb_steps))
+    return [(index, target) for index, target in targets if target is not None]
+
+
+def chain_from(routines, start, chains, active, calls, recursions):
+    # Returns the indexes of the GSB steps in the deepest chain of nested calls from the routine at start, and adds it to chains
+    # active holds the routines being walked, each called by the GSB at the same position in calls. A chain of calls that
+    # comes back to one of them is added to recursions (the indexes of the routine and of the GSB steps)
+    if start in chains:
+        return chains[start]
+    active.append(start)
+    deepest = []
+    for index, target in routines[start]:
+        if target in active:
+            recursions.append([target] + calls[active.index(target):] + [index])
+            continue
+        calls.append(index)
+        chain = [index] + chain_from(routines, target, chains, active, calls, recursions)
+        calls.pop()
+        if len(chain) > len(deepest):
+            deepest = chain
+    active.pop()
+    chains[start] = deepest
+    return deepest
+
+
+def deepest_call_chains(program):
+    # Returns ({routine start: the indexes of the GSB steps in its deepest chain of nested calls}, [the indexes of the
+    # routine and the GSB steps of each chain of calls that comes back to one of them])
+    labels, segments = routine_segments(program)
+    routines = {start: routine_calls(program, labels, segments, start) for start in segments}
+    chains = {}
+    recursions = []
+    for start in routines:
+        chain_from(routines, start, chains, [], [], recursions)
+    return chains, recursions
+
+
+def describe_step(program, index):
+    line = program[index]
+    if line.instruction in ("LBL", "GSB"):
+        return f"{line.instruction} {line.argument}"
+    return f"step {index + 1}"
+
+
+def subroutine_depth(calculator_state):
+    # Returns how deep the program's subroutines are nested, and raises SubroutineDepthError if it is deeper than the return stack
+    program = calculator_state.program
+    if not any(line.instruction == "GSB" for line in program):
+        return 0 # Nothing is called, so there is no call graph to walk
+    chains, recursions = deepest_call_chains(program)
+    for recursion in recursions:
+        subroutine = describe_step(program, recursion[0])
+        if (calculator_state.input_file_name, subroutine) in reported_recursions:
+            continue
+        reported_recursions.add((calculator_state.input_file_name, subroutine))
+        logging.warning("Subroutine %s calls itself (%s), so how deep it nests cannot be checked", subroutine,
+            " -> ".join(describe_step(program, index) for index in recursion))
+
+    start, chain = max(chains.items(), key=lambda item: len(item[1]))
+    if len(chain) > MAX_SUBROUTINE_DEPTH:
+        calls = " -> ".join(describe_step(program, index) for index in [start] + chain)
+        # Named labels are still placeholders here, so the call past the limit can point at its source line
+        too_deep = program[chain[MAX_SUBROUTINE_DEPTH]]
+        hint = "" if calculator_state.optimize else " (-O turns a GSB followed by RTN into a GTO, which does not use a level)"
+        raise SubroutineDepthError(f"Error - Subroutines nested too deep: {calls} nests {len(chain)} levels deep, and the HP-16C can only return from {MAX_SUBROUTINE_DEPTH}{hint}",
+            getattr(too_deep, "line_number", None), getattr(too_deep, "column", None))
+    return len(chain)
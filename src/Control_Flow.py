@@ -0,0 +1,129 @@
+from bisect import bisect_right
+
+# Control flow of an assembled program (a list of instruction records), for the passes that need to know which step
+# can run after which: the register and label allocators, and the optimizer passes that move or rewrite branches
+#
+# The HP-16C runs the steps in order, except that:
+#   GTO x jumps to LBL x, and GTO I jumps to the label held in I (any label, as far as the assembler can tell)
+#   GSB x calls LBL x, and the RTN that ends the subroutine returns to the step after the GSB
+#   A conditional test (and DSZ, ISZ, F?, B?) skips the next step when it is false
+# A RTN can return to the step after any GSB, since the assembler does not know which subroutine it belongs to
+#
+# GTO and GSB search for their label from the step after them, down to the end of the program and then from the top,
+# so a label can appear more than once: each jump goes to the first one it finds
+
+SKIP_INSTRUCTIONS = frozenset(["x!=0", "x!=y", "x<0", "x<=y", "x==0", "x==y", "x>0", "x>y", "DSZ", "ISZ", "F?", "B?"])
+
+LABEL_DIGITS = "0123456789ABCDEF"
+
+
+def is_skip(line):
+    return line.instruction in SKIP_INSTRUCTIONS
+
+
+def is_conditional(program, index):
+    # True if the step at index may be skipped by the step before it
+    return index > 0 and is_skip(program[index - 1])
+
+
+def label_name(argument):
+    # The label an argument refers to: LBL 10 and LBL A are the same label
+    if argument.isdigit():
+        return LABEL_DIGITS[int(argument)]
+    return argument
+
+
+def is_indirect(line):
+    # GTO I and GSB I jump to the label held in the I register
+    return line.argument in ("I", "(i)")
+
+
+def label_positions(program):
+    # Returns {label name: indexes of its LBL steps, in program order}
+    labels = {}
+    for index, line in enumerate(program):
+        if line.instruction == "LBL":
+            labels.setdefault(label_name(line.argument), []).append(index)
+    return labels
+
+
+def label_target(labels, name, index):
+    # Returns the index of the LBL step a jump at index goes to (None if the label is not in the program)
+    positions = labels.get(name)
+    if not positions:
+        return None
+    following = bisect_right(positions, index)
+    return positions[following] if following < len(positions) else positions[0]
+
+
+def successors(program, labels=None):
+    # Returns a list with the indexes of the steps that can run after each step
+    if labels is None:
+        labels = label_positions(program)
+    return_points = [index + 1 for index, line in enumerate(program) if line.instruction == "GSB" and index + 1 < len(program)]
+    all_labels = sorted(index for positions in labels.values() for index in positions)
+
+    following = []
+    for index, line in enumerate(program):
+        if line.instruction in ("GTO", "GSB"):
+            # A subroutine comes back through its RTN, so a GSB only leads to the subroutine
+            if is_indirect(line):
+                next_steps = all_labels
+            else:
+                target = label_target(labels, label_name(line.argument), index)
+                next_steps = [target] if target is not None else []
+        elif line.instruction == "RTN":
+            next_steps = return_points
+        elif line.instruction in SKIP_INSTRUCTIONS:
+            next_steps = [step for step in (index + 1, index + 2) if step < len(program)]
+        else:
+            next_steps = [index + 1] if index + 1 < len(program) else []
+        following.append(next_steps)
+    return following
+
+
+def reachable_steps(program, entries, labels=None, into_subroutines=True, stop_at=frozenset()):
+    # Returns the set of indexes of the steps that can run from the entries
+    # A GSB leads to its subroutine and to the step after it (where the subroutine returns to), and a RTN ends the walk
+    # Without into_subroutines, only the steps of the routine itself are walked: a GSB only leads to the step after it,
+    # and GTO I ends the walk (it can go to any label, including the subroutines)
+    # The steps in stop_at are reached, but the walk does not go on from them
+    if labels is None:
+        labels = label_positions(program)
+    all_labels = [index for positions in labels.values() for index in positions]
+    reached = set()
+    pending = list(entries)
+    while pending:
+        index = pending.pop()
+        if index in reached or index >= len(program):
+            continue
+        reached.add(index)
+        if index in stop_at:
+            continue
+        line = program[index]
+        if line.instruction in ("GTO", "GSB"):
+            if line.instruction == "GSB":
+                pending.append(index + 1)
+                if not into_subroutines:
+                    continue
+            if is_indirect(line):
+                if into_subroutines:
+                    pending.extend(all_labels) # I can hold any label
+            else:
+                target = label_target(labels, label_name(line.argument), index)
+                if target is not None:
+                    pending.append(target)
+        elif line.instruction == "RTN":
+            continue
+        elif line.instruction in SKIP_INSTRUCTIONS:
+            pending.extend((index + 1, index + 2))
+        else:
+            pending.append(index + 1)
+    return reached
+
+
+def entry_points(program, labels=None):
+    # Steps a program can be started from: the first step, and any label (e.g. GSB A from the keyboard)
+    if labels is None:
+        labels = label_positions(program)
+    return sorted({0, *(index for positions in labels.values() for index in positions)}) if program else []
@@ -0,0 +1,52 @@
+import json
+from collections import namedtuple
+
+# Structured diagnostics for the command line (jovial --all-errors / --diagnostics json)
+# Each problem found while assembling is recorded as a Diagnostic instead of stopping the assembler,
+# so every error in a program can be reported by a single run
+# line and column are 1-based, and None if the problem is not tied to a place in the source (e.g. the initial settings)
+
+Diagnostic = namedtuple("Diagnostic", ["file", "line", "column", "severity", "code", "message"])
+
+ERROR = "error"
+WARNING = "warning"
+
+SETTINGS_WARNING_CODE = "W001" # An initial setting was changed to fit the other settings
+
+DIAGNOSTIC_FORMATS = ["human", "json"]
+
+
+def diagnostic_from_error(error, file_name):
+    return Diagnostic(file_name, error.line_number, error.column, ERROR, error.code, error.message)
+
+
+def has_errors(diagnostics):
+    return diagnostics is not None and any(diagnostic.severity == ERROR for diagnostic in diagnostics)
+
+
+def format_diagnostic(diagnostic):
+    # file:line:column: severity code: message (the usual compiler format, which most editors can jump to)
+    location = diagnostic.file if diagnostic.file is not None else "jovial"
+    if diagnostic.line is not None:
+        location += f":{diagnostic.line}"
+        if diagnostic.column is not None:
+            location += f":{diagnostic.column}"
+    return f"{location}: {diagnostic.severity} {diagnostic.code}: {diagnostic.message}"
+
+
+def write_diagnostics(diagnostics, diagnostics_format, output_file):
+    errors = sum(diagnostic.severity == ERROR for diagnostic in diagnostics)
+    if diagnostics_format == "json":
+        report = {
+            "errors": errors,
+            "warnings": len(diagnostics) - errors,
+            "diagnostics": [diagnostic._asdict() for diagnostic in diagnostics],
+        }
+        json.dump(report, output_file, indent=2)
+        output_file.write("\n")
+    else:
+        for diagnostic in diagnostics:
+            print(format_diagnostic(diagnostic), file=output_file)
+        if errors:
+            print(f"{errors} error{'s' if errors != 1 else ''} found", file=output_file)
+    output_file.flush()
@@ -0,0 +1,168 @@
+import logging
+import os
+import sys
+import time
+from collections import namedtuple
+
+from Assembler_Errors import AssemblerError
+from Calculator_State import CalculatorState
+from Label_Allocator import is_label_reference
+from Lexer import tokenize_line
+from Output import output_all
+from Parse_File import check_program_length, finish_program, check_register_partition, parse_line, read_source_lines
+from Register_Allocator import is_register_reference
+
+# Incremental assembly for watch mode (jovial --watch)
+# Each line is parsed on its own, starting from the mode the calculator is in when the line is reached (its incoming mode)
+# A line only depends on its text and its incoming mode, so its keystrokes are memoized on (line text, incoming mode)
+# After an edit, unchanged lines are reused as long as their incoming mode is unchanged. A line whose incoming base,
+# sign mode, or word size changed (e.g. after an edited HEX or a new float literal) is parsed again
+# The memory checks depend on the whole program, so they are run over the assembled lines after every edit
+
+# Everything parse_line reads from or writes to the calculator state, apart from the program and the memory
+# (previous_step is the last step of the program before the line, which decides how a register above R31 is reached)
+Mode = namedtuple("Mode", ["sign_mode", "previous_sign_mode", "word_size", "base", "base_numeric", "index_register", "word_mode_known", "previous_step"])
+
+# The effect of one line: the keystrokes it adds, the mode after it, and the register it stores to or recalls from (if any)
+LineResult = namedtuple("LineResult", ["steps", "mode", "register", "line_tokens", "column"])
+
+WATCH_INTERVAL = 0.1 # Seconds between checks for changes to the input file
+
+
+def mode_of(calculator_state):
+    previous_step = calculator_state.program[-1] if calculator_state.program else None
+    return Mode(calculator_state.sign_mode, calculator_state.previous_sign_mode, calculator_state.word_size, calculator_state.base, calculator_state.base_numeric,
+        calculator_state.index_register, calculator_state.word_mode_known, previous_step)
+
+
+def steps_at_line(steps, input_line_number):
+    # A reused line can have moved since it was parsed, so its named label and register steps get its current line number
+    # (the allocators report their errors at the line of the step)
+    return [step._replace(line_number=input_line_number)
+        if (is_label_reference(step) or is_register_reference(step)) and step.line_number != input_line_number else step
+        for step in steps]
+
+
+class IncrementalAssembler:
+    def __init__(self, sign_mode=None, word_size=None, base=None, optimize=False):
+        self.sign_mode = sign_mode
+        self.word_size = word_size
+        self.base = base
+        self.optimize = optimize # Enter number literals with the fewest keys (the peephole rules run on the whole program)
+        self.line_results = {} # (line text, incoming mode) -> LineResult, for the lines of the last assembly
+        self.lines_parsed = 0 # Lines parsed by the last assembly (the rest were reused)
+
+    def assemble(self, lines, input_file_name, trace_memory=False):
+        # Returns a CalculatorState holding the assembled program, as parse_lines would
+        calculator_state = CalculatorState(self.sign_mode, self.word_size, self.base)
+        calculator_state.input_file_name = input_file_name
+        calculator_state.memory_trace = [] if trace_memory else None
+        calculator_state.check_initial_settings()
+
+        # Parse (or reuse) every line, threading the mode from one line to the next
+        mode = mode_of(calculator_state)
+        line_results = {}
+        results = []
+        self.lines_parsed = 0
+        parse_error = None
+        for input_line_number, line in enumerate(lines, start=1):
+            key = (line, mode)
+            result = self.line_results.get(key) or line_results.get(key)
+            if result is None:
+                try:
+                    result = self.parse_line(line, input_line_number, mode)
+                except AssemblerError as error:
+                    if error.line_number is None:
+                        error.line_number = input_line_number
+                    parse_error = error
+                    break
+                self.lines_parsed += 1
+            line_results[key] = result
+            results.append(result)
+            mode = result.mode
+        self.line_results = line_results # Only keep the lines of the current version of the program
+
+        # Account for memory in line order, so the first error in the program is the one reported
+        for input_line_number, result in enumerate(results, start=1):
+            if result.register is not None:
+                check_register_partition(result.register, calculator_state, result.line_tokens, input_line_number, result.column)
+            calculator_state.program.extend(steps_at_line(result.steps, input_line_number))
+            try:
+                if result.register is not None:
+                    calculator_state.use_register(result.register)
+                calculator_state.update_program_length()
+                calculator_state.update_memory()
+                calculator_state.trace_memory(input_line_number)
+            except AssemblerError as error:
+                error.line_number = input_line_number
+                raise
+            check_program_length(calculator_state, input_line_number)
+
+        if parse_error is not None:
+            raise parse_error
+        calculator_state.optimize = self.optimize
+        finish_program(calculator_state) # The optimizer and the allocators work on the whole program, so they run after every edit
+
+        calculator_state.sign_mode, calculator_state.previous_sign_mode, calculator_state.word_size, calculator_state.base, calculator_state.base_numeric, calculator_state.index_register, calculator_state.word_mode_known, _ = mode
+        return calculator_state
+
+    def parse_line(self, line, input_line_number, mode):
+        # Parse the line on its own, starting from the incoming mode
+        line_state = CalculatorState()
+        line_state.sign_mode, line_state.previous_sign_mode, line_state.word_size, line_state.base, line_state.base_numeric, line_state.index_register, line_state.word_mode_known, previous_step = mode
+        line_state.optimize = self.optimize
+        if previous_step is not None:
+            line_state.program.append(previous_step)
+        parse_line(line, input_line_number, line_state)
+        steps = line_state.program[1:] if previous_step is not None else line_state.program
+
+        register = next(iter(line_state.registers_used)) if line_state.registers_used else None
+        line_tokens = None
+        column = None
+        if register is not None:
+            # Kept to report a register outside of the memory partition, which depends on the rest of the program
+            tokens = tokenize_line(line, input_line_number)
+            line_tokens = [token.text for token in tokens]
+            column = tokens[-1].column
+        return LineResult(tuple(steps), mode_of(line_state), register, line_tokens, column)
+
+
+def watch(calculator_state):
+    # Reassemble the input file every time it is saved, until interrupted
+    assembler = IncrementalAssembler(calculator_state.sign_mode, calculator_state.word_size, calculator_state.base_numeric, calculator_state.optimize)
+    input_file_name = calculator_state.input_file_name
+    print(f"Watching {input_file_name} for changes (press Ctrl+C to stop)", file=sys.stderr, flush=True)
+
+    last_modified = None
+    try:
+        while True:
+            try:
+                modified = os.stat(input_file_name).st_mtime_ns
+            except FileNotFoundError:
+                modified = None # Editors often replace the file when saving, so it can briefly be missing
+
+            if modified is not None and modified != last_modified:
+                last_modified = modified
+                assemble_watched_file(assembler, input_file_name, calculator_state.output_files)
+            time.sleep(WATCH_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def assemble_watched_file(assembler, input_file_name, output_files):
+    start = time.perf_counter()
+    try:
+        lines = list(read_source_lines(input_file_name))
+        program_state = assembler.assemble(lines, input_file_name)
+    except AssemblerError as error:
+        logging.error(error)
+        return None
+    assembly_time = (time.perf_counter() - start) * 1000
+
+    # Report the memory use before writing the outputs, which take longer (especially PDFs)
+    print(f"{time.strftime('%H:%M:%S')} Assembled in {assembly_time:.1f} ms (parsed {assembler.lines_parsed} of {len(lines)} lines): "
+        f"{program_state.program_length} Bytes, memory partition @ {program_state.memory_partition} Bytes, "
+        f"{len(program_state.registers_used)} registers of {program_state.available_registers} available", flush=True)
+    output_all(program_state, output_files)
+    return program_state
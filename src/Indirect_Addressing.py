@@ -0,0 +1,59 @@
+from Assembler_Errors import AddressRangeError
+from Control_Flow import is_skip
+from Literal_Encoder import can_enter, digits_of, literal_word_mode, shortest_integer_keys
+from Register_Allocator import DIRECT_REGISTERS
+
+# Indirect addressing for registers above R31 (sto 40, rcl 100)
+# STO and RCL only reach R0-R31 directly. The registers above them are reached through (i), the register whose number
+# is held in I, so sto 40 is assembled as:
+#   ENTER 40 STO I Rv STO (i)
+# ENTER lifts the stack and copies X into Y, and the index is then entered over X whatever the stack lift was before
+# (entering it straight after CLx, ENTER, a label, or a number being entered would overwrite X or add to the number
+# instead of lifting). STO I stores it, and Rv rolls the stack back down so X, Y and Z are as they were, and T holds the index
+#
+# The assembler keeps track of the value in I as it goes, so a second access to the same register only needs STO (i)
+# or RCL (i). I is forgotten at every label (it can be reached from anywhere), after a GSB (the subroutine can change it),
+# and after any instruction that changes I
+
+# Instructions that change I, or leave its value unknown
+CHANGES_INDEX = frozenset(["DSZ", "ISZ", "X<=>I", "LBL", "GSB", "CLEAR REG"])
+
+
+def is_indirect_register(argument):
+    return argument.isdigit() and int(argument) >= DIRECT_REGISTERS
+
+
+def track_index_register(line, calculator_state):
+    # Forget the value in I after a step that can change it
+    if line.instruction in CHANGES_INDEX or (line.instruction == "STO" and line.argument == "I"):
+        calculator_state.index_register = None
+
+
+def index_keys(register, calculator_state):
+    # The keys that enter the register number in the current base (with the fewest keys under -O)
+    base = calculator_state.base_numeric
+    if calculator_state.sign_mode == 3:
+        return [(digit, None) for digit in str(register)] # Floating point mode only enters decimal numbers
+    if calculator_state.word_size is not None and not can_enter(register, base, calculator_state.word_size, calculator_state.sign_mode):
+        return None
+    digits = digits_of(register, base)
+    if calculator_state.optimize:
+        keys, _ = shortest_integer_keys(digits, base, False, base, False, *literal_word_mode(calculator_state))
+        return keys
+    return [(digit, None) for digit in digits]
+
+
+def indirect_register_keys(mnemonic, register, calculator_state, line_tokens, input_line_number, column):
+    # Returns the keys for a STO or RCL of a register above R31, and records the value left in I
+    if calculator_state.index_register == register:
+        return [(mnemonic, "(i)")]
+
+    # A test skips only the next step, so it cannot skip the whole sequence
+    if calculator_state.program and is_skip(calculator_state.program[-1]):
+        raise AddressRangeError(f"Error - Indirect register after a test: R{register} takes several steps to reach, so it cannot be the step a test skips. Line: {line_tokens}", input_line_number, column)
+
+    digits = index_keys(register, calculator_state)
+    if digits is None:
+        raise AddressRangeError(f"Error - Register out of range: R{register} cannot be entered in a {calculator_state.word_size}-bit word to put it in I. Line: {line_tokens}", input_line_number, column)
+
+    return [("enter", None)] + digits + [("sto", "i"), ("rv", None), (mnemonic, "(i)")]
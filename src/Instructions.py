@@ -1,58 +1,55 @@
-import sys
 import logging
 
-from Utils import is_number
+from Assembler_Errors import AddressRangeError, InvalidArgumentError, InvalidInstructionError
 from Instructions_Data import *
 
-# Class definition for an input object
-# This object will be used to store the input data
-# Each line of the input file will be stored in an object of this class
-# The object will have all of the necessary attributes to store the data and print it in the desired format, including pseudo-instructions
-class instr:
-    # Attributes
-    calculator_state = None # Calculator state
-
-    instruction_or_number = False # True if instruction, False if number
-    has_argument = False
-    has_modifier = False
-
-    modifier = None # Modifier for the instruction
-    instruction = None # Instruction
-    argument = None # Argument for the instruction
+# Keys that enter a digit, rather than an instruction
+DIGIT_KEYS = frozenset("0123456789ABCDEF")
+# Arguments that are hexadecimal digits, e.g. the A in LBL A
+HEX_DIGIT_ARGUMENTS = frozenset("abcdef")
 
-    modifier_position = None # Position of the modifier in the instruction
-    instruction_position = None # Position of the instruction in the instruction
-    argument_position = None # Position of the argument in the instruction
-
-
-    def __init__(self, instr, arg, calculator_state):
-        logging.debug(f"Creating instruction object with instruction: {instr} and argument: {arg}")
-        
-        self.calculator_state = calculator_state
+# Class definition for a keystroke record
+# Each program step is stored as one of these records, with all of the necessary attributes to print it in the desired format, including pseudo-instructions
+# Records are flyweights: the opcode table holds one record per distinct (instruction, argument) pair, shared between every program,
+# so an assembled step only costs a reference in the program list. Records must never be modified after they are created
+class instr:
+    __slots__ = (
+        "instruction_or_number", # True if instruction, False if number
+        "has_argument",
+        "has_modifier",
+        "modifier", # Modifier for the instruction
+        "instruction", # Instruction
+        "argument", # Argument for the instruction
+        "modifier_position", # Position of the modifier in the instruction
+        "instruction_position", # Position of the instruction in the instruction
+        "argument_position", # Position of the argument in the instruction
+        "key", # (instruction, argument) as passed to keystroke(), which recreates this record
+    )
+
+    def __init__(self, instr, arg):
+        # Encode the keystroke (only runs while the opcode table is built, or for unusual argument spellings)
+        self.key = (instr, arg)
         self.has_argument = False
+        self.has_modifier = False
+        self.modifier = None
+        self.modifier_position = None
+        self.argument_position = None
         self.instruction_or_number = True # Always an instruction if an argument is provided
-        if arg is not None and is_number(arg):
-            if arg in 'abcdef':
-                self.argument = arg.upper()
-            else:
-                self.argument = arg       
+        if arg in HEX_DIGIT_ARGUMENTS:
+            self.argument = arg.upper()
         else:
             self.argument = arg
         # Check is argument is not None
 
         if(self.argument is None):
-            if(is_number(instr)): # If the token is a number
-                logging.debug(f"Validating number: {instr} with no argument and getting position.")
+            if(instr.upper() in DIGIT_KEYS): # If the token is a digit
                 self.instruction_or_number = False
-                self.has_modifier = False
                 self.instruction = instr
                 self.instruction_position = instr
             else: # If the token is an instruction
-                logging.debug(f"Validating instruction: {instr} with no argument and getting position.")
                 self.instruction = self.check_for_instruction(instr)
                 self.instruction_position = self.get_instruction_position()
         else: # If the token is an instruction with an argument
-            logging.debug(f"Validating instruction: {instr} with argument: {arg} and getting position.")
             self.instruction = self.check_for_instruction(instr)
             self.instruction_position = self.get_instruction_position()
             self.instruction_or_number = True
@@ -68,8 +65,6 @@ class instr:
         if(self.has_modifier):
             self.modifier_position = self.get_modifier_position()
 
-        logging.debug(f"Instruction object created with instruction: {self.instruction} and argument: {self.argument} and modifier: {self.modifier}")
-
 
     # Methods
     def __str__(self):
@@ -88,60 +83,43 @@ class instr:
     def check_for_instruction(self, mnemonic):
         mnemonic = mnemonic.lower()
         if mnemonic in mnemonic_to_instr:
-            logging.debug(f"Mnemonic: {mnemonic} is valid. Instruction: {mnemonic_to_instr[mnemonic]}")
             return mnemonic_to_instr[mnemonic]
         else:
-            logging.critical(f"Error: Invalid mnemonic. {mnemonic} is not a valid mnemonic.")
-            sys.exit(1)
+            raise InvalidInstructionError(f"Error: Invalid mnemonic. {mnemonic} is not a valid mnemonic.")
 
     def check_for_modifier(self):
         if self.instruction_or_number == False: # If the token is a number
             return None
-        elif self.instruction in f_modifier_instrs:
-            return 'f'
-        elif self.instruction in g_modifier_instrs:
-            return 'g'
-        else:
-            return None
+        return modifier_keys.get(self.instruction)
 
     def get_instruction_position(self):
-        logging.debug(f"Getting instruction position for: {self.instruction} (with argument: {self.argument})")
         if self.instruction_or_number == False: # If the token is a number
             return self.instruction
         elif self.instruction in button_positions:
             return button_positions[self.instruction]
         elif self.instruction == "SHOW":
-            logging.debug(f"SHOW instruction: {self.instruction}, {self.argument}")
             if self.argument == "hex": return 23
             elif self.argument == "dec": return 24
             elif self.argument == "oct": return 25
             elif self.argument == "bin": return 26
             else:
-                logging.critical("Failed to find instruction position - SHOW passed with invalid argument")
-                sys.exit(1)
+                raise InvalidArgumentError("Failed to find instruction position - SHOW passed with invalid argument")
         elif self.instruction == "CLEAR":
             if self.argument == "reg": return 34
             else: 
-                logging.critical("Failed to find instruction position - CLEAR passed with invalid argument")
-                sys.exit(1)
+                raise InvalidArgumentError("Failed to find instruction position - CLEAR passed with invalid argument")
         else:
-            raise ValueError("Failed to find instruction position")
+            raise InvalidInstructionError("Failed to find instruction position")
     
     def get_argument_position(self):
-        logging.debug(f"Getting argument position for: {self.argument}")
-        if is_number(self.argument):
-            logging.debug("Argument is a number")
+        if self.argument.isdigit() or self.argument in DIGIT_KEYS:
             if self.instruction == 'STO' or self.instruction == 'RCL':
-                logging.debug(f"Returning argument position for a register: {self.argument}")
                 self.convert_index()
             if self.argument in 'abcdef':
-                logging.debug(f"Returning argument position for a hexadecimal digit: {self.argument.upper()}")
                 return button_positions[self.argument.upper()]
             else:
-                logging.debug(f"Returning argument position for digit: {self.argument}")
                 return self.argument
         elif self.argument == 'hex' or self.argument == 'dec' or self.argument == 'oct' or self.argument == 'bin' or self.argument == 'reg':
-            logging.debug(f"Special instruction argument: {self.instruction}, {self.argument}")
             pos = button_positions[self.argument.upper()]
             if self.instruction == 'SHOW':
                 self.instruction = 'SHOW ' + self.argument.upper()
@@ -158,11 +136,9 @@ class instr:
             self.argument = 'I'
             return button_positions[self.argument]
         elif self.argument in button_positions:
-            logging.debug(f"Returning argument position: {button_positions[self.argument]}")
             return button_positions[self.argument]
         else:
-            logging.critical("Failed to find argument position")
-            sys.exit(1)
+            raise InvalidArgumentError("Failed to find argument position")
     
     def get_modifier_position(self):
         if self.modifier == 'f':
@@ -187,6 +163,64 @@ class instr:
             self.argument = '1' + chr(number - 26 + ord('A'))
             self.argument_position = '.' + chr(number - 26 + ord('A'))
         else:
-            logging.critical("Error: Invalid register index. Must be between 0 and 31")
-            logging.critical(f"Line: {self.instruction, self.argument}")
-            sys.exit(1)
\ No newline at end of file
+            raise AddressRangeError(f"Error: Invalid register index. Must be between 0 and 31. Line: {self.instruction, self.argument}")
+
+
+# Modifier key of every shifted instruction
+modifier_keys = {instruction: 'f' for instruction in f_modifier_instrs} | {instruction: 'g' for instruction in g_modifier_instrs}
+
+def build_opcode_table():
+    # Encode every canonical (instruction, argument) pair once, so encoding an instruction is a single dict lookup
+    # The records are flyweights shared by every program
+    validate_instruction_data()
+
+    opcode_table = {}
+    for mnemonic in mnemonic_to_instr:
+        if mnemonic in instruction_arguments:
+            for argument in instruction_arguments[mnemonic]:
+                opcode_table[(mnemonic, argument)] = instr(mnemonic, argument)
+        elif mnemonic not in instructions_with_arguments:
+            opcode_table[(mnemonic, None)] = instr(mnemonic, None)
+    for key in number_entry_keys:
+        opcode_table[(key, None)] = instr(key, None)
+
+    validate_opcode_table(opcode_table)
+    return opcode_table
+
+def validate_instruction_data():
+    # Raise ValueError for duplicate or conflicting entries in Instructions_Data
+    for modifier, instructions in (('f', f_modifier_instrs), ('g', g_modifier_instrs)):
+        duplicates = {instruction for instruction in instructions if instructions.count(instruction) > 1}
+        if duplicates:
+            raise ValueError(f"Duplicate {modifier} modifier instructions: {sorted(duplicates)}")
+    both_modifiers = set(f_modifier_instrs) & set(g_modifier_instrs)
+    if both_modifiers:
+        raise ValueError(f"Instructions with both an f and a g modifier: {sorted(both_modifiers)}")
+    for mnemonic in instruction_arguments:
+        if mnemonic not in instructions_with_arguments:
+            raise ValueError(f"Arguments listed for an instruction that does not take an argument: {mnemonic}")
+    for mnemonic in instructions_with_arguments:
+        if mnemonic not in instruction_arguments:
+            raise ValueError(f"No arguments listed for an instruction that takes an argument: {mnemonic}")
+
+def validate_opcode_table(opcode_table):
+    # Two different keystrokes must never encode to the same key codes
+    keystrokes = {}
+    for key, record in opcode_table.items():
+        keycodes = (record.modifier_position, str(record.instruction_position).strip(), str(record.argument_position).strip() if record.has_argument else None)
+        keystroke_name = (record.instruction, record.argument)
+        if keystrokes.setdefault(keycodes, keystroke_name) != keystroke_name:
+            raise ValueError(f"Conflicting opcode table entries: {keystrokes[keycodes]} and {keystroke_name} both encode to {keycodes}")
+
+opcode_table = build_opcode_table()
+
+def keystroke(instruction, argument=None):
+    # Returns the shared record for the keystroke
+    record = opcode_table.get((instruction, argument))
+    if record is None and argument is not None and argument.isdigit():
+        argument = str(int(argument)) # Other spellings of a number (e.g. sto 07) share the record of the canonical one
+        record = opcode_table.get((instruction, argument))
+    if record is None:
+        # Not cached, so a long running process (jovial serve) does not keep a record for every argument it is sent
+        record = instr(instruction, argument)
+    return record
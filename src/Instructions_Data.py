@@ -240,8 +240,6 @@ mnemonic_to_instr = {
     'clx': 'CLx',
     'sto': 'STO',
     'rcl': 'RCL',
-    '(i)': '(i)',
-    'i': 'I',
     'sf': 'SF',
     'cf': 'CF',
     'lbl': 'LBL',
@@ -309,4 +307,25 @@ instructions_with_arguments = [
     'float',
     'window',
     'clear'
-]
\ No newline at end of file
+]
+
+# Canonical spelling of every argument each instruction accepts, used to precompute the opcode table
+register_arguments = [str(number) for number in range(32)] + ['i', '(i)']
+label_arguments = [str(number) for number in range(16)] + list('abcdef') + ['i', '(i)']
+instruction_arguments = {
+    'sto': register_arguments,
+    'rcl': register_arguments,
+    'sf': [str(number) for number in range(6)],
+    'cf': [str(number) for number in range(6)],
+    'f?': [str(number) for number in range(6)],
+    'lbl': label_arguments,
+    'gto': label_arguments,
+    'gsb': label_arguments,
+    'show': ['hex', 'dec', 'oct', 'bin'],
+    'float': [str(number) for number in range(10)] + ['.'],
+    'window': [str(number) for number in range(8)],
+    'clear': ['reg'],
+}
+
+# Keys the parser enters on its own when it expands a number literal
+number_entry_keys = list('0123456789ABCDEF') + ['.', 'CHS', 'EEX', 'FLOAT', 'HEX', 'DEC', 'OCT', 'BIN']
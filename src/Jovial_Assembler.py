@@ -14,9 +14,17 @@ The Jovial Assembler is a single-pass assembler featuring:
 - Warnings for carry and out-of-range errors and other issues if the initial mode settings are supplied. 
 - Support for throwing errors if the program is too large for the memory.
 - Support for throwing errors if addresses are out of range.
-- Support for directly addressing the first 32 storage registers in decimal.
+- Support for directly addressing the first 32 storage registers in decimal, and the rest through the index register.
+- Named registers (sto @limit) and labels (lbl @loop), allocated once the whole program is parsed.
+- Linking several modules into one program (--link), dropping the subroutines nothing calls.
 - Support for detecting if subroutines are nested more than 4 levels deep.
 - Support for pseudo-instructions to simplify certain operations.
+- Batch assembly of whole directories of programs across a pool of worker processes.
+- A server mode that keeps one warm process and answers assemble requests sent as JSON lines.
+- Streaming assembly from stdin to stdout (-i - -o -), including streams of several programs.
+- A watch mode that reassembles a program on every save, only parsing the lines that changed.
+- Reporting every error in a program in one run (--all-errors), as text or JSON diagnostics.
+- An optional peephole optimizer (-O) that removes steps which cannot change what the program computes.
 
 The Jovial Assembler is written in Python 3.12.3 and developed by Alex Melnick.
 '''
@@ -25,77 +33,117 @@ The Jovial Assembler is written in Python 3.12.3 and developed by Alex Melnick.
 import sys
 import logging
 
-from Calculator_State import CalculatorState
+from Assembler_Errors import AssemblerError
+from Batch_Assembly import assemble_batch
+from Calculator_State import PRGM_MEMORY_AVAILABLE, CalculatorState
+from Call_Graph import MAX_SUBROUTINE_DEPTH
+from Register_Allocator import INDEX_REGISTER
+from Diagnostics import has_errors, write_diagnostics
 from Output import *
 from Parse_Arguments import *
 from Parse_File import *
-
-# CONSTANTS
-PRGM_MEMORY_AVAILABLE = 203 # Number of bytes available in memory for the program
+from Stream_Assembly import assemble_stream
+from Utils import setup_logging
 
 def main():
-    input_file = None # File object for the input file
+    # Keep one warm process that answers assemble requests (jovial serve)
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        from Assembler_Server import serve # Only needed in server mode
+        args = parse_serve_arguments(sys.argv[2:])
+        setup_logging(args.debug)
+        sys.exit(serve(args.port))
+
     calculator_state = CalculatorState() # Create a new instance of the CalculatorState
 
     parse_arguments(calculator_state) # Parse the command line arguments
 
     # Set up logging configuration
-    myFormat = logging.Formatter('%(levelname)s - %(filename)s - %(funcName)s - %(message)s')
-    
-    # Create a console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(calculator_state.logger_level)
-    console_handler.setFormatter(myFormat)
-    
-    # Get the root logger
-    logger = logging.getLogger()
-    logger.setLevel(calculator_state.logger_level)
-
-    # Check if the logger already has handlers
-    if not logger.handlers:
-        logger.addHandler(console_handler)
-
-
-    # Open the input file, read it, then close it
-    logging.info(f"Opening file: {calculator_state.input_file_name} of type {str(type(calculator_state.input_file_name))}")
-    input_file = open(calculator_state.input_file_name, "r") # Open the file in read mode
-    assembly_code = input_file.readlines() # Read all the lines of the input file into a list
-    input_file.close()
-
-    # Assemble the code into "bare" keypress sequences
-    for input_line_number, line in enumerate(assembly_code):
-        # Parse the line and get the keypresses
-        adjusted_line_no = input_line_number+1
-        logging.info(f"Parsing line: {line} (line number: {adjusted_line_no}")
-        parse_line(line, input_line_number+1, calculator_state)
-
-        # Update the program length and memory partition
-        calculator_state.update_program_length()
-        calculator_state.update_memory()
-
-        # Check if the program is too large for the memory
-        if calculator_state.program_length > PRGM_MEMORY_AVAILABLE:
-            logging.critical("Error - Out of Memory: This program is too large for the memory.")
-            logging.critical(f"Memory overflowed at line {adjusted_line_no} (the HP-16C only has 203 Bytes of memory).")
-            logging.critical("Remember, the best art is made under the tightest constraints!")
+    setup_logging(calculator_state.logger_level)
+
+    # Assemble every file in a directory or glob pattern
+    if calculator_state.batch_mode:
+        sys.exit(assemble_batch(calculator_state))
+
+    # Reassemble the input file every time it is saved
+    if calculator_state.watch:
+        from Incremental_Assembly import watch # Only needed in watch mode
+        sys.exit(watch(calculator_state))
+
+    # Stats go to stderr when the program itself or the JSON diagnostics are written to stdout
+    program_to_stdout = any(output_file_name == STDOUT_NAME for _, output_file_name in calculator_state.output_files)
+    stats_file = sys.stderr if program_to_stdout or calculator_state.diagnostics_format == "json" else sys.stdout
+
+    try:
+        # Assemble each program in the input as it is read, and output it in every desired format
+        if calculator_state.link_input_files is not None:
+            from Linker import link_modules # Only needed when linking
+            programs = link_modules(calculator_state)
+        else:
+            programs = assemble_stream(calculator_state)
+        for program_state, output_files in programs:
+            print_stats(program_state, output_files, stats_file)
+            if program_state.memory_trace is not None:
+                print_memory_trace(program_state.memory_trace, stats_file)
+    except AssemblerError as error:
+        logging.critical(error)
+        sys.exit(1)
+
+    if calculator_state.profiler is not None:
+        calculator_state.profiler.print_report(stats_file)
+
+    if calculator_state.diagnostics is not None:
+        # Errors go to stderr, JSON goes to stdout for tools to read (unless the program is written there)
+        diagnostics_file = sys.stdout if calculator_state.diagnostics_format == "json" and not program_to_stdout else sys.stderr
+        write_diagnostics(calculator_state.diagnostics, calculator_state.diagnostics_format, diagnostics_file)
+        if has_errors(calculator_state.diagnostics):
             sys.exit(1)
 
-
-    # Output the assembled code in the desired format
-    if(calculator_state.output_mode == "16c"):
-        output_16c(calculator_state)
-    elif(calculator_state.output_mode == "txt"):
-        output_txt(calculator_state)
-    elif(calculator_state.output_mode == "pdf"):
-        output_pdf(calculator_state)
-
+def print_stats(calculator_state, output_files, stats_file):
     # Return some useful information to the user
-    print(f"Assembly complete! The program has been output to {calculator_state.output_file_name}.{calculator_state.output_mode}")    
-    print("Stats:".ljust(80, '.'))
-    print(f"Calculator status (at end of program): {calculator_state.sign_mode} mode, {calculator_state.word_size}-bit words, {calculator_state.base} base")
-    print(f"Program length: {calculator_state.program_length} Bytes")
-    print(f"Registers used: {len(calculator_state.registers_used)} registers of {calculator_state.available_registers} available")
-    print(f"Memory partition @ {calculator_state.memory_partition} Bytes")
+    output_file_names = ", ".join("stdout" if output_file_name == STDOUT_NAME else f"{output_file_name}.{output_mode}" for output_mode, output_file_name in output_files)
+    print(f"Assembly complete! The program has been output to {output_file_names}", file=stats_file)
+    print("Stats:".ljust(80, '.'), file=stats_file)
+    print(f"Calculator status (at end of program): {calculator_state.sign_mode} mode, {calculator_state.word_size}-bit words, {calculator_state.base} base", file=stats_file)
+    print(f"Program length: {calculator_state.program_length} Bytes", file=stats_file)
+    if calculator_state.linked_modules is not None:
+        modules = ", ".join(f"{input_file_name}: {kept} of {assembled} Bytes" for input_file_name, kept, assembled in calculator_state.linked_modules)
+        dropped = sum(assembled - kept for _, kept, assembled in calculator_state.linked_modules)
+        print(f"Linked modules: {modules} ({dropped} Bytes of unreachable code dropped)", file=stats_file)
+    if calculator_state.bytes_saved is not None:
+        rules = ", ".join(f"{rule_name}: {saved}" for rule_name, saved in calculator_state.bytes_saved.items())
+        print(f"Optimizer saved {sum(calculator_state.bytes_saved.values())} Bytes ({rules})", file=stats_file)
+    if calculator_state.subroutine_depth:
+        print(f"Subroutines nested: {calculator_state.subroutine_depth} of {MAX_SUBROUTINE_DEPTH} levels", file=stats_file)
+    print(f"Registers used: {len(calculator_state.registers_used)} registers of {calculator_state.available_registers} available", file=stats_file)
+    if calculator_state.register_allocation:
+        names = ", ".join(f"{name} = R{register}" if register != INDEX_REGISTER else f"{name} = I" for name, register in calculator_state.register_allocation.items())
+        print(f"Named registers: {names}", file=stats_file)
+    if calculator_state.label_allocation:
+        names = ", ".join(f"{name} = LBL {label}" + (f" through I (+{calculator_state.indirect_label_steps[name]} Bytes)" if name in calculator_state.indirect_label_steps else "")
+            for name, label in calculator_state.label_allocation.items())
+        labels_used = len(set(calculator_state.label_allocation.values()))
+        print(f"Named labels: {names} ({labels_used} of 16 labels)", file=stats_file)
+    print(f"Memory partition @ {calculator_state.memory_partition} Bytes", file=stats_file)
+
+def print_memory_trace(memory_trace, stats_file):
+    # Show the memory use after every line that adds to the program, marking the lines that move the memory partition
+    print("Memory trace:".ljust(80, '.'), file=stats_file)
+    print("Line  Program length  Memory partition  Registers available", file=stats_file)
+    previous_length = 0
+    previous_partition = PRGM_MEMORY_AVAILABLE
+    for entry in memory_trace:
+        if entry.program_length == previous_length and entry.memory_partition == previous_partition:
+            continue
+        available_registers = entry.available_registers if entry.available_registers is not None else "-"
+        crossed = "  <- partition moved" if entry.memory_partition != previous_partition else ""
+        print(f"{entry.line_number:4}  {entry.program_length:8} Bytes  {entry.memory_partition:10} Bytes  {available_registers:19}{crossed}", file=stats_file)
+        previous_length = entry.program_length
+        previous_partition = entry.memory_partition
 
 if __name__ == "__main__":
+    # Required for the batch mode process pool in the PyInstaller executable
+    # (multiprocessing is slow to import, so it is skipped when running from source)
+    if getattr(sys, 'frozen', False):
+        from multiprocessing import freeze_support
+        freeze_support()
     main()
\ No newline at end of file
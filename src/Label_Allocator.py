@@ -0,0 +1,160 @@
+import logging
+from collections import namedtuple
+
+from Assembler_Errors import InvalidArgumentError
+from Control_Flow import LABEL_DIGITS, is_conditional, is_indirect, label_name
+from Instructions import keystroke
+from Literal_Encoder import can_enter, digits_of
+from Register_Allocator import INDEX_REGISTER, is_register_name, uses_index
+
+# Label allocator for named labels (lbl @loop, gto @loop, gsb @loop)
+# The HP-16C has 16 labels (0-9 and A-F). A named label is given one of them once the whole program is parsed
+#
+# GTO and GSB search for their label from the step after them, wrapping around at the end of the program, so the same
+# label can be used for several names as long as no jump passes another LBL with the same number on its way to its own
+# (e.g. a loop label at the top of the program and another one further down can both be LBL 0)
+# Names with the most jumps get a label first, and each name gets the lowest label that none of the names sharing it
+# get in the way of. Labels the program uses by number (lbl 1, gto 1) are never given to a name
+#
+# When no label is free for a name, its jumps go through I by line number instead:
+#   ENTER <line> CHS STO I Rv GTO I
+# A negative number in I makes GTO I and GSB I jump to that line. ENTER and Rv keep X, Y and Z as for a register above R31,
+# and the jump costs 6 or more steps instead of 1. The LBL step is kept (with a label no jump is searching for), so the
+# place the jumps go to is still a label for the optimizer. A jump right after a test must be a single step, so it always
+# needs a label
+
+# A LBL, GTO or GSB step whose label has not been allocated yet (argument is the name, as on an instruction record)
+# The base, sign mode and word size at the step are kept to enter a line number if the jump has to go through I
+LabelReference = namedtuple("LabelReference", ["instruction", "argument", "line_number", "column", "base", "sign_mode", "word_size"])
+
+
+def is_label_name(argument):
+    return is_register_name(argument) # Labels are named the same way as registers, e.g. @loop
+
+
+def label_reference(mnemonic, name, line_number, column, calculator_state):
+    return LabelReference(mnemonic.upper(), name, line_number, column, calculator_state.base_numeric, calculator_state.sign_mode, calculator_state.word_size)
+
+
+def is_label_reference(line):
+    return type(line) is LabelReference
+
+
+def has_label_references(program):
+    return LabelReference in map(type, program) # Without a Python loop, as most programs have no named labels
+
+
+def label_argument(label):
+    # The argument that encodes a physical label (lbl 0, lbl a)
+    return label.lower()
+
+
+def on_search_path(start, target, index):
+    # True if a jump at start passes the step at index before it reaches the label at target
+    if start < target:
+        return start < index < target
+    return index > start or index < target # The search wraps around at the end of the program
+
+
+def line_jump_keys(reference, target_line):
+    # The keys that jump to a line through I, in the mode the calculator is in at the jump
+    if reference.sign_mode == 0:
+        raise InvalidArgumentError(f"Error - Out of labels: No label is free for {reference.argument}, and a jump through I needs a negative line number, which unsigned mode cannot enter", reference.line_number, reference.column)
+    base = 10 if reference.sign_mode == 3 else reference.base
+    if reference.word_size is not None and reference.sign_mode != 3 and not can_enter(target_line, base, reference.word_size, reference.sign_mode):
+        raise InvalidArgumentError(f"Error - Out of labels: No label is free for {reference.argument}, and line {target_line} does not fit in a {reference.word_size}-bit word to jump through I", reference.line_number, reference.column)
+
+    digits = [(digit, None) for digit in digits_of(target_line, base)]
+    return [("enter", None)] + digits + [("chs", None), ("sto", "i"), ("rv", None), (reference.instruction.lower(), "i")]
+
+
+def allocate_labels(calculator_state):
+    # Give every named label a physical label (or a jump through I), and replace its LBL, GTO and GSB steps with the real ones
+    # Returns {name: label} (empty if the program does not use named labels)
+    program = calculator_state.program
+    if not has_label_references(program):
+        return {}
+    definitions = {}
+    jumps = {}
+    for index, line in enumerate(program):
+        if not is_label_reference(line):
+            continue
+        if line.instruction == "LBL":
+            if line.argument in definitions:
+                raise InvalidArgumentError(f"Error - Duplicate label: {line.argument} is already defined on line {program[definitions[line.argument]].line_number}", line.line_number, line.column)
+            definitions[line.argument] = index
+        else:
+            jumps.setdefault(line.argument, []).append(index)
+    for name, indexes in jumps.items():
+        if name not in definitions:
+            first = program[indexes[0]]
+            raise InvalidArgumentError(f"Error - Undefined label: {name} is never defined with lbl {name}", first.line_number, first.column)
+
+    reserved = {label_name(line.argument) for line in program
+        if line.instruction in ("LBL", "GTO", "GSB") and not is_label_reference(line) and not is_indirect(line)}
+    free_labels = [label for label in LABEL_DIGITS if label not in reserved]
+
+    conditional = {name for name, indexes in jumps.items() if any(is_conditional(program, index) for index in indexes)}
+    through_index = set()
+
+    def passes(name, other):
+        # True if a jump to name passes the LBL of other (jumps through I do not search for a label)
+        if name in through_index:
+            return False
+        target = definitions[name]
+        return any(on_search_path(jump, target, definitions[other]) for jump in jumps.get(name, ()))
+
+    def conflicts(name, other):
+        return passes(name, other) or passes(other, name)
+
+    # Jumps after a test must get a label, then the names with the most jumps save the most steps by getting one
+    names = sorted(definitions, key=lambda name: (name not in conditional, -len(jumps.get(name, [])), definitions[name]))
+    sharing = {label: [] for label in free_labels}
+    allocation = {}
+    for name in names:
+        label = next((label for label in free_labels if not any(conflicts(name, other) for other in sharing[label])), None)
+        if label is None and name not in conditional and any(uses_index(line) for line in program):
+            # A jump through I would overwrite the value the program keeps there (a loop counter, or a register above R31)
+            line = program[definitions[name]]
+            counters = [counter for counter, register in calculator_state.register_allocation.items() if register == INDEX_REGISTER]
+            held = f"the loop counter {counters[0]}" if counters else "a value the program uses"
+            raise InvalidArgumentError(f"Error - Out of labels: No label is free for {name}, and its jumps cannot go through I, which holds {held}", line.line_number, line.column)
+        if label is None and name not in conditional:
+            # The jumps go by line number, so the LBL only has to stay out of the way of the other jumps
+            through_index.add(name)
+            label = next((label for label in free_labels if not any(conflicts(name, other) for other in sharing[label])), None)
+        if label is None:
+            line = program[definitions[name]]
+            raise InvalidArgumentError(f"Error - Out of labels: No label is free for {name} ({len(free_labels)} labels are not used by number)", line.line_number, line.column)
+        sharing[label].append(name)
+        allocation[name] = label
+        logging.info("Allocated label %s to %s%s", label, name, " (jumps through I)" if name in through_index else "")
+
+    # Jumps through I depend on the line of their label, which moves as the jumps before it grow, so lay the program out
+    # again until the lines stop changing (they only ever move down)
+    target_lines = {name: 0 for name in through_index}
+    while True:
+        laid_out = []
+        extra_steps = {name: 0 for name in through_index}
+        label_lines = {}
+        for line in program:
+            if not is_label_reference(line):
+                laid_out.append(line)
+            elif line.instruction == "LBL":
+                laid_out.append(keystroke("lbl", label_argument(allocation[line.argument])))
+                label_lines[line.argument] = len(laid_out) # Lines are numbered from 1
+            elif line.argument in through_index:
+                keys = line_jump_keys(line, target_lines[line.argument])
+                laid_out.extend(keystroke(instruction, argument) for instruction, argument in keys)
+                extra_steps[line.argument] += len(keys) - 1
+            else:
+                laid_out.append(keystroke(line.instruction.lower(), label_argument(allocation[line.argument])))
+        new_target_lines = {name: label_lines[name] for name in through_index}
+        if new_target_lines == target_lines:
+            break
+        target_lines = new_target_lines
+
+    calculator_state.program = laid_out
+    calculator_state.label_allocation = allocation
+    calculator_state.indirect_label_steps = extra_steps
+    return allocation
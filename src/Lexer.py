@@ -0,0 +1,74 @@
+import re
+from collections import namedtuple
+from enum import Enum
+
+from Instructions_Data import mnemonic_to_instr
+
+# Single pass tokenizer for Jovial source lines
+# Each line is scanned once with a compiled regular expression, which skips comments and records where each token is
+# The first token of a line is classified once into a mnemonic, an integer literal, or a float literal
+# The tokens after it are the arguments of the instruction
+
+
+class TokenKind(Enum):
+    MNEMONIC = "mnemonic" # An instruction, e.g. sto
+    INTEGER = "integer" # An integer literal with an optional base prefix, e.g. 0xff
+    FLOAT = "float" # A float literal with a decimal point or a negative exponent, e.g. 1.5e-3
+    ARGUMENT = "argument" # The argument of an instruction, e.g. the 1 in sto 1
+    INVALID = "invalid" # The first token of the line is not an instruction or a number
+
+
+# text is lowercased, base is the base prefix of an integer literal ("HEX", "DEC", "OCT", "BIN" or None)
+# column and end_column are 1-based, end_column is one past the last character of the token
+Token = namedtuple("Token", ["kind", "text", "base", "line", "column", "end_column"])
+
+# Comments start with // or ; and run to the end of the line. Tokens may contain a single / (e.g. 1/x, dbl/)
+TOKEN_PATTERN = re.compile(r"(?P<comment>//|;)|(?P<token>(?:[^\s;/]|/(?!/))+)")
+
+INTEGER_PATTERN = re.compile(r"-?(?:0(?P<prefix>[xbod]))?[0-9a-f]+")
+FLOAT_PATTERN = re.compile(r"-?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:e-?[0-9]+)?")
+
+BASE_PREFIXES = {
+    "x": "HEX",
+    "b": "BIN",
+    "o": "OCT",
+    "d": "DEC",
+}
+
+# A base prefix on its own is not a number
+BARE_PREFIXES = {"0x", "0b", "0o", "0d", "-0x", "-0b", "-0o", "-0d"}
+
+
+def tokenize_line(line, line_number):
+    # Returns the list of tokens on the line (empty for blank lines and comments)
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(line):
+        if match.lastgroup == "comment":
+            break
+
+        text = match.group().lower()
+        if len(tokens) == 0:
+            kind, base = classify_first_token(text)
+        else:
+            kind, base = TokenKind.ARGUMENT, None
+        tokens.append(Token(kind, text, base, line_number, match.start() + 1, match.end() + 1))
+
+    return tokens
+
+
+def classify_first_token(text):
+    # Returns (kind, base prefix) of the token at the start of a line
+    if text in mnemonic_to_instr:
+        return TokenKind.MNEMONIC, None
+
+    if text not in BARE_PREFIXES:
+        # Unprefixed integers may contain the hex digits a-f, and are entered as floats in floating point mode
+        match = INTEGER_PATTERN.fullmatch(text)
+        if match is not None:
+            prefix = match.group("prefix")
+            return TokenKind.INTEGER, BASE_PREFIXES[prefix] if prefix is not None else None
+
+        if FLOAT_PATTERN.fullmatch(text) is not None:
+            return TokenKind.FLOAT, None
+
+    return TokenKind.INVALID, None
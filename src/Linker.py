@@ -0,0 +1,191 @@
+import logging
+import os
+import re
+
+from Assembler_Errors import AssemblerError, InvalidArgumentError
+from Calculator_State import CalculatorState
+from Control_Flow import label_name, label_positions, reachable_steps
+from Diagnostics import diagnostic_from_error, has_errors
+from Label_Allocator import is_label_name
+from Lexer import TokenKind, tokenize_line
+from Output import output_all
+from Parse_File import check_program_length, check_register_partition, finish_program, parse_module, read_source_lines
+from Register_Allocator import DIRECT_REGISTERS, count_registers
+
+# Linker for programs made of several modules (jovial --link -i main.jov library.jov)
+# The modules are parsed one after the other and put together into one program, in the order they are given, so the first
+# module runs first and each module falls through into the next one unless it ends with RTN or GTO
+# Each module is parsed in the mode the module before it leaves the calculator in (e.g. after hex in main.jov, the 10 in
+# library.jov is 16), the same as if the modules were one file
+#
+# Named labels and registers (@sqrt, @count) are shared by every module, so a module calls a subroutine in another module
+# with gsb @sqrt, and passes values to it in named registers. Numbered labels and registers belong to the module that uses
+# them: when a module defines a label or uses a register that an earlier module already has, the module's own are renamed
+# (lbl 1 in library.jov becomes @library.1, sto 3 becomes @library.r3), and the allocators give them a free label or register
+# A numbered label that a module jumps to without defining it is the label of the earlier module that defines it
+#
+# Only the steps that can run from the entry points are kept: the linker follows GTO and GSB from the entry labels (the first
+# step and the labels of the first module by default) and drops every subroutine nothing reaches, so a library of routines
+# only costs the bytes a program uses out of the 203. The memory is checked once the program is linked, since a library
+# can be larger than the memory on its own
+
+LABEL_INSTRUCTIONS = ("lbl", "gto", "gsb")
+REGISTER_INSTRUCTIONS = ("sto", "rcl")
+
+
+def module_name(input_file_name, taken):
+    # The name that qualifies the renamed labels and registers of a module (e.g. @library.1), unique among the modules
+    stem = re.sub(r"[^a-z0-9_]", "_", os.path.splitext(os.path.basename(input_file_name))[0].lower())
+    if not re.match(r"[a-z_]", stem):
+        stem = f"_{stem}"
+    name = stem
+    count = 1
+    while name in taken:
+        count += 1
+        name = f"{stem}_{count}"
+    taken.add(name)
+    return name
+
+
+def numbered_symbols(input_file_name):
+    # Returns ({label: argument texts}, {label: argument texts} of the labels the module defines, {register: argument texts})
+    # for the numbered labels and the registers R0-R31 the module uses (argument texts as written, e.g. a and 10 for label A)
+    labels = {}
+    defined = {}
+    registers = {}
+    for input_line_number, line in enumerate(read_source_lines(input_file_name)):
+        tokens = tokenize_line(line, input_line_number + 1)
+        if len(tokens) != 2 or tokens[0].kind is not TokenKind.MNEMONIC:
+            continue
+        mnemonic, argument = tokens[0].text, tokens[1].text
+        if mnemonic in LABEL_INSTRUCTIONS and argument not in ("i", "(i)") and not is_label_name(argument):
+            if (argument.isdigit() and int(argument) < 16) or (len(argument) == 1 and argument in "abcdef"):
+                label = label_name(argument.upper())
+                labels.setdefault(label, set()).add(argument)
+                if mnemonic == "lbl":
+                    defined.setdefault(label, set()).add(argument)
+        elif mnemonic in REGISTER_INSTRUCTIONS and argument.isdigit() and int(argument) < DIRECT_REGISTERS:
+            registers.setdefault(int(argument), set()).add(argument)
+    return labels, defined, registers
+
+
+def rename_collisions(input_file_name, name, labels_taken, registers_taken):
+    # Returns the renames for a module ({(mnemonic, argument): name}), and adds its numbered labels and registers to the taken ones
+    labels, defined, registers = numbered_symbols(input_file_name)
+    renames = {}
+    for label in defined:
+        if label in labels_taken:
+            renamed = f"@{name}.{label.lower()}"
+            logging.info("Renaming label %s in %s to %s", label, input_file_name, renamed)
+            renames.update(((mnemonic, argument), renamed) for mnemonic in LABEL_INSTRUCTIONS for argument in labels[label])
+        else:
+            labels_taken.add(label)
+    for register, arguments in registers.items():
+        if register in registers_taken:
+            renamed = f"@{name}.r{register}"
+            logging.info("Renaming register %d in %s to %s", register, input_file_name, renamed)
+            renames.update(((mnemonic, argument), renamed) for mnemonic in REGISTER_INSTRUCTIONS for argument in arguments)
+    registers_taken.update(registers)
+    return renames
+
+
+def entry_steps(program, entry_labels, first_module_length):
+    # Returns the indexes the linked program can be started from
+    labels = label_positions(program)
+    if entry_labels is None:
+        # The first step, and the labels of the first module (e.g. GSB A from the keyboard)
+        return [0] + [index for positions in labels.values() for index in positions if index < first_module_length]
+
+    entries = []
+    for entry_label in entry_labels:
+        label = entry_label if is_label_name(entry_label) else label_name(entry_label.upper())
+        if label not in labels:
+            raise InvalidArgumentError(f"Error - Undefined entry label: {entry_label} is not defined in any module")
+        entries.extend(labels[label])
+    return entries
+
+
+def link_program(calculator_state, modules):
+    # Put the parsed modules together into calculator_state, drop the steps nothing reaches, and run the whole-program passes
+    program = [line for module_state in modules for line in module_state.program]
+    reached = reachable_steps(program, entry_steps(program, calculator_state.entry_labels, len(modules[0].program)))
+
+    linked_modules = []
+    kept_program = []
+    start = 0
+    for module_state in modules:
+        end = start + len(module_state.program)
+        kept = [program[index] for index in range(start, end) if index in reached]
+        linked_modules.append((module_state.input_file_name, len(kept), len(module_state.program)))
+        logging.info("Linked %s: kept %d of %d steps", module_state.input_file_name, len(kept), len(module_state.program))
+        kept_program.extend(kept)
+        start = end
+
+    last_module = modules[-1]
+    calculator_state.sign_mode = last_module.sign_mode
+    calculator_state.previous_sign_mode = last_module.previous_sign_mode
+    calculator_state.word_mode_known = last_module.word_mode_known
+    calculator_state.word_size = last_module.word_size
+    calculator_state.update_base(last_module.base)
+    calculator_state.program = kept_program
+    calculator_state.registers_used = set().union(*(module_state.registers_used for module_state in modules))
+    calculator_state.literal_bytes_saved = sum(module_state.literal_bytes_saved for module_state in modules)
+    calculator_state.linked_modules = linked_modules
+    count_registers(calculator_state, kept_program) # Dropped subroutines may have been the only use of a register
+
+    calculator_state.update_program_length()
+    calculator_state.update_memory()
+    finish_program(calculator_state)
+    calculator_state.update_program_length()
+    calculator_state.update_memory()
+    check_program_length(calculator_state, None)
+    for register in sorted(calculator_state.registers_used):
+        check_register_partition(register, calculator_state, [f"R{register}"], None)
+
+
+def link_modules(calculator_state):
+    # Link calculator_state.link_input_files into one program, and write it to every output file
+    # Yields (calculator state, output files) once the program is written, like assemble_stream, and raises AssemblerError
+    # for the first error (or adds the errors to calculator_state.diagnostics if errors are reported as diagnostics)
+    previous_module = calculator_state
+    module_names = set()
+    labels_taken = set()
+    registers_taken = set()
+    modules = []
+    link_diagnostics = []
+    for input_file_name in calculator_state.link_input_files:
+        module_state = CalculatorState(previous_module.sign_mode, previous_module.word_size, previous_module.base_numeric)
+        module_state.previous_sign_mode = previous_module.previous_sign_mode
+        module_state.word_mode_known = previous_module.word_mode_known
+        module_state.check_initial_settings() # The warnings were already reported for the first module
+        module_state.input_file_name = input_file_name
+        module_state.profiler = calculator_state.profiler # One profile for the whole link
+        module_state.optimize = calculator_state.optimize
+        try:
+            module_state.linked_names = rename_collisions(input_file_name, module_name(input_file_name, module_names), labels_taken, registers_taken)
+            parse_module(read_source_lines(input_file_name), module_state, link_diagnostics if calculator_state.all_errors else None, check_memory=False)
+        except AssemblerError as error:
+            if calculator_state.diagnostics is None:
+                raise
+            link_diagnostics.append(diagnostic_from_error(error, input_file_name))
+            if not calculator_state.all_errors:
+                break
+        modules.append(module_state)
+        previous_module = module_state
+
+    if not has_errors(link_diagnostics):
+        calculator_state.input_file_name = calculator_state.link_input_files[0]
+        try:
+            link_program(calculator_state, modules)
+        except AssemblerError as error:
+            if calculator_state.diagnostics is None:
+                raise
+            link_diagnostics.append(diagnostic_from_error(error, calculator_state.input_file_name))
+
+    if calculator_state.diagnostics is not None:
+        calculator_state.diagnostics.extend(link_diagnostics)
+        if has_errors(link_diagnostics):
+            return
+
+    output_all(calculator_state, calculator_state.output_files)
+    yield calculator_state, calculator_state.output_files
@@ -0,0 +1,166 @@
+from decimal import Decimal
+
+# Shortest encoding of number literals (part of jovial -O)
+# parse_number enters a literal one key per digit, in the base it was written in. With -O, the literal is entered with
+# whichever sequence of keys leaves the same value in X in the fewest program steps:
+#   Integers: the digits in any base (with the keys to switch base and back), the digits of the complement followed by
+#             NOT or CHS, or the width of a block of ones followed by MASKL or MASKR (e.g. 0xFFFF in a 16-bit word is 0 NOT)
+#   Floats:   plain or scientific notation, with the decimal point moved to shorten the exponent (e.g. 1000000 is 1 EEX 6)
+# The literal as written is always one of the candidates, and it is kept unless another candidate is strictly shorter
+# The calculator always ends up in the base the literal asked for, so the literals after it are entered the same way
+#
+# NOT, MASKL, and MASKR save X in LSTx, so an optimized literal can change LSTx. SB is not used, as it needs a second
+# stack level and would overwrite T
+
+BASE_KEYS = {2: "BIN", 8: "OCT", 10: "DEC", 16: "HEX"}
+DIGITS = "0123456789ABCDEF"
+
+# Instructions after which the word size or sign mode is no longer the one the program started in (floating point mode
+# is left with a 56-bit word in 2's complement). The literals after them only use the forms that do not depend on either
+CHANGES_WORD_MODE = frozenset(["WSIZE", "1's", "2's", "UNSGN", "FLOAT"])
+
+
+def digits_of(value, base):
+    text = ""
+    while True:
+        text = DIGITS[value % base] + text
+        value //= base
+        if value == 0:
+            return text
+
+
+def track_word_mode(line, calculator_state):
+    # Forget the word size and sign mode after a step that can change them
+    if line.instruction in CHANGES_WORD_MODE:
+        calculator_state.word_mode_known = False
+
+
+def literal_word_mode(calculator_state):
+    # The (word size, sign mode) the literals are encoded for, or (None, None) once the program may have changed them
+    if not calculator_state.word_mode_known:
+        return None, None
+    return calculator_state.word_size, calculator_state.sign_mode
+
+
+def can_enter(value, base, word_size, sign_mode):
+    # Digits entered in decimal are limited to the positive range of a signed word, other bases enter the bit pattern
+    if value >= 2 ** word_size:
+        return False
+    if base == 10 and sign_mode in (1, 2):
+        return value < 2 ** (word_size - 1)
+    return True
+
+
+def negate(value, word_size, sign_mode):
+    # The bit pattern CHS gives for the value: 1's complement negates every bit, unsigned and 2's complement use 2's complement
+    mask = 2 ** word_size - 1
+    if sign_mode == 1:
+        return ~value & mask
+    return -value & mask
+
+
+def integer_keys(digits, base, negative, incoming_base, target_base, leaving_float):
+    # The keys for a literal entered as digits in base, then left in target_base
+    keys = []
+    if leaving_float or base != incoming_base:
+        keys.append((BASE_KEYS[base], None))
+    keys.extend((digit, None) for digit in digits)
+    if negative:
+        keys.append(("CHS", None))
+    if base != target_base:
+        keys.append((BASE_KEYS[target_base], None))
+    return keys
+
+
+def shortest_integer_keys(digits, target_base, negative, incoming_base, leaving_float, word_size, sign_mode):
+    # Returns (the shortest list of (instruction, argument) keys for the integer literal, bytes saved)
+    # digits are uppercase, in target_base. incoming_base is the base the calculator is in before the literal,
+    # and leaving_float is True in floating point mode
+    as_written = integer_keys(digits, target_base, negative, incoming_base, target_base, leaving_float)
+    shortest = as_written
+    magnitude = int(digits, target_base)
+
+    def consider(keys):
+        nonlocal shortest
+        if len(keys) < len(shortest):
+            shortest = keys
+
+    if word_size is None or sign_mode is None:
+        # Without a word size and sign mode the bit pattern is not known, so only the base can change
+        for base in BASE_KEYS:
+            consider(integer_keys(digits_of(magnitude, base), base, negative, incoming_base, target_base, leaving_float))
+        return shortest, len(as_written) - len(shortest)
+
+    mask = 2 ** word_size - 1
+    pattern = negate(magnitude, word_size, sign_mode) if negative else magnitude
+    ones = bin(pattern).count("1")
+    for base in BASE_KEYS:
+        def enter(value, operation=None):
+            # Digits of value in base, followed by an operation key
+            if not can_enter(value, base, word_size, sign_mode):
+                return
+            keys = integer_keys(digits_of(value, base), base, False, incoming_base, target_base, leaving_float)
+            if operation is not None:
+                keys.insert(len(keys) - (base != target_base), (operation, None))
+            consider(keys)
+
+        enter(pattern)
+        enter(~pattern & mask, "not")
+        complement = negate(pattern, word_size, sign_mode) # CHS is its own inverse
+        if complement != 0:
+            enter(complement, "CHS")
+        if ones > 0 and pattern == mask ^ (mask >> ones):
+            enter(ones, "maskl") # A block of ones at the top of the word
+        if ones > 0 and pattern == 2 ** ones - 1:
+            enter(ones, "maskr") # A block of ones at the bottom of the word
+    return shortest, len(as_written) - len(shortest)
+
+
+def float_keys(mantissa, exponent, negative):
+    # The keys for a float with the given mantissa and exponent (as text, e.g. "-3", or None for plain notation)
+    keys = [(char, None) for char in mantissa]
+    if negative:
+        keys.append(("CHS", None))
+    if exponent is not None:
+        keys.append(("EEX", None))
+        keys.extend((digit, None) for digit in exponent.lstrip("-"))
+        if exponent.startswith("-"):
+            keys.append(("CHS", None))
+    return keys
+
+
+def shortest_float_keys(token, negative):
+    # Returns (the shortest list of keys for the float literal, bytes saved)
+    # token is the literal as written, without its sign
+    if "e" in token:
+        as_written = float_keys(*token.split("e"), negative)
+    else:
+        as_written = float_keys(token, None, negative)
+    shortest = as_written
+
+    value = Decimal(token)
+    if value == 0:
+        shortest = min(as_written, float_keys("0", None, negative), key=len)
+        return shortest, len(as_written) - len(shortest)
+
+    # value = coefficient * 10 ** exponent, with no trailing zeros in the coefficient
+    _, coefficient_digits, exponent = value.normalize().as_tuple()
+    coefficient = "".join(str(digit) for digit in coefficient_digits)
+    candidates = []
+
+    # Plain notation, without a leading 0 before the decimal point
+    plain = format(value.normalize(), "f")
+    if plain.startswith("0."):
+        plain = plain[1:]
+    candidates.append((plain, None))
+
+    # Scientific notation, with the decimal point after each digit of the coefficient
+    for point in range(len(coefficient) + 1):
+        mantissa = coefficient[:point] + "." + coefficient[point:] if point < len(coefficient) else coefficient
+        candidates.append((mantissa, exponent + len(coefficient) - point))
+
+    for mantissa, candidate_exponent in candidates:
+        keys = float_keys(mantissa, str(candidate_exponent) if candidate_exponent else None, negative)
+        if len(keys) < len(shortest):
+            shortest = keys
+    return shortest, len(as_written) - len(shortest)
@@ -1,28 +1,45 @@
+import io
+import logging
 import os
+import sys
+import threading
 
 from Calculator_State import *
 
 from datetime import datetime
 
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import LETTER
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase import pdfmetrics
+# reportlab is only imported when a PDF is written, as it takes longer to import than the rest of the assembler
+
+# Every output format the assembler can write
+OUTPUT_MODES = ["16c", "pdf", "txt"]
+
+# Output file name that writes the program to stdout, so the assembler can sit in a pipe
+STDOUT_NAME = "-"
 
 # For the JRPN Simulator
-def output_16c(calculator_state):
-    # Update the state of the calculator
-    calculator_state.update_memory()
-    calculator_state.update_program_length()
-    
+def output_16c(calculator_state, output_file_name):
     # Output the assembled code in the .16c format
-    output_file = open(calculator_state.output_file_name + ".16c", "w") # Open the file in write mode
+    if output_file_name == STDOUT_NAME:
+        write_16c(calculator_state, sys.stdout)
+        sys.stdout.flush() # Pass each program down the pipe as soon as it is assembled
+        return
+
+    output_file = open(output_file_name + ".16c", "w") # Open the file in write mode
+    write_16c(calculator_state, output_file)
+
+    # Close the output file
+    output_file.close()
+
+def write_16c(calculator_state, output_file):
+    # calculator_state can also be an AssembledProgram, which has the same program attributes
+    # Write the program to a text file-like object
 
     # Write the header to the output file
     output_file.write("#  Program produced by Alex Melnick's Jovial Assembler.\n")
     output_file.write("#  Character encoding: UTF-8\n")
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    output_file.write(f"#  Generated {current_time}\n")  # Corrected line
+    if calculator_state.timestamp:
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        output_file.write(f"#  Generated {current_time}\n")  # Corrected line
     output_file.write(f"#  Program occupies {calculator_state.program_length} bytes.\n\n")  # Corrected line
 
     # Write the first line of the output file (always the same)
@@ -40,23 +57,29 @@ def output_16c(calculator_state):
         else:
             output_line = f"   {line_number_str} {{       {line.instruction_position:2} }} {line.instruction}\n"
         
-        logging.info(f"Writing line: | {output_line.strip()}")
+        logging.info("Writing line: | %s", output_line.strip())
         
         output_file.write(output_line)
     
     output_file.write("\n# End.\n")  # Write end statement to the output file
 
+# For the HP16C Emulator
+def output_txt(calculator_state, output_file_name):
+    # Output the assembled code in the .txt format
+    if output_file_name == STDOUT_NAME:
+        write_txt(calculator_state, sys.stdout)
+        sys.stdout.flush()
+        return
+
+    output_file = open(output_file_name + ".txt", "w") # Open the file in write mode
+    write_txt(calculator_state, output_file)
+
     # Close the output file
     output_file.close()
 
-# For the HP16C Emulator
-def output_txt(calculator_state):
-    # Update the state of the calculator
-    calculator_state.update_memory()
-    calculator_state.update_program_length()
-    
-    # Output the assembled code in the .16c format
-    output_file = open(calculator_state.output_file_name + ".txt", "w") # Open the file in write mode
+def write_txt(calculator_state, output_file):
+    # calculator_state can also be an AssembledProgram, which has the same program attributes
+    # Write the program to a text file-like object
 
     # Header
     output_file.write(f"HP16C Program Listing: {os.path.basename(calculator_state.input_file_name)} \n\n")
@@ -82,39 +105,62 @@ def output_txt(calculator_state):
         else:
             output_line = f" {line_number_str} - {line.instruction_position:10}| {line.instruction}\n"
         
-        logging.info(f"Writing line: | {output_line.strip()}")
+        logging.info("Writing line: | %s", output_line.strip())
 
         output_file.write(output_line)
     
     output_file.write(" ================================= \n\n")
 
-    # Close the output file
-    output_file.close()
 
 
+# Font for the PDF, registered once per process
+PDF_FONT_NAME = "Dot Matrix"
+pdf_font_lock = threading.Lock()
+
+def register_pdf_font():
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    # reportlab keeps the registered fonts in a global registry shared by every thread
+    with pdf_font_lock:
+        if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            # Determine if we are running in a PyInstaller bundle
+            if hasattr(sys, '_MEIPASS'):
+                base_path = sys._MEIPASS
+            else:
+                base_path = os.path.dirname(os.path.abspath(__file__)) # The fonts folder sits next to the source, wherever the assembler is run from
+
+            font_path = os.path.join(base_path, 'fonts', 'hdad-dotrice-1.001', 'dotrice-condensed.ttf')
+            pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, font_path))
+    return PDF_FONT_NAME
 
 # For a printable pdf
-def output_pdf(calculator_state):
+def output_pdf(calculator_state, output_file_name):
+    if output_file_name == STDOUT_NAME:
+        write_pdf(calculator_state, sys.stdout.buffer)
+        sys.stdout.buffer.flush()
+        return
+
+    write_pdf(calculator_state, output_file_name + ".pdf")
+
+def write_pdf(calculator_state, output_file):
+    # calculator_state can also be an AssembledProgram, which has the same program attributes
+    # Write the program to a file name or a binary file-like object
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import LETTER
+
     # Parameters for the PDF
-    font_name = "Dot Matrix" # Using a custom font for the program listing for a retro look
+    font_name = register_pdf_font() # Using a custom font for the program listing for a retro look
     line_spacing = 16  # Line spacing for the program listing
 
-    # Determine if we are running in a PyInstaller bundle
-    if hasattr(sys, '_MEIPASS'):
-        base_path = sys._MEIPASS
-    else:
-        base_path = os.path.abspath(".")
-
-    font_path = os.path.join(base_path, 'fonts\hdad-dotrice-1.001\dotrice-condensed.ttf')
-    c = canvas.Canvas(calculator_state.output_file_name + ".pdf", pagesize=LETTER)
-    pdfmetrics.registerFont(TTFont(font_name, font_path))
+    c = canvas.Canvas(output_file, pagesize=LETTER, invariant=not calculator_state.timestamp) # invariant leaves the creation date out of the PDF
     c.setFont(font_name, 12)  
     heading_y_position = 792 - 72  # 72 points (1 inch) from the top
 
     # Heading and Stats
     header = [
         f"Program Listing for {os.path.basename(calculator_state.input_file_name)} for the HP-16C Calculator",
-        f"Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} with the Jovial Assembler by Alex Melnick",
+        f"Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} with the Jovial Assembler by Alex Melnick" if calculator_state.timestamp else "Generated with the Jovial Assembler by Alex Melnick",
         #f"Calculator status (at end of program): {calculator_state.sign_mode} mode, {calculator_state.word_size}-bit words, {calculator_state.base} base",
         f"Program length: {calculator_state.program_length} Bytes",
         f"Registers used: {len(calculator_state.registers_used)} of {calculator_state.available_registers} available",
@@ -164,3 +210,52 @@ def output_pdf(calculator_state):
                 columns = [(72, heading_y_position), (228, heading_y_position), (384, heading_y_position)]  # Adjusted y position for columns start
 
     c.save()  # Save the PDF
+
+
+# Output function for each output mode
+OUTPUT_FUNCTIONS = {
+    "16c": output_16c,
+    "txt": output_txt,
+    "pdf": output_pdf,
+}
+
+def output_all(calculator_state, output_files):
+    # Write the assembled program once per (output mode, output file name without extension)
+    # The program is only parsed once, no matter how many outputs are written
+    profiler = calculator_state.profiler
+    for output_mode, output_file_name in output_files:
+        if profiler is not None:
+            profiler.start(f"render {output_mode}")
+        OUTPUT_FUNCTIONS[output_mode](calculator_state, output_file_name)
+        if profiler is not None:
+            profiler.stop()
+
+
+# Write function for each output mode, for programs assembled in memory
+WRITE_FUNCTIONS = {
+    "16c": write_16c,
+    "txt": write_txt,
+    "pdf": write_pdf,
+}
+
+def render(program, output_mode, output_file=None):
+    # Render the program in the given output mode
+    # Writes to output_file (a text or binary file-like object) if given, otherwise returns the output as bytes
+    if output_mode not in WRITE_FUNCTIONS:
+        raise ValueError(f"Invalid output mode: {output_mode}. Please use either '16c', 'pdf', or 'txt'.")
+
+    if output_mode == "pdf":
+        buffer = output_file if output_file is not None else io.BytesIO()
+        write_pdf(program, buffer)
+    elif output_file is not None and isinstance(output_file, io.TextIOBase):
+        WRITE_FUNCTIONS[output_mode](program, output_file)
+        return None
+    else:
+        text_buffer = io.StringIO()
+        WRITE_FUNCTIONS[output_mode](program, text_buffer)
+        buffer = output_file if output_file is not None else io.BytesIO()
+        buffer.write(text_buffer.getvalue().encode("utf-8"))
+
+    if output_file is None:
+        return buffer.getvalue()
+    return None
@@ -1,8 +1,16 @@
 import logging
+import os
 import sys
 import argparse
 import textwrap
 
+from Batch_Assembly import TARGET_DIRECTORIES, is_glob_pattern
+from Build_Cache import DEFAULT_CACHE_DIRECTORY, DEFAULT_CACHE_SIZE
+from Diagnostics import DIAGNOSTIC_FORMATS, SETTINGS_WARNING_CODE, WARNING, Diagnostic
+from Output import OUTPUT_MODES, STDOUT_NAME
+from Parse_File import STDIN_NAME
+from Utils import ASSEMBLER_VERSION
+
 def parse_arguments(calculator_state):
     # Set up parser
     parser = argparse.ArgumentParser(
@@ -14,17 +22,25 @@ def parse_arguments(calculator_state):
 
     parser.add_argument('-i', '--input_file', 
         required=True, 
-        help='Input file to assemble with .jov extension (required)', 
+        nargs='+',
+        help=textwrap.dedent('''\
+        Input file to assemble with .jov extension (required)  
+        Passing several files, directories, or glob patterns assembles every .jov file in batch mode  
+        Use - to read the program from stdin. Several programs can be streamed in, each starting with a '#program <name>' line  
+        '''), 
         type=str,
-        # Eventually gonna add nargs='+' to allow multiple input files
         )  # Input file argument
     parser.add_argument('-o', '--output_file',
         required=True, 
+        nargs='+',
         help=textwrap.dedent('''\
         Output file with desired extension format (.pdf/.16c/.txt) (required)  
+        Several output files can be given, the program is only parsed once for all of them  
         .pdf = printable PDF file for typing into a physical HP-16C calculator  
         .16c = 16C file for the JRPN Simulator (not that this file is not compatible with the HP16C Emulator, despite the identical file extension)  
         .txt = TXT file for the HP16C Emulator (select filetype 'HP16C Program Text' when loading the file)  
+        In batch mode, this is the output directory. Each target is written into its own folder inside it  
+        Use - to write to stdout in the format given by --targets (default = 16c)  
         '''), 
         type=str,
         )  # Output file argument
@@ -51,10 +67,92 @@ def parse_arguments(calculator_state):
         #help='Starting base of the number being entered (2 = binary, 8 = octal, 10 = decimal, 16 = hexadecimal) (default = 10) (note that base must be 10 for floating point numbers)',
         help='Starting base of the number being entered (2 = binary, 8 = octal, 10 = decimal, 16 = hexadecimal)',
         ) # Base argument
+    parser.add_argument(
+        '-t', '--targets',
+        type=str,
+        help=textwrap.dedent('''\
+        Comma separated list of output formats to write (e.g. 16c,txt,pdf)  
+        Each format is written next to the output file name, or into its own folder in batch mode (default = 16c,txt,pdf in batch mode)  
+        '''),
+        ) # Targets argument
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        help='Number of programs to assemble in parallel in batch mode (default = number of CPUs)',
+        ) # Batch jobs argument
+    parser.add_argument(
+        '--cache',
+        nargs='?',
+        const='',
+        metavar='DIRECTORY',
+        help=textwrap.dedent(f'''\
+        Reuse the outputs of unchanged programs from a build cache in batch mode  
+        The cache is kept in DIRECTORY (default = {DEFAULT_CACHE_DIRECTORY} inside the output directory)  
+        '''),
+        ) # Build cache argument
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        default=DEFAULT_CACHE_SIZE // (1024 * 1024),
+        metavar='MB',
+        help=f'Maximum size of the build cache in megabytes, the least recently used entries are removed first (default = {DEFAULT_CACHE_SIZE // (1024 * 1024)})',
+        ) # Build cache size argument
+    parser.add_argument(
+        '-O', '--optimize',
+        action='store_true',
+        help='Run the peephole optimizer over the program, removing redundant base keys, stores, and unreachable code',
+        ) # Optimize argument
+    parser.add_argument(
+        '--link',
+        action='store_true',
+        help=textwrap.dedent('''\
+        Link every input file into one program instead of assembling them in batch mode  
+        The modules share named labels and registers, their own numbered ones are renamed where they collide, and subroutines nothing calls are dropped  
+        '''),
+        ) # Link argument
+    parser.add_argument(
+        '--entry',
+        type=str,
+        help='Comma separated list of labels the linked program is started from (e.g. a,@main) (default = the first step and the labels of the first input file)',
+        ) # Entry labels argument
+    parser.add_argument(
+        '--memory-trace',
+        action='store_true',
+        help='Print the program length, memory partition, and registers available after every source line',
+        ) # Memory trace argument
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='Watch the input file and reassemble it every time it is saved, only parsing the lines that changed',
+        ) # Watch argument
+    parser.add_argument(
+        '--all-errors',
+        action='store_true',
+        help='Keep going after an error and report every error in the program, instead of stopping at the first one',
+        ) # All errors argument
+    parser.add_argument(
+        '--diagnostics',
+        choices=DIAGNOSTIC_FORMATS,
+        help=textwrap.dedent('''\
+        Report errors and warnings as diagnostics with a code, severity, line, and column (default = human with --all-errors)  
+        human = one 'file:line:column: severity code: message' line each, on stderr  
+        json = a single JSON document on stdout (on stderr if the program is written to stdout)  
+        '''),
+        ) # Diagnostics format argument
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Print the time spent and the number of calls in each phase (read, tokenize, parse, encode, memory, and each target)',
+        ) # Profile argument
+    parser.add_argument(
+        '--no-timestamp',
+        action='store_true',
+        help='Leave the generation time out of the .16c and .pdf headers, so unchanged programs give byte-identical outputs',
+        ) # Timestamp argument
     parser.add_argument(
         '-v', '--version',
         action='version',
-        version='%(prog)s 1.2.0',   #! This is where the version number is set
+        version=f'%(prog)s {ASSEMBLER_VERSION}',
         ) # Version argument
     parser.add_argument(
         '-d', '--debug',
@@ -71,34 +169,156 @@ def parse_arguments(calculator_state):
     if len(sys.argv) == 1:
         parse_interactive(calculator_state)
     else:
-        calculator_state.input_file_name = args.input_file if args.input_file is not None else ""
-        calculator_state.output_file_name = args.output_file[:-4] if (args.output_file is not None and len(args.output_file)) > 4 else ""
-        calculator_state.output_mode = args.output_file[-3:] if (args.output_file is not None and len(args.output_file) > 3) else ""
         calculator_state.sign_mode = args.sign_mode
         calculator_state.word_size = args.word_size
         calculator_state.update_base(args.base)
         calculator_state.logger_level = args.debug
+        calculator_state.timestamp = not args.no_timestamp
+        calculator_state.all_errors = args.all_errors
+        calculator_state.optimize = args.optimize
+        if args.profile:
+            from Profiler import Profiler # Only needed when profiling
+            calculator_state.profiler = Profiler()
+        calculator_state.diagnostics_format = args.diagnostics if args.diagnostics is not None else ("human" if args.all_errors else None)
+        calculator_state.diagnostics = [] if calculator_state.diagnostics_format is not None else None
 
-        # Do some error checking
-        if calculator_state.input_file_name == "":
-            logging.critical("No input file provided. Please provide an input file.")
-            sys.exit(1)
-        if not calculator_state.input_file_name.endswith(".jov"):
-            logging.critical("Invalid input file type. Please enter a .jov file.")
-            sys.exit(1)
-        if calculator_state.output_mode == "":
-            logging.critical("No output file provided. Please provide an output file.")
-            sys.exit(1)
-        if calculator_state.output_mode not in ["16c", "pdf", "txt"]:
-            logging.critical("Invalid output file type. Please use either '.16c', '.pdf', or '.txt'.")
+        # Several inputs, a directory, or a glob pattern switches to batch mode
+        calculator_state.batch_mode = not args.link and (len(args.input_file) > 1 or os.path.isdir(args.input_file[0]) or is_glob_pattern(args.input_file[0]))
+        if args.entry is not None and not args.link:
+            logging.warning("Entry labels are only used when linking (--link).")
+        if calculator_state.batch_mode:
+            if args.watch:
+                logging.critical("Watch mode only watches a single input file.")
+                sys.exit(1)
+            calculator_state.batch_input_files = args.input_file
+            calculator_state.output_directory = args.output_file[0]
+            calculator_state.output_targets = parse_targets(args.targets if args.targets is not None else ",".join(TARGET_DIRECTORIES))
+            calculator_state.batch_jobs = args.jobs
+            if args.cache is not None:
+                calculator_state.cache_directory = args.cache if args.cache != '' else os.path.join(calculator_state.output_directory, DEFAULT_CACHE_DIRECTORY)
+                calculator_state.cache_size = args.cache_size * 1024 * 1024
+
+            # Do some error checking
+            if len(args.output_file) > 1:
+                logging.critical("Only one output directory can be provided in batch mode.")
+                sys.exit(1)
+            if calculator_state.batch_jobs is not None and calculator_state.batch_jobs < 1:
+                logging.critical("Invalid number of jobs. Please use at least 1 job.")
+                sys.exit(1)
+            if args.cache_size < 1:
+                logging.critical("Invalid cache size. Please use at least 1 MB.")
+                sys.exit(1)
+        else:
+            if args.cache is not None:
+                logging.warning("The build cache is only used in batch mode.")
+            input_file = args.input_file[0]
+            calculator_state.input_file_name = input_file if input_file is not None else ""
+            calculator_state.output_files = []
+
+            if args.output_file == [STDOUT_NAME]:
+                # Write a single target to stdout, so the assembler can sit in a pipe
+                calculator_state.output_targets = parse_targets(args.targets if args.targets is not None else "16c")
+                if len(calculator_state.output_targets) > 1:
+                    logging.critical("Only one target can be written to stdout.")
+                    sys.exit(1)
+                calculator_state.output_files.append((calculator_state.output_targets[0], STDOUT_NAME))
+            elif args.targets is not None:
+                # Write every target next to the output file name (with or without an extension)
+                calculator_state.output_targets = parse_targets(args.targets)
+                if len(args.output_file) > 1:
+                    logging.critical("Only one output file name can be provided with --targets.")
+                    sys.exit(1)
+                output_file_name = args.output_file[0]
+                if output_file_name[-4:].lower() in [".16c", ".pdf", ".txt"]:
+                    output_file_name = output_file_name[:-4]
+                for output_mode in calculator_state.output_targets:
+                    calculator_state.output_files.append((output_mode, output_file_name))
+            else:
+                for output_file in args.output_file:
+                    output_file_name = output_file[:-4] if (output_file is not None and len(output_file)) > 4 else ""
+                    output_mode = output_file[-3:] if (output_file is not None and len(output_file) > 3) else ""
+
+                    if output_mode == "":
+                        logging.critical("No output file provided. Please provide an output file.")
+                        sys.exit(1)
+                    if output_mode not in OUTPUT_MODES:
+                        logging.critical("Invalid output file type. Please use either '.16c', '.pdf', or '.txt'.")
+                        sys.exit(1)
+                    if (output_mode, output_file_name) not in calculator_state.output_files:
+                        calculator_state.output_files.append((output_mode, output_file_name))
+
+            # Do some error checking
+            if calculator_state.input_file_name == "":
+                logging.critical("No input file provided. Please provide an input file.")
+                sys.exit(1)
+            if not calculator_state.input_file_name.endswith(".jov") and calculator_state.input_file_name != STDIN_NAME:
+                logging.critical("Invalid input file type. Please enter a .jov file.")
+                sys.exit(1)
+
+            if args.link:
+                # Link the modules into one program, named after the first one
+                calculator_state.link_input_files = args.input_file
+                calculator_state.entry_labels = [label.strip().lower() for label in args.entry.split(',') if label.strip() != ""] if args.entry is not None else None
+                if any(not input_file.endswith(".jov") for input_file in args.input_file):
+                    logging.critical("Invalid input file type. Please link .jov files.")
+                    sys.exit(1)
+                if args.watch or args.memory_trace:
+                    logging.critical("Watch mode and the memory trace are not available when linking.")
+                    sys.exit(1)
+
+            calculator_state.watch = args.watch
+            calculator_state.memory_trace = [] if args.memory_trace else None
+            if calculator_state.watch and calculator_state.input_file_name == STDIN_NAME:
+                logging.critical("Watch mode needs an input file, it cannot watch stdin.")
+                sys.exit(1)
+
+        for warning in calculator_state.check_initial_settings():
+            if calculator_state.diagnostics is not None:
+                calculator_state.diagnostics.append(Diagnostic(calculator_state.input_file_name, None, None, WARNING, SETTINGS_WARNING_CODE, warning))
+            else:
+                logging.warning(warning)
+
+def parse_serve_arguments(arguments):
+    # Arguments for server mode (jovial serve)
+    parser = argparse.ArgumentParser(
+        prog='jovial serve',
+        description='Keep one warm assembler process that answers assemble requests sent as JSON lines',
+        epilog='Without a port, requests are read from stdin and responses are written to stdout.',
+        formatter_class=argparse.RawTextHelpFormatter
+        )
+
+    parser.add_argument(
+        '-p', '--port',
+        type=int,
+        help='Serve on this TCP port on localhost instead of stdin/stdout (0 = pick a free port)',
+        ) # Port argument
+    parser.add_argument(
+        '-d', '--debug',
+        type=str,
+        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+        default='WARNING',
+        help='Set the logging level, logs are written to stderr (default = WARNING)',
+        ) # Debug argument
+
+    return parser.parse_args(arguments)
+
+def parse_targets(targets):
+    # Turn a comma separated list of output formats into a list of output modes
+    output_targets = []
+    for target in targets.split(','):
+        target = target.strip().lstrip('.').lower()
+        if target == "":
+            continue
+        if target not in OUTPUT_MODES:
+            logging.critical(f"Invalid target: {target}. Please use either '16c', 'pdf', or 'txt'.")
             sys.exit(1)
+        if target not in output_targets:
+            output_targets.append(target)
 
-        if calculator_state.sign_mode == 3 and calculator_state.word_size != 56:
-            logging.warning("Floating point mode selected. Word size automatically set to 56 bits.")
-            calculator_state.word_size = 56
-        if calculator_state.sign_mode != 3 and calculator_state.base != 10:
-            logging.warning("Floating point mode selected. Base automatically set to 10.")
-            calculator_state.update_base(10)
+    if len(output_targets) == 0:
+        logging.critical("No targets provided. Please provide at least one of '16c', 'pdf', or 'txt'.")
+        sys.exit(1)
+    return output_targets
 
 def parse_interactive(calculator_state):
     print("Welcome to the Jovial Assembler - the first and only assembler for the HP-16C calculator!")
@@ -172,5 +392,4 @@ def parse_interactive(calculator_state):
     calculator_state.word_size = word_size
     calculator_state.update_base(base)
     calculator_state.input_file_name = input_file_name
-    calculator_state.output_file_name = output_file_name
-    calculator_state.output_mode = output_mode
\ No newline at end of file
+    calculator_state.output_files = [(output_mode, output_file_name)]
\ No newline at end of file
@@ -1,106 +1,309 @@
 import logging
 import sys
 
-from Instructions import instr
+from Assembler_Errors import AssemblerError, AddressRangeError, InvalidArgumentError, InvalidInstructionError, InvalidNumberError, MissingArgumentError, OutOfMemoryError
+from Calculator_State import PRGM_MEMORY_AVAILABLE
+from Call_Graph import subroutine_depth
+from Diagnostics import diagnostic_from_error
+from Instructions import keystroke
+from Indirect_Addressing import CHANGES_INDEX, indirect_register_keys, is_indirect_register, track_index_register
 from Instructions_Data import mnemonic_to_instr, instructions_with_arguments
-from Utils import is_number
+from Label_Allocator import allocate_labels, is_label_name, label_reference
+from Lexer import TokenKind, tokenize_line
+from Literal_Encoder import CHANGES_WORD_MODE, literal_word_mode, shortest_float_keys, shortest_integer_keys, track_word_mode
+from Peephole_Optimizer import optimize
+from Register_Allocator import INDEX_REGISTER, allocate_registers, counted_loops, has_register_references, is_register_name, is_register_reference, register_reference
+
+# Numeric value of each base name, used to validate integers in the base they are entered in
+BASE_VALUES = {"bin": 2, "oct": 8, "dec": 10, "hex": 16}
+
+# Input file name that reads the program from stdin, so the assembler can sit in a pipe
+STDIN_NAME = "-"
+
+# Instructions that can change what the assembler knows about I or the word size (STO only with STO I)
+TRACKED_INSTRUCTIONS = CHANGES_INDEX | CHANGES_WORD_MODE | {"STO"}
+
+def read_source_lines(source):
+    # Yields the lines of the source one at a time, so the whole file is never held in memory
+    # source is a file name, "-" for stdin, or any iterable of lines (an open file, an io.StringIO buffer, a list)
+    if source == STDIN_NAME:
+        yield from sys.stdin
+    elif isinstance(source, str):
+        with open(source, "r") as input_file:
+            yield from input_file
+    else:
+        yield from source
 
-def parse_line(line, input_line_number, calculator_state):
-    # Do some basic parsing of the line
-    
-    # Remove leading and trailing whitespace
-    line = line.strip()
 
-    # Check for comments and remove them
-    # Check for double slashes and remove anything after them
-    if line.find("//") != -1:
-        line = line[:line.find("//")]
-    # Check for semicolons and remove anything after them
-    if line.find(";") != -1:
-        line = line[:line.find(";")]
+def parse_file(calculator_state, diagnostics=None):
+    # Stream the lines of the input file into the parser
+    logging.info("Opening file: %s of type %s", calculator_state.input_file_name, str(type(calculator_state.input_file_name)))
+    parse_lines(read_source_lines(calculator_state.input_file_name), calculator_state, diagnostics)
 
-    # Check for empty lines
-    if len(line) == 0:
-        return None
 
-    # Make the line lowercase
-    line = line.lower()
+def parse_lines(assembly_code, calculator_state, diagnostics=None):
+    # Assemble the code into "bare" keypress sequences
+    # Without a diagnostics list, the first error is raised
+    # With one, every error is recorded as a Diagnostic and the parse recovers by skipping the line that caused it
+    parse_module(assembly_code, calculator_state, diagnostics)
+    try:
+        finish_program(calculator_state)
+    except AssemblerError as error:
+        if diagnostics is None:
+            raise
+        diagnostics.append(diagnostic_from_error(error, calculator_state.input_file_name))
+
+
+def parse_module(assembly_code, calculator_state, diagnostics=None, check_memory=True):
+    # Parse the lines one at a time, without the passes that need the whole program (the linker runs those after
+    # every module is parsed). Errors are raised or recorded as for parse_lines
+    # Without check_memory, the memory is left for the caller to check (a module can be larger than the part of it that is linked)
+    program_too_large = False
+    profiler = calculator_state.profiler
+    if profiler is not None:
+        assembly_code = profiler.timed("read", assembly_code)
+    for input_line_number, line in enumerate(assembly_code):
+        # Parse the line and get the keypresses
+        adjusted_line_no = input_line_number+1
+        logging.info("Parsing line: %s (line number: %d)", line, adjusted_line_no)
+        if diagnostics is not None:
+            line_start = (len(calculator_state.program), set(calculator_state.registers_used), calculator_state.sign_mode, calculator_state.previous_sign_mode, calculator_state.base, calculator_state.index_register, calculator_state.word_mode_known)
+        try:
+            if profiler is not None:
+                profiler.start("parse")
+            parse_line(line, input_line_number+1, calculator_state)
+
+            # Update the program length and memory partition
+            if profiler is not None:
+                profiler.stop()
+                profiler.start("memory")
+            calculator_state.update_program_length()
+            if check_memory:
+                calculator_state.update_memory()
+            calculator_state.trace_memory(adjusted_line_no)
+            if profiler is not None:
+                profiler.stop()
+        except AssemblerError as error:
+            if profiler is not None:
+                profiler.stop_all()
+
+            # Errors raised below the line level do not know which line they came from
+            if error.line_number is None:
+                error.line_number = adjusted_line_no
+            if diagnostics is None:
+                raise
+
+            # Once the program is too large, every later line would run out of memory as well, so only the first is reported
+            if not (program_too_large and isinstance(error, OutOfMemoryError)):
+                diagnostics.append(diagnostic_from_error(error, calculator_state.input_file_name))
+            restore_line_start(calculator_state, line_start)
+            continue
+
+        # Check if the program is too large for the memory
+        try:
+            if check_memory and not program_too_large:
+                check_program_length(calculator_state, adjusted_line_no)
+        except OutOfMemoryError as error:
+            if diagnostics is None:
+                raise
+            diagnostics.append(diagnostic_from_error(error, calculator_state.input_file_name))
+            program_too_large = True
+
+
+def finish_program(calculator_state):
+    # The passes that need the whole program: the peephole optimizer (with -O), then the named registers and labels
+    # The optimizer runs first, so the lines that jumps through I go to are the final ones
+    # The subroutine depth is checked before the labels are allocated, while jumps to named labels are still single steps
+    if logging.getLogger().isEnabledFor(logging.INFO): # The counted loop hints are only looked for when they are shown
+        for index, register, counter_instruction in counted_loops(calculator_state.program):
+            line = calculator_state.program[index]
+            where = f"line {line.line_number}" if is_register_reference(line) else f"step {index + 1}"
+            counter = register if is_register_name(register) else "@count"
+            suggestion = f"loop {counter} <label>" if counter_instruction == "DSZ" else f"isz {counter} then gto <label>"
+            logging.info("Counted loop at %s: %s with a named counter (%s) saves 4 steps, if nothing reads the count left in X", where, counter_instruction, suggestion)
+    if calculator_state.optimize:
+        calculator_state.bytes_saved = optimize(calculator_state)
+    allocate_named_registers(calculator_state)
+    calculator_state.subroutine_depth = subroutine_depth(calculator_state)
+    if allocate_labels(calculator_state):
+        calculator_state.update_program_length()
+        calculator_state.update_memory()
+        check_program_length(calculator_state, None)
+
+
+def allocate_named_registers(calculator_state):
+    # Named registers (sto @limit) can only be given a register once the whole program has been parsed
+    if not has_register_references(calculator_state.program):
+        return
+    first_references = {}
+    for line in calculator_state.program:
+        if is_register_reference(line):
+            first_references.setdefault(line.argument, line)
+    if not first_references:
+        return
+
+    allocation = allocate_registers(calculator_state)
+    for name, register in allocation.items():
+        if register == INDEX_REGISTER:
+            continue
+        reference = first_references[name]
+        check_register_partition(register, calculator_state, [reference.instruction.lower(), name], reference.line_number, reference.column)
+
+
+def restore_line_start(calculator_state, line_start):
+    # Undo a line that failed to parse, so the lines after it are parsed in the mode the calculator was in before it
+    program_length, registers_used, calculator_state.sign_mode, calculator_state.previous_sign_mode, base, calculator_state.index_register, calculator_state.word_mode_known = line_start
+    del calculator_state.program[program_length:]
+    calculator_state.registers_used = registers_used
+    calculator_state.update_base(base)
+    calculator_state.update_program_length() # The memory is updated by the next line
+
+
+def check_program_length(calculator_state, input_line_number):
+    if calculator_state.program_length > PRGM_MEMORY_AVAILABLE:
+        raise OutOfMemoryError("Error - Out of Memory: This program is too large for the memory (the HP-16C only has 203 Bytes of memory). Remember, the best art is made under the tightest constraints!", input_line_number)
+
+
+def check_register_partition(register, calculator_state, line_tokens, input_line_number, column=None):
+    # Registers are stored below the memory partition, so the register must fit below it
+    if calculator_state.word_size is not None and register*calculator_state.word_size/8 >= calculator_state.memory_partition:
+        raise AddressRangeError(f"Error - Out of memory range: Addresses must be within the memory partition. Line: {line_tokens}", input_line_number, column)
 
-    # Separate the line into tokens
-    tokens = line.split()
+
+def parse_line(line, input_line_number, calculator_state):
+    # Split the line into classified tokens in a single pass (comments and whitespace are skipped)
+    profiler = calculator_state.profiler
+    if profiler is not None:
+        profiler.start("tokenize")
+    tokens = tokenize_line(line, input_line_number)
+    if profiler is not None:
+        profiler.stop()
+
+    # Check for empty lines
+    if len(tokens) == 0:
+        return None
 
     # Check if the token is an instruction or a number
-    logging.debug(f"Parsing tokens: {tokens}")
-    if is_valid_instruction(tokens[0]):
+    logging.debug("Parsing tokens: %s", tokens)
+    first_token = tokens[0]
+    if first_token.text == "loop":
+        parse_loop(tokens, input_line_number, calculator_state)
+    elif first_token.kind is TokenKind.MNEMONIC:
         parse_instruction(tokens, input_line_number, calculator_state)
-    # Check if the token is a number
-    elif is_number(tokens[0]):
-        parse_number(tokens[0], calculator_state, input_line_number)
+    elif first_token.kind is TokenKind.INTEGER or first_token.kind is TokenKind.FLOAT:
+        parse_number(first_token, calculator_state, input_line_number)
     else:
-        logging.critical(f"Invalid line: {line} (line number {input_line_number})")
-        sys.exit(1)
+        raise InvalidInstructionError(f"Invalid line: {' '.join(token.text for token in tokens)}", input_line_number, first_token.column)
+
+
+def parse_loop(tokens, input_line_number, calculator_state):
+    # loop <counter> <label>: count the counter down and jump back to the label until it reaches 0 (DSZ then GTO)
+    # The counter is a named register, which is given I (see Register_Allocator.py), or I itself
+    line_tokens = [token.text for token in tokens]
+    if len(tokens) != 3:
+        raise MissingArgumentError(f"Error - Missing argument: loop takes a counter and a label, e.g. loop @count @top. Line: {line_tokens}", input_line_number, tokens[-1].column)
+    counter, label = tokens[1], tokens[2]
+    if counter.text != "i" and not is_register_name(counter.text):
+        raise InvalidArgumentError(f"Error - Invalid argument: The loop counter must be a named register or I, not {counter.text}. Line: {line_tokens}", input_line_number, counter.column)
+    dsz = tokens[0]._replace(kind=TokenKind.MNEMONIC, text="dsz")
+    parse_instruction([dsz, counter] if counter.text != "i" else [dsz], input_line_number, calculator_state)
+    parse_instruction([tokens[0]._replace(kind=TokenKind.MNEMONIC, text="gto"), label], input_line_number, calculator_state)
 
 
 def parse_instruction(tokens, input_line_number, calculator_state):
-    logging.debug(f"Parsing instruction: {tokens[0]}")
+    mnemonic = tokens[0].text
+    logging.debug("Parsing instruction: %s", mnemonic)
     has_argument = False
     if (len(tokens) == 2):
-        logging.debug(f"Token: {tokens[0]} has an argument: {tokens[1]}")
+        argument = tokens[1].text
+        logging.debug("Token: %s has an argument: %s", mnemonic, argument)
         has_argument = True
     else:
-        logging.debug(f"Token: {tokens[0]} has no argument.")
+        argument = None
+        logging.debug("Token: %s has no argument.", mnemonic)
+    # The error column points at the argument if there is one, otherwise at the instruction
+    column = tokens[-1].column
+    line_tokens = [token.text for token in tokens]
+
+    # When linking, the labels and registers this module shares a number with an earlier module are renamed (see Linker.py)
+    if has_argument and calculator_state.linked_names is not None:
+        argument = calculator_state.linked_names.get((mnemonic, argument), argument)
 
     # Check if the token is a valid instruction with a valid argument
-    if(is_valid_instruction(tokens[0])):
-        if(has_argument and is_valid_argument(tokens[0], tokens[1])):
-            logging.debug(f"Instr: {tokens[0]} has a valid with argument: {tokens[1]}")
+    if(is_valid_instruction(mnemonic)):
+        if(has_argument and is_valid_argument(mnemonic, argument)):
+            logging.debug("Instr: %s has a valid with argument: %s", mnemonic, argument)
             
             # Perform system checks
-            if tokens[0] == 'sto' or tokens[0] == 'rcl':
-                if tokens[1] != 'i' and tokens[1] != '(i)':
-                    if int(tokens[1]) > 31:
-                        logging.critical("Error - Out of direct memory range:")
-                        logging.critical("Addresses must be between 0 and 31 for direct addressing.")
-                        logging.critical(f"Line: {tokens} (line number: {input_line_number})")
-                        sys.exit(1)
-                    elif(calculator_state.word_size is not None and int(tokens[1])*calculator_state.word_size/8 >= calculator_state.memory_partition):
-                        logging.critical("Error - Out of memory range:")
-                        logging.critical("Addresses must be within the memory partition.")
-                        logging.critical(f"Line: {tokens} (line number: {input_line_number})")
-                        sys.exit(1)
+            if (mnemonic == 'lbl' or mnemonic == 'gto' or mnemonic == 'gsb') and is_label_name(argument):
+                # The label is allocated at the end of the program (see Label_Allocator.py)
+                logging.info("Adding instruction: %s with named label: %s to the program.", mnemonic, argument)
+                calculator_state.program.append(label_reference(mnemonic, argument, input_line_number, column, calculator_state))
+                if mnemonic != 'gto':
+                    calculator_state.index_register = None # I can change before a label is reached, or in a subroutine
+                return
+            if mnemonic == 'dsz' or mnemonic == 'isz':
+                # A loop counter, which is given I at the end of the program (see Register_Allocator.py)
+                logging.info("Adding instruction: %s with loop counter: %s to the program.", mnemonic, argument)
+                calculator_state.program.append(register_reference(mnemonic, argument, input_line_number, column))
+                calculator_state.index_register = None
+                return
+            if (mnemonic == 'sto' or mnemonic == 'rcl') and is_register_name(argument):
+                # The register is allocated at the end of the program (see Register_Allocator.py)
+                logging.info("Adding instruction: %s with named register: %s to the program.", mnemonic, argument)
+                calculator_state.program.append(register_reference(mnemonic, argument, input_line_number, column))
+                return
+            if mnemonic == 'sto' or mnemonic == 'rcl':
+                if argument != 'i' and argument != '(i)':
+                    if is_indirect_register(argument):
+                        # Registers above R31 are reached through I (see Indirect_Addressing.py)
+                        register = int(argument)
+                        check_register_partition(register, calculator_state, line_tokens, input_line_number, column)
+                        keys = indirect_register_keys(mnemonic, register, calculator_state, line_tokens, input_line_number, column)
+                        calculator_state.use_register(register)
+                        logging.info("Adding instruction: %s with register: %d through I to the program.", mnemonic, register)
+                        for key_mnemonic, key_argument in keys:
+                            encode_instruction(key_mnemonic, key_argument, calculator_state)
+                        calculator_state.index_register = register
+                        return
                     else:
-                        if int(tokens[1]) not in calculator_state.registers_used:
-                            logging.debug(f"Adding register: {tokens[1]} to the list of registers used.")
-                            calculator_state.registers_used.append(int(tokens[1]))
-                
-                calculator_state.update_memory()
-
-            logging.info(f"Adding instruction: {tokens[0]} with argument: {tokens[1]} to the program.")
-            calculator_state.program.append(instr(tokens[0], tokens[1], calculator_state))
-        elif (has_argument and not is_valid_argument(tokens[0], tokens[1])):
-            logging.critical("Error - Invalid argument:")
-            logging.critical(f"Argument: {tokens[1]} is not valid for instruction: {tokens[0]}.")
-            logging.critical(f"Line: {tokens} (line number: {input_line_number})")
-            sys.exit(1)
-        elif (not has_argument and tokens[0] in instructions_with_arguments):
-            logging.critical("Error - Missing argument:")
-            logging.critical(f"Instruction: {tokens[0]} requires an argument.")
-            logging.critical(f"Line: {tokens} (line number: {input_line_number})")
-            sys.exit(1)
+                        check_register_partition(int(argument), calculator_state, line_tokens, input_line_number, column)
+                        calculator_state.use_register(int(argument))
+
+            logging.info("Adding instruction: %s with argument: %s to the program.", mnemonic, argument)
+            encode_instruction(mnemonic, argument, calculator_state)
+        elif (has_argument and not is_valid_argument(mnemonic, argument)):
+            raise InvalidArgumentError(f"Error - Invalid argument: Argument: {argument} is not valid for instruction: {mnemonic}. Line: {line_tokens}", input_line_number, column)
+        elif (not has_argument and mnemonic in instructions_with_arguments):
+            raise MissingArgumentError(f"Error - Missing argument: Instruction: {mnemonic} requires an argument. Line: {line_tokens}", input_line_number, column)
         else:
-            if tokens[0] == 'hex' or tokens[0] == 'dec' or tokens[0] == 'oct' or tokens[0] == 'bin': 
-                logging.debug(f"Changing base to: {tokens[0]}")
-                calculator_state.update_base(tokens[0])
+            if mnemonic == 'hex' or mnemonic == 'dec' or mnemonic == 'oct' or mnemonic == 'bin': 
+                logging.debug("Changing base to: %s", mnemonic)
+                calculator_state.update_base(mnemonic)
 
-            logging.info(f"Adding instruction: {tokens[0]} with no argument to the program.")
-            calculator_state.program.append(instr(tokens[0], None, calculator_state))
+            logging.info("Adding instruction: %s with no argument to the program.", mnemonic)
+            encode_instruction(mnemonic, None, calculator_state)
     else:
-        logging.critical(f"Invalid instruction: {tokens[0]} (line number {input_line_number})")
-        sys.exit(1)
+        raise InvalidInstructionError(f"Invalid instruction: {mnemonic}", input_line_number, tokens[0].column)
+
+
+def encode_instruction(mnemonic, argument, calculator_state):
+    profiler = calculator_state.profiler
+    if profiler is not None:
+        profiler.start("encode")
+    line = keystroke(mnemonic, argument)
+    calculator_state.program.append(line)
+    if line.instruction in TRACKED_INSTRUCTIONS: # Most steps change neither, so the trackers are only called for these
+        track_index_register(line, calculator_state)
+        track_word_mode(line, calculator_state)
+    if profiler is not None:
+        profiler.stop()
 
 
-def parse_number(token, calculator_state, input_line_number):
+def parse_number(number_token, calculator_state, input_line_number):
     # Parse the number and return the corresponding keypresses
+    token = number_token.text
+    column = number_token.column
     token_base = ""
     change_base = False
     change_mode = False
@@ -117,7 +320,8 @@ def parse_number(token, calculator_state, input_line_number):
         token = token[1:]
 
     # Check if the number is a floating point number
-    if token.find(".") != -1 or calculator_state.sign_mode == 3:
+    # Integers without a base prefix are entered as floats in floating point mode
+    if number_token.kind is TokenKind.FLOAT or (calculator_state.sign_mode == 3 and number_token.base is None):
         is_float = True
 
         # Check if we need to change the sign mode to floating point mode
@@ -125,6 +329,7 @@ def parse_number(token, calculator_state, input_line_number):
             change_mode = True
             calculator_state.previous_sign_mode = calculator_state.sign_mode
             calculator_state.sign_mode = 3
+            calculator_state.word_mode_known = False # Floating point mode is left with a 56-bit word in 2's complement
         
         # Check if the number is in scientific notation
         if token.find("e") != -1:
@@ -132,8 +337,7 @@ def parse_number(token, calculator_state, input_line_number):
 
         # Check if the number is valid
         if not is_valid_float(token, calculator_state):
-            logging.critical("Invalid floating point number: " + token + "(line number )"+ calculator_state.input_line_number)
-            sys.exit(1)
+            raise InvalidNumberError(f"Invalid floating point number: {token}", input_line_number, column)
 
         # We have a valid floating point number
         if is_float_in_sci_notation:
@@ -160,29 +364,24 @@ def parse_number(token, calculator_state, input_line_number):
         if (calculator_state.sign_mode == 3):
             change_mode = True
             calculator_state.sign_mode = calculator_state.previous_sign_mode
+            calculator_state.word_mode_known = False
 
-        # Determine the base of the number
-        if token.find("0x") != -1:
-            token_base = "HEX"
-            token = token[2:] # Remove the "0x" prefix
-        elif token.find("0b") != -1:
-            token_base = "BIN"
-            token = token[2:] # Remove the "0b" prefix
-        elif token.find("0o") != -1:
-            token_base = "OCT"
-            token = token[2:] # Remove the "0o" prefix
-        elif token.find("0d") != -1:
-            token_base = "DEC"
-            token = token[2:] # Remove the "0d" prefix
+        # Determine the base of the number from its prefix (the lexer has already recognised it)
+        if number_token.base is not None:
+            token_base = number_token.base
+            token = token[2:] # Remove the "0x", "0b", "0o" or "0d" prefix
         else:
             token_base = calculator_state.base
 
-        if not is_valid_integer(token, calculator_state):
-            logging.critical(f"Invalid integer: {token} (line number {input_line_number})")
-            sys.exit(1)
+        # Validate the digits in the base the number is entered in
+        if not is_valid_integer(token, BASE_VALUES[token_base.lower()], calculator_state.word_size):
+            raise InvalidNumberError(f"Invalid integer: {token}", input_line_number, column)
 
+        incoming_base = calculator_state.base_numeric
         if token_base.lower() != calculator_state.base.lower():
             change_base = True
+            # Keep track of the base the calculator is in after this number
+            calculator_state.update_base(token_base.lower())
 
         token = token.upper()
 
@@ -193,156 +392,123 @@ def parse_number(token, calculator_state, input_line_number):
         # We have a valid integer
         # We are ready to print the keypresses
 
+    # The number is valid, so the rest only emits its keystrokes
+    profiler = calculator_state.profiler
+    if profiler is not None:
+        profiler.start("encode")
+
+    # With -O, enter the number with the fewest keys that give the same value
+    if calculator_state.optimize:
+        if is_float:
+            keys, bytes_saved = shortest_float_keys(token.lower(), negative)
+            if change_mode:
+                keys = [("FLOAT", None), (".", None)] + keys
+        else:
+            keys, bytes_saved = shortest_integer_keys(token, BASE_VALUES[token_base.lower()], negative, incoming_base, change_mode,
+                *literal_word_mode(calculator_state))
+        calculator_state.program.extend(keystroke(instruction, argument) for instruction, argument in keys)
+        calculator_state.literal_bytes_saved += bytes_saved
+
     # For floats
-    if (is_float and change_mode): # Switch to floating point mode
-        calculator_state.program.append(instr("FLOAT", None, calculator_state))
-        calculator_state.program.append(instr(".", None, calculator_state))
-        calculator_state.program_length += 2
+    elif (is_float and change_mode): # Switch to floating point mode
+        calculator_state.program.append(keystroke("FLOAT", None))
+        calculator_state.program.append(keystroke(".", None))
 
         if(is_float_in_sci_notation): # Floating point number in scientific notation
             if(negative):
-                for digit in token:
-                    calculator_state.program.append(instr(digit, None, calculator_state))
-                    calculator_state.program_length += 1
-                calculator_state.program.append(instr("CHS", None, calculator_state))
-                calculator_state.program_length += 1
+                for digit in mantissa:
+                    calculator_state.program.append(keystroke(digit, None))
+                calculator_state.program.append(keystroke("CHS", None))
             else:
-                for digit in token:
-                    calculator_state.program.append(instr(digit, None, calculator_state))
-                    calculator_state.program_length += 1
+                for digit in mantissa:
+                    calculator_state.program.append(keystroke(digit, None))
 
             if(negative_exponent): 
-                calculator_state.program.append(instr("EEX", None, calculator_state))
+                calculator_state.program.append(keystroke("EEX", None))
                 for digit in exponent:
-                    calculator_state.program.append(instr(digit, None, calculator_state))
-                    calculator_state.program_length += 1
-                calculator_state.program.append(instr("CHS", None, calculator_state))
-                calculator_state.program_length += 2
+                    calculator_state.program.append(keystroke(digit, None))
+                calculator_state.program.append(keystroke("CHS", None))
             else:
-                calculator_state.program.append(instr("EEX", None, calculator_state))
+                calculator_state.program.append(keystroke("EEX", None))
                 for digit in exponent:
-                    calculator_state.program.append(instr(digit, None, calculator_state))
-                    calculator_state.program_length += 1
-                calculator_state.program_length += 1
+                    calculator_state.program.append(keystroke(digit, None))
 
         else: # Floating point number
             if(negative):
                 for digit in token:
-                    calculator_state.program.append(instr(digit, None, calculator_state))
-                    calculator_state.program_length += 1
-                calculator_state.program.append(instr("CHS", None, calculator_state))
-                calculator_state.program_length += 1
+                    calculator_state.program.append(keystroke(digit, None))
+                calculator_state.program.append(keystroke("CHS", None))
             else:
                 for digit in token:
-                    calculator_state.program.append(instr(digit, None, calculator_state))
-                    calculator_state.program_length += 1
+                    calculator_state.program.append(keystroke(digit, None))
 
     elif (is_float): # Floating point number and already in floating point mode
         if(is_float_in_sci_notation): # Floating point number in scientific notation
             if(negative):
-                for digit in token:
-                    calculator_state.program.append(instr(digit, None, calculator_state))
-                    calculator_state.program_length += 1
-                calculator_state.program.append(instr("CHS", None, calculator_state))
-                calculator_state.program_length += 1
+                for digit in mantissa:
+                    calculator_state.program.append(keystroke(digit, None))
+                calculator_state.program.append(keystroke("CHS", None))
             else:
-                for digit in token:
-                    calculator_state.program.append(instr(digit, None, calculator_state))
-                    calculator_state.program_length += 1
+                for digit in mantissa:
+                    calculator_state.program.append(keystroke(digit, None))
 
             if(negative_exponent):
-                calculator_state.program.append(instr("EEX", None, calculator_state))
+                calculator_state.program.append(keystroke("EEX", None))
                 for digit in exponent:
-                    calculator_state.program.append(instr(digit, None, calculator_state))
-                    calculator_state.program_length += 1
-                calculator_state.program.append(instr("CHS", None, calculator_state))
-                calculator_state.program_length += 2
+                    calculator_state.program.append(keystroke(digit, None))
+                calculator_state.program.append(keystroke("CHS", None))
             else:
-                calculator_state.program.append(instr("EEX", None, calculator_state))
+                calculator_state.program.append(keystroke("EEX", None))
                 for digit in exponent:
-                    calculator_state.program.append(instr(digit, None, calculator_state))
-                    calculator_state.program_length += 1
-                calculator_state.program_length += 1
+                    calculator_state.program.append(keystroke(digit, None))
 
         else: # Floating point number
             if(negative):
                 for digit in token:
-                    calculator_state.program.append(instr(digit, None, calculator_state))
-                    calculator_state.program_length += 1
-                calculator_state.program.append(instr("CHS", None, calculator_state))
-                calculator_state.program_length += 1
+                    calculator_state.program.append(keystroke(digit, None))
+                calculator_state.program.append(keystroke("CHS", None))
 
             else:
                 for digit in token:
-                    calculator_state.program.append(instr(digit, None, calculator_state))
-                    calculator_state.program_length += 1
+                    calculator_state.program.append(keystroke(digit, None))
 
     elif(change_mode or change_base): # Switching from float to integer mode
                     #  OR already in integer mode, but changing the base
-        logging.debug(f"Changing mode to: {token_base}")
-        calculator_state.program.append(instr(token_base.upper(), None, calculator_state))
-        calculator_state.program_length += 1
+        logging.debug("Changing mode to: %s", token_base)
+        calculator_state.program.append(keystroke(token_base.upper(), None))
 
         if (negative):
             for digit in token:
-                calculator_state.program.append(instr(digit, None, calculator_state))
-                calculator_state.program_length += 1
-            calculator_state.program.append(instr("CHS", None, calculator_state))
-            calculator_state.program_length += 1
+                calculator_state.program.append(keystroke(digit, None))
+            calculator_state.program.append(keystroke("CHS", None))
         else:
             for digit in token:
-                calculator_state.program.append(instr(digit, None, calculator_state))
-                calculator_state.program_length += 1
+                calculator_state.program.append(keystroke(digit, None))
 
     else: # Already in integer mode and base
         if (negative):
             for digit in token:
-                calculator_state.program.append(instr(digit, None, calculator_state))
-                calculator_state.program_length += 1
-            calculator_state.program.append(instr("CHS", None, calculator_state))
-            calculator_state.program_length += 1
+                calculator_state.program.append(keystroke(digit, None))
+            calculator_state.program.append(keystroke("CHS", None))
         else:
             for digit in token:
-                calculator_state.program.append(instr(digit, None, calculator_state))
-                calculator_state.program_length += 1
+                calculator_state.program.append(keystroke(digit, None))
 
-def is_valid_integer(token, calculator_state):
-    # Check if the number is valid
-    # Does the token contain the correct characters for the base?
-    acceptable_hex_chars = "0123456789abcdef"
-    acceptable_dec_chars = "0123456789"
-    acceptable_oct_chars = "01234567"
-    acceptable_bin_chars = "01"
-
-    if calculator_state.base == 16:
-        for char in token:
-            if char not in acceptable_hex_chars:
-                return False
-    elif calculator_state.base == 10:
-        for char in token:
-            if char not in acceptable_dec_chars:
-                return False
-    elif calculator_state.base == 8:
-        for char in token:
-            if char not in acceptable_oct_chars:
-                return False
-    elif calculator_state.base == 2:
-        for char in token:
-            if char not in acceptable_bin_chars:
-                return False
+    if profiler is not None:
+        profiler.stop()
 
+def is_valid_integer(token, base_numeric, word_size):
+    # Check if the number is valid in the given base
     # Is the number within the range of the word size?
-    logging.debug(f"Token: {token} Base: {calculator_state.base_numeric}")
+    logging.debug("Token: %s Base: %s", token, base_numeric)
     try:
-        num = int(token, calculator_state.base_numeric)
+        num = int(token, base_numeric)
     except ValueError:
-        # Handle the error, for example, by setting num to None or logging an error message
-        num = None
-        logging.critical(f"Error: {token} is not a valid number in base {calculator_state.base_numeric}")
+        logging.debug("%s is not a valid number in base %s", token, base_numeric)
         return False
     if num < 0:
         return False
-    if (calculator_state.word_size is not None) and (num >= 2 ** calculator_state.word_size):
+    if (word_size is not None) and (num >= 2 ** word_size):
         return False
     
     return True
@@ -359,7 +525,7 @@ def is_valid_float(token, calculator_state):
         if char == "e":
             contains_e = True
         if char not in acceptable_float_chars:
-            logging.debug("Invalid character: {char}")
+            logging.debug("Invalid character: %s", char)
             return False
 
 
@@ -373,19 +539,19 @@ def is_valid_float(token, calculator_state):
         if exponent[0] == "-":
             exponent = exponent[1:]
 
-        logging.debug("Checking if exponent: {exponent} is valid.")
-        if not is_valid_integer(exponent, calculator_state):
-            logging.debug("Invalid exponent: {exponent}")
+        logging.debug("Checking if exponent: %s is valid.", exponent)
+        if not is_valid_integer(exponent, 10, calculator_state.word_size):
+            logging.debug("Invalid exponent: %s", exponent)
             return False
         num = float(mantissa) ** float(exponent)
     else:
         num = float(token)
 
     if num > 9.999999999 * 10**99 or num < -9.999999999 * 10**99:
-        logging.debug("Number out of range: {num}")
+        logging.debug("Number out of range: %s", num)
         return False
     
-    logging.debug("Valid floating point number: {token}")
+    logging.debug("Valid floating point number: %s", token)
     return True
 
 
@@ -398,39 +564,46 @@ def is_valid_instruction(instr):
 
 
 def is_valid_argument(instr, arg):
-    logging.info("Checking if argument: {arg} is valid for instruction: {instr}")
+    logging.info("Checking if argument: %s is valid for instruction: %s", arg, instr)
     
+    # DSZ and ISZ count I on their own, or take a named loop counter (e.g. @count) that is given I
+    if(instr == 'dsz' or instr == 'isz'):
+        return is_register_name(arg)
+
     # Check if the instruction takes an argument
     if instr not in instructions_with_arguments:
-        logging.debug("Instruction: {instr} does not take an argument.")
+        logging.debug("Instruction: %s does not take an argument.", instr)
         return False
-    logging.debug("Instruction: {instr} takes an argument.")
+    logging.debug("Instruction: %s takes an argument.", instr)
 
     # Check if the argument is valid
     if(instr == 'sto' or instr == 'rcl'):
-        logging.debug("Checking if argument: {arg} is valid for a STO or RCL instruction.")
+        logging.debug("Checking if argument: %s is valid for a STO or RCL instruction.", arg)
         
         # check if the argument is I or (i)
         if(arg == 'i' or arg == '(i)'):
             return True
-        elif(arg.isdigit() and int(arg) >= 0 and int(arg) <= 31):
+        elif(is_register_name(arg)): # A named register, e.g. @limit
+            return True
+        elif(arg.isdigit()): # Registers above R31 are reached through I
             return True
         else:
             return False
     elif(instr == 'sf' or instr == 'cf' or instr == 'f?'):
-        logging.debug("Checking if argument: {arg} is valid for a SF, CF, or F? instruction.")
+        logging.debug("Checking if argument: %s is valid for a SF, CF, or F? instruction.", arg)
         
         if(arg.isdigit() and int(arg) >= 0 and int(arg) <= 5):
             return True
         else:
             return False
     elif(instr == 'sb' or instr == 'cb' or instr == 'b?'):
-        logging.critical("ERROR: Setting/Clearing/Testing a bit does not take an argument")
-        sys.exit(1)
+        raise InvalidArgumentError("ERROR: Setting/Clearing/Testing a bit does not take an argument")
     elif(instr == 'lbl' or instr == 'gto' or instr == 'gsb'):
-        logging.debug("Checking if argument: {arg} is valid for a LBL, GTO, or GSB instruction.")
+        logging.debug("Checking if argument: %s is valid for a LBL, GTO, or GSB instruction.", arg)
         
-        if(arg.isdigit() and int(arg) >= 0 and int(arg) < 16):
+        if(is_label_name(arg)): # A named label, e.g. @loop
+            return True
+        elif(arg.isdigit() and int(arg) >= 0 and int(arg) < 16):
             return True
         elif(arg in 'abcdef'):
             return True
@@ -439,14 +612,14 @@ def is_valid_argument(instr, arg):
         else:
             return False
     elif(instr == 'show'):
-        logging.debug("Checking if argument: {arg} is valid for a SHOW instruction.")
+        logging.debug("Checking if argument: %s is valid for a SHOW instruction.", arg)
         
         if(arg == 'hex' or arg == 'dec' or arg == 'oct' or arg == 'bin'):
             return True
         else:
             return False
     elif(instr == 'float'):
-        logging.debug("Checking if argument: {arg} is valid for a FLOAT instruction.")
+        logging.debug("Checking if argument: %s is valid for a FLOAT instruction.", arg)
         
         if(arg.isdigit() and int(arg) >= 0 and int(arg) <= 9):
             return True
@@ -455,7 +628,7 @@ def is_valid_argument(instr, arg):
         else:
             return False
     elif(instr == 'window'):
-        logging.debug("Checking if argument: {arg} is valid for a WINDOW instruction.")
+        logging.debug("Checking if argument: %s is valid for a WINDOW instruction.", arg)
         
         # This doesn't exclude all invalid arguments, but this instruction will be used so rarely that it doesn't matter
         if(arg.isdigit() and int(arg) >= 0 and int(arg) <= 7):
@@ -463,13 +636,13 @@ def is_valid_argument(instr, arg):
         else:
             return False
     elif(instr == 'clear'):
-        logging.debug("Checking if argument: {arg} is valid for a CLEAR instruction.")
+        logging.debug("Checking if argument: %s is valid for a CLEAR instruction.", arg)
         
         if(arg == 'reg'):
             return True
         else:
             return False
     else:
-        logging.debug("Did not find a valid argument for instruction: {instr}")
+        logging.debug("Did not find a valid argument for instruction: %s", instr)
         
         return False
\ No newline at end of file
@@ -0,0 +1,150 @@
+# Peephole optimizer for assembled programs (jovial -O)
+# Each rule looks at a short window of program steps and removes the steps that cannot change what the program computes
+# The rules are run in order, again and again until none of them removes anything, since one rule can make room for another
+# (e.g. removing dead code can leave two base keys next to each other)
+#
+# Rules are functions that take the program (a list of instruction records) and return the optimized program
+# New rules are added to PEEPHOLE_RULES, and the optimizer reports the bytes saved by each rule by name
+# The rules that rewrite branches through tests and labels are in Branch_Optimizer.py
+#
+# The HP-16C skips the step after a conditional test (and after DSZ, ISZ, F? and B?), so the step after one of them
+# is never removed or changed: removing it would make the test skip a different step (the branch rules follow the skip
+# to see what it lands on instead)
+
+from Branch_Optimizer import invert_skipped_jumps, move_jumped_blocks, remove_jumps_to_next_step, remove_unused_labels, thread_jumps
+from Control_Flow import is_conditional
+from Instructions import DIGIT_KEYS, keystroke
+from Label_Allocator import is_label_reference
+from Register_Allocator import count_registers
+
+BASE_KEYS = frozenset(["HEX", "DEC", "OCT", "BIN"])
+
+
+def float_mode_length(program, index):
+    # Returns the number of steps of the FLOAT . at index (FLOAT . is either one step, or FLOAT and . as two steps), or 0
+    line = program[index]
+    if line.instruction != "FLOAT":
+        return 0
+    if line.argument == ".":
+        return 1
+    if line.argument is None and index + 1 < len(program) and program[index + 1].instruction == ".":
+        return 2
+    return 0
+
+
+def remove_redundant_base_keys(program):
+    # HEX DEC -> DEC: a base key followed by another base key has no effect
+    optimized = []
+    for index, line in enumerate(program):
+        if (line.instruction in BASE_KEYS and index + 1 < len(program) and program[index + 1].instruction in BASE_KEYS
+                and not is_conditional(program, index)):
+            continue
+        optimized.append(line)
+    return optimized
+
+
+def remove_float_round_trips(program):
+    # FLOAT . HEX CLx -> HEX CLx: switching to floating point mode and straight back to an integer base is not a no-op,
+    # since it converts Y * 2^X to a float in X and back, which changes X and Y (and leaves a 56-bit word in 2's complement)
+    # It is only removed when the step after the base keys overwrites X (CLx or a digit key), and the program must not
+    # rely on the Y, Z, T or word size that the round trip leaves behind
+    optimized = []
+    index = 0
+    while index < len(program):
+        length = float_mode_length(program, index)
+        following = index + length
+        while length and following < len(program) and program[following].instruction in BASE_KEYS:
+            following += 1
+        if (length and following > index + length and following < len(program)
+                and (program[following].instruction == "CLx" or program[following].instruction in DIGIT_KEYS)
+                and not is_conditional(program, index)):
+            index += length
+            continue
+        optimized.append(program[index])
+        index += 1
+    return optimized
+
+
+def remove_redundant_stores(program):
+    # STO n STO n -> STO n, and RCL n STO n -> RCL n: the register already holds the value in X
+    optimized = []
+    for index, line in enumerate(program):
+        if (line.instruction == "STO" and index > 0 and program[index - 1].instruction in ("STO", "RCL")
+                and program[index - 1].argument == line.argument and not is_conditional(program, index - 1)):
+            continue
+        optimized.append(line)
+    return optimized
+
+
+def remove_unreachable_code(program):
+    # GTO 1 CHS LBL 2 -> GTO 1 LBL 2: the steps after an unconditional GTO or RTN are only reached through a label
+    optimized = []
+    unreachable = False
+    for index, line in enumerate(program):
+        if line.instruction == "LBL":
+            unreachable = False
+        if not unreachable:
+            optimized.append(line)
+            if line.instruction in ("GTO", "RTN") and not is_conditional(program, index):
+                unreachable = True
+    return optimized
+
+
+def replace_tail_calls(program):
+    # GSB 1 RTN -> GTO 1: the subroutine's own RTN returns straight to the caller, which saves a step and a return stack level
+    # After a test, the test can skip the GSB and land on the RTN, so the RTN is kept and only the return stack level is saved
+    optimized = []
+    for index, line in enumerate(program):
+        if line.instruction == "RTN" and index > 0 and program[index - 1].instruction == "GSB" and not is_conditional(program, index - 1):
+            continue
+        if line.instruction == "GSB" and index + 1 < len(program) and program[index + 1].instruction == "RTN":
+            line = tail_call(line)
+        optimized.append(line)
+    return optimized
+
+
+def tail_call(line):
+    # The GTO that replaces a GSB (named labels are still placeholders, with the name as the argument)
+    if is_label_reference(line):
+        return line._replace(instruction="GTO")
+    return keystroke("gto", line.key[1])
+
+
+# Name -> rule, in the order the rules are run
+PEEPHOLE_RULES = {
+    "redundant base keys": remove_redundant_base_keys,
+    "float round trips": remove_float_round_trips,
+    "redundant stores": remove_redundant_stores,
+    "unreachable code": remove_unreachable_code,
+    "tail calls": replace_tail_calls,
+    "inverted tests": invert_skipped_jumps,
+    "jumps to the next step": remove_jumps_to_next_step,
+    "threaded jumps": thread_jumps,
+    "block layout": move_jumped_blocks,
+    "unused labels": remove_unused_labels,
+}
+
+
+def optimize(calculator_state, rules=None):
+    # Replace calculator_state.program with the optimized program, and update the program length, memory, and registers to match
+    # rules is a list of rule names from PEEPHOLE_RULES (default = all of them)
+    # Returns {rule name: bytes saved}, starting with the bytes saved by the literal encoder while the program was parsed
+    rule_names = list(PEEPHOLE_RULES) if rules is None else rules
+    savings = {"shortest literals": calculator_state.literal_bytes_saved}
+    savings.update((rule_name, 0) for rule_name in rule_names)
+    program = calculator_state.program
+    changed = True
+    while changed:
+        changed = False
+        for rule_name in rule_names:
+            optimized = PEEPHOLE_RULES[rule_name](program)
+            if optimized != program: # A rule can change a step without removing one (e.g. a tail call after a test)
+                savings[rule_name] += len(program) - len(optimized)
+                program = optimized
+                changed = True
+
+    calculator_state.program = program
+    count_registers(calculator_state, program) # Removed code may have been the only use of a register
+    calculator_state.update_program_length()
+    calculator_state.update_memory()
+    return savings
@@ -0,0 +1,75 @@
+import time
+
+# Phase level profiler (jovial --profile, or assemble(..., profiler=Profiler()) from code)
+# The assembler calls start() and stop() around each phase when calculator_state.profiler is set, and does nothing otherwise
+# Phases can be nested (e.g. encode inside parse), and the time of a phase does not include the phases nested in it,
+# so the phase times add up to the time spent assembling
+#
+# Phases:
+#   read         Reading the source lines
+#   tokenize     Splitting lines into tokens
+#   parse        Checking instructions, arguments and numbers
+#   encode       Turning instructions and digits into keystrokes
+#   memory       Tracking the program length, memory partition and registers
+#   render <x>   Writing the output in format x (16c, txt or pdf)
+
+PHASE_ORDER = ["read", "tokenize", "parse", "encode", "memory"]
+
+
+class Profiler:
+    def __init__(self):
+        self.calls = {} # Phase -> number of times the phase was run
+        self.seconds = {} # Phase -> time spent in the phase, without the phases nested in it
+        self.started = time.perf_counter()
+        self.stack = [] # [phase, start time, time spent in nested phases] for each running phase
+
+    def start(self, phase):
+        self.stack.append([phase, time.perf_counter(), 0.0])
+
+    def stop(self):
+        phase, start, nested = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + elapsed - nested
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    def stop_all(self):
+        # Stop every running phase, after an error skipped the stop() calls
+        while self.stack:
+            self.stop()
+
+    def timed(self, phase, iterable):
+        # Yields from the iterable, counting the time taken to produce each item as the phase
+        iterator = iter(iterable)
+        while True:
+            self.start(phase)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.stop()
+            yield item
+
+    def results(self):
+        # Returns {phase: (calls, seconds)}, in phase order
+        phases = [phase for phase in PHASE_ORDER if phase in self.calls] + sorted(phase for phase in self.calls if phase not in PHASE_ORDER)
+        return {phase: (self.calls[phase], self.seconds[phase]) for phase in phases}
+
+    def merge(self, results):
+        # Add the results of another profiler (e.g. from a batch worker process)
+        for phase, (calls, seconds) in results.items():
+            self.calls[phase] = self.calls.get(phase, 0) + calls
+            self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+
+    def print_report(self, output_file, title="Profile:"):
+        results = self.results()
+        total = sum(seconds for _, seconds in results.values())
+        print(title.ljust(80, '.'), file=output_file)
+        print("Phase          Calls    Time (ms)  Share", file=output_file)
+        for phase, (calls, seconds) in results.items():
+            share = seconds / total if total > 0 else 0
+            print(f"{phase:12} {calls:7} {seconds * 1000:12.3f}  {share:5.1%}", file=output_file)
+        print(f"{'total':12} {'':7} {total * 1000:12.3f}", file=output_file)
+        print(f"Wall time: {(time.perf_counter() - self.started) * 1000:.3f} ms", file=output_file)
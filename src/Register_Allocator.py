@@ -0,0 +1,191 @@
+import logging
+import re
+from collections import namedtuple
+
+from Assembler_Errors import AddressRangeError
+from Control_Flow import entry_points, label_positions, successors
+from Instructions import keystroke
+
+# Register allocator for named registers (sto @limit, rcl @limit)
+# A named register is a STO or RCL step whose register is picked by the assembler once the whole program is parsed
+# The allocator works out where each name is live (from a STO that sets it to the last RCL that can read that value),
+# following GTO, GSB, RTN and skips across labels. Two names interfere if one is set while the other is live, or if
+# both are live when the program starts (e.g. inputs stored from the keyboard before running the program)
+# Names that never interfere share a register, and each name gets the lowest numbered register that none of the names
+# it interferes with have, so the registers stay packed at the bottom of memory and the memory partition moves down less
+#
+# Registers written as numbers (sto 2) are never given to a name, since the program uses them for something else
+# Registers reached through (i) are not known to the assembler, so programs that mix names and (i) should avoid
+# indexing the low registers
+#
+# A name used as a loop counter (dsz @count, isz @count, loop @count @top) is given I instead, since DSZ and ISZ only
+# count I down or up. Its STO and RCL steps become STO I and RCL I, so the program must not use I for anything else,
+# and counters that interfere cannot share it
+
+DIRECT_REGISTERS = 32 # STO and RCL can only reach registers 0-31 directly
+
+INDEX_REGISTER = "I" # The register given to loop counters
+
+# Steps that count I down or up, for a name given I
+COUNTER_INSTRUCTIONS = frozenset(["DSZ", "ISZ"])
+
+# The linker qualifies names that belong to one module with the module name (e.g. @lib.r3)
+REGISTER_NAME_PATTERN = re.compile(r"@[a-z_][a-z0-9_]*(?:\.[a-z0-9_]+)?")
+
+# A STO, RCL, DSZ or ISZ step whose register has not been allocated yet (instruction is "STO", "RCL", "DSZ" or "ISZ"
+# and argument is the name, as on an instruction record, so the optimizer can look at it like any other step)
+RegisterReference = namedtuple("RegisterReference", ["instruction", "argument", "line_number", "column"])
+
+
+def is_register_name(argument):
+    return argument.startswith("@") and REGISTER_NAME_PATTERN.fullmatch(argument) is not None # Most arguments are not names
+
+
+def register_reference(mnemonic, name, line_number, column):
+    return RegisterReference(mnemonic.upper(), name, line_number, column)
+
+
+def is_register_reference(line):
+    return type(line) is RegisterReference
+
+
+def has_register_references(program):
+    return RegisterReference in map(type, program) # Without a Python loop, as most programs have no named registers
+
+
+def uses_index(line):
+    # True if a step uses I (for anything other than a loop counter that is not allocated yet)
+    if is_register_reference(line):
+        return False
+    if line.instruction in ("STO", "RCL", "GTO", "GSB"):
+        return line.argument in ("I", "(i)")
+    return line.instruction in ("DSZ", "ISZ", "X<=>I", "X<=>(i)", "CLEAR REG")
+
+
+def allocated_step(line, register):
+    # The step that replaces a named register's STO, RCL, DSZ or ISZ step
+    if register == INDEX_REGISTER:
+        return keystroke(line.instruction.lower(), "i" if line.instruction in ("STO", "RCL") else None)
+    return keystroke(line.instruction.lower(), str(register))
+
+
+def allocate_counters(program, counters, interferes):
+    # Returns {counter: "I"}, or raises AddressRangeError if I is not free for every counter
+    first = {}
+    for line in program:
+        if is_register_reference(line) and line.instruction in COUNTER_INSTRUCTIONS:
+            first.setdefault(line.argument, line)
+    index_use = next((line for line in program if uses_index(line)), None)
+    allocation = {}
+    for name in counters:
+        counter = first[name]
+        if index_use is not None:
+            step = index_use.instruction if index_use.argument is None else f"{index_use.instruction} {index_use.argument}"
+            raise AddressRangeError(f"Error - I is not free for {name}: {counter.instruction} {name} keeps its count in I, but the program also uses I ({step})", counter.line_number, counter.column)
+        other = next((other for other in allocation if other in interferes[name]), None)
+        if other is not None:
+            raise AddressRangeError(f"Error - I is not free for {name}: {counter.instruction} {name} keeps its count in I, but I holds {other} while {name} is counting", counter.line_number, counter.column)
+        allocation[name] = INDEX_REGISTER
+        logging.info("Allocated register I to %s", name)
+    return allocation
+
+
+def counted_loops(program):
+    # Yields (index, register, "DSZ" or "ISZ") for each counter update and test written out by hand:
+    #   RCL n 1 - STO n x!=0 GTO <label>
+    # which DSZ GTO <label> does in 2 steps with the counter in I (ISZ for 1 +). The sequence leaves the count in X and lifts
+    # the stack while DSZ leaves the stack alone, so it is not rewritten, only pointed out
+    for index in range(len(program) - 5):
+        rcl = program[index]
+        if rcl.instruction != "RCL" or rcl.argument in ("I", "(i)"):
+            continue # Most steps are not a RCL, so the rest of the sequence is only looked at after one
+        one, operation, sto, test, jump = program[index + 1:index + 6]
+        if (one.instruction == "1" and operation.instruction in ("-", "+")
+                and sto.instruction == "STO" and sto.argument == rcl.argument and test.instruction == "x!=0" and jump.instruction == "GTO"):
+            yield index, rcl.argument, "DSZ" if operation.instruction == "-" else "ISZ"
+
+
+def count_registers(calculator_state, program):
+    # Recount the registers after steps were removed (key holds the register number as it was written)
+    # Registers above R31 are reached through I, so they are not named by any step and are kept
+    # Named registers are not allocated yet, so they are not counted
+    indirect_registers = {register for register in calculator_state.registers_used if register >= DIRECT_REGISTERS}
+    calculator_state.registers_used = {int(line.key[1]) for line in program if line.instruction in ("STO", "RCL")
+        and not is_register_reference(line) and line.key[1].isdigit()} | indirect_registers
+
+
+def live_names(program):
+    # Returns (names live before each step, names live after each step), by iterating the liveness equations to a fixpoint
+    following = successors(program)
+    live_in = [frozenset()] * len(program)
+    live_out = [frozenset()] * len(program)
+    changed = True
+    while changed:
+        changed = False
+        for index in reversed(range(len(program))):
+            line = program[index]
+            out = frozenset().union(*(live_in[step] for step in following[index]))
+            live = out
+            if is_register_reference(line):
+                if line.instruction == "STO":
+                    live = live - {line.argument}
+                else:
+                    live = live | {line.argument}
+            if live != live_in[index] or out != live_out[index]:
+                live_in[index] = live
+                live_out[index] = out
+                changed = True
+    return live_in, live_out
+
+
+def interference(program, names):
+    # Returns {name: set of names it cannot share a register with}
+    live_in, live_out = live_names(program)
+    interferes = {name: set() for name in names}
+
+    def conflict(name, others):
+        for other in others:
+            if other != name:
+                interferes[name].add(other)
+                interferes[other].add(name)
+
+    for index, line in enumerate(program):
+        if is_register_reference(line) and line.instruction == "STO":
+            conflict(line.argument, live_out[index])
+    for index in entry_points(program, label_positions(program)):
+        for name in live_in[index]:
+            conflict(name, live_in[index])
+    return interferes
+
+
+def allocate_registers(calculator_state):
+    # Give every named register a physical register, and replace its STO and RCL steps with the real ones
+    # Returns {name: register} (empty if the program does not use named registers)
+    program = calculator_state.program
+    references = [line for line in program if is_register_reference(line)]
+    if not references:
+        return {}
+
+    names = list(dict.fromkeys(line.argument for line in references)) # In order of first use
+    interferes = interference(program, names)
+    counters = list(dict.fromkeys(line.argument for line in references if line.instruction in COUNTER_INSTRUCTIONS))
+    reserved = set(calculator_state.registers_used)
+    allocation = allocate_counters(program, counters, interferes)
+    for name in names:
+        if name in allocation:
+            continue
+        taken = reserved | {allocation[other] for other in interferes[name] if other in allocation}
+        register = next((register for register in range(DIRECT_REGISTERS) if register not in taken), None)
+        if register is None:
+            first = next(line for line in references if line.argument == name)
+            raise AddressRangeError(f"Error - Out of direct memory range: No register between 0 and {DIRECT_REGISTERS - 1} is free for {name}", first.line_number, first.column)
+        allocation[name] = register
+        logging.info("Allocated register %d to %s", register, name)
+
+    calculator_state.program = [allocated_step(line, allocation[line.argument]) if is_register_reference(line) else line for line in program]
+    for name, register in allocation.items():
+        if register != INDEX_REGISTER and register not in calculator_state.registers_used:
+            calculator_state.use_register(register)
+    calculator_state.register_allocation = allocation
+    calculator_state.update_memory()
+    return allocation
@@ -0,0 +1,119 @@
+import os
+
+from Assembler_Errors import AssemblerError
+from Calculator_State import CalculatorState
+from Diagnostics import diagnostic_from_error, has_errors
+from Lexer import tokenize_line
+from Output import STDOUT_NAME, output_all
+from Parse_File import STDIN_NAME, parse_lines, read_source_lines
+
+# Stream mode assembles a stream of source lines one program at a time
+# The lines are read lazily from a file, stdin, or an in-memory buffer, and each program is written as soon as it is assembled,
+# so a stream of many concatenated programs is assembled with flat memory use
+#
+# Programs in a stream are separated by a directive line that names the next program:
+#   #program factorial
+# A stream without directives is a single program. Programs named by a directive are written to <output file>-<program name>
+
+PROGRAM_DIRECTIVE = "#program"
+
+
+def program_name_of(line):
+    # Returns the program name if the line is a #program directive, otherwise None
+    stripped_line = line.strip()
+    if not stripped_line.lower().startswith(PROGRAM_DIRECTIVE):
+        return None
+    name = stripped_line[len(PROGRAM_DIRECTIVE):].strip()
+    return name if name != "" else "program"
+
+
+def split_programs(lines, first_name):
+    # Yields (program name, lines of the program, True if the program was started by a directive) for each program in the stream
+    # The lines of each program are a generator over the shared stream, so they must be used up before asking for the next program
+    lines = iter(lines)
+
+    # Blank and comment lines before a leading directive are skipped, rather than assembled into an empty program
+    leading_lines = []
+    next_name = None
+    for line in lines:
+        next_name = program_name_of(line)
+        if next_name is not None:
+            break
+        leading_lines.append(line)
+        if len(tokenize_line(line, len(leading_lines))) > 0:
+            break
+
+    if next_name is None:
+        next_name = first_name
+        started_by_directive = False
+    else:
+        leading_lines = []
+        started_by_directive = True
+
+    while next_name is not None:
+        name, next_name = next_name, None
+
+        def program_lines(leading_lines):
+            nonlocal next_name
+            yield from leading_lines
+            for line in lines:
+                program_name = program_name_of(line)
+                if program_name is not None:
+                    next_name = program_name
+                    return
+                yield line
+
+        yield name, program_lines(leading_lines), started_by_directive
+        leading_lines = []
+        started_by_directive = True
+
+
+def program_output_files(output_files, program_name, started_by_directive):
+    # Programs named by a #program directive get their own output files, named after the program
+    if not started_by_directive:
+        return output_files
+    return [(output_mode, output_file_name if output_file_name == STDOUT_NAME else f"{output_file_name}-{program_name}") for output_mode, output_file_name in output_files]
+
+
+def assemble_stream(calculator_state):
+    # Assemble every program in the input stream, writing the outputs of each program as soon as it is assembled
+    # Yields (calculator state, output files) for each program written, and raises AssemblerError for the first program that fails
+    # calculator_state holds the initial settings and is used for the first program, later programs start from the same settings
+    # If errors are reported as diagnostics, they are added to calculator_state.diagnostics instead of being raised.
+    # Programs with errors are not written, and with all_errors the programs after them are still assembled
+    initial_settings = (calculator_state.sign_mode, calculator_state.word_size, calculator_state.base_numeric)
+    input_file_name = calculator_state.input_file_name
+    if input_file_name == STDIN_NAME:
+        first_name = "stdin"
+    else:
+        first_name = os.path.splitext(os.path.basename(input_file_name))[0]
+
+    program_state = calculator_state
+    for program_name, program_lines, started_by_directive in split_programs(read_source_lines(input_file_name), first_name):
+        if program_state is None:
+            program_state = CalculatorState(*initial_settings)
+            program_state.check_initial_settings() # The warnings were already reported for the first program
+            program_state.memory_trace = [] if calculator_state.memory_trace is not None else None
+            program_state.profiler = calculator_state.profiler # One profile for the whole stream
+            program_state.optimize = calculator_state.optimize
+        program_state.input_file_name = f"{program_name}.jov" if started_by_directive or input_file_name == STDIN_NAME else input_file_name
+
+        if calculator_state.diagnostics is None:
+            parse_lines(program_lines, program_state)
+        else:
+            program_diagnostics = []
+            try:
+                parse_lines(program_lines, program_state, program_diagnostics if calculator_state.all_errors else None)
+            except AssemblerError as error:
+                program_diagnostics.append(diagnostic_from_error(error, program_state.input_file_name))
+            calculator_state.diagnostics.extend(program_diagnostics)
+            if has_errors(program_diagnostics):
+                if not calculator_state.all_errors:
+                    return
+                program_state = None
+                continue
+
+        output_files = program_output_files(calculator_state.output_files, program_name, started_by_directive)
+        output_all(program_state, output_files)
+        yield program_state, output_files
+        program_state = None
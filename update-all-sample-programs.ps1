@@ -1,43 +1,18 @@
 # Save the current location
 $originalLocation = Get-Location
 
-# Navigate to the '/tests/Jovial Assembler (.jov)' folder
-$sourceFolder = "./tests/Jovial Assembler (.jov)"
-Set-Location -Path $sourceFolder
+# Navigate to the '/tests' folder
+Set-Location -Path "./tests"
 
-# Define the target folders with relative paths
-$targetFolderTXT = "../HP16C Emulator (.txt)"
-$targetFolder16C = "../JRPN Simulator (.16c)"
-$targetFolderPDF = "../Keystroke Programming (.pdf)"
+# Assemble every .jov file in one batch run
+# Each target is written into its own folder: 'JRPN Simulator (.16c)', 'HP16C Emulator (.txt)', and 'Keystroke Programming (.pdf)'
+jovial -i "./Jovial Assembler (.jov)" -o "." -t "16c,txt,pdf" -d WARNING
 
-# Ensure target folders exist
-$folders = @($targetFolderTXT, $targetFolder16C, $targetFolderPDF)
-foreach ($folder in $folders) {
-    if (-not (Test-Path -Path $folder)) {
-        New-Item -ItemType Directory -Path $folder
-    }
-}
+# The optimizer samples are assembled with -O, in 2's complement with 16-bit words so the literals can be shortened
+jovial -O -s 2 -w 16 -i "./Jovial Assembler -O (.jov)" -o "." -t "16c,txt,pdf" -d WARNING
 
-# Process each .jov file in the source folder
-Get-ChildItem -Path "." -Filter *.jov | ForEach-Object {
-    $file = $_.Name
-    $baseName = [System.IO.Path]::GetFileNameWithoutExtension($file)
-    
-    # Define the output file paths
-    $output16C = "$baseName.16c"
-    $outputTXT = "$baseName.txt"
-    $outputPDF = "$baseName.pdf"
-
-    # Run the commands to generate the files
-    jovial -i $file -o $output16C -d WARNING
-    jovial -i $file -o $outputTXT -d WARNING
-    jovial -i $file -o $outputPDF -d WARNING
-
-    # Move the files to their respective folders (replacing if they already exist)
-    Move-Item -Path $output16C -Destination "$targetFolder16C/$output16C" -Force
-    Move-Item -Path $outputTXT -Destination "$targetFolderTXT/$outputTXT" -Force
-    Move-Item -Path $outputPDF -Destination "$targetFolderPDF/$outputPDF" -Force
-}
+# The linker samples are linked into one program
+jovial --link -i "./Jovial Assembler --link (.jov)/main.jov" "./Jovial Assembler --link (.jov)/library.jov" -o "./JRPN Simulator (.16c)/linked-program.16c" "./HP16C Emulator (.txt)/linked-program.txt" "./Keystroke Programming (.pdf)/linked-program.pdf" -d WARNING
 
 # Navigate back to the original location
 Set-Location -Path $originalLocation